@@ -1,7 +1,5 @@
-import asyncio, json, os, sys, sqlite3, aiosqlite
+import asyncio, json, os, sys
 from datetime import datetime
-from telethon import TelegramClient, events
-from telethon.errors import SessionPasswordNeededError, PhoneCodeExpiredError, PhoneCodeInvalidError
 
 # مسیرها
 current_dir = os.path.dirname(__file__)
@@ -10,8 +8,23 @@ main_path = os.path.join(root_dir, 'main')
 if main_path not in sys.path:
     sys.path.insert(0, main_path)
 
+# زمان import هر کتابخانه تا پایان راه‌اندازی ثبت می‌شه
+from lazy import import_report, start_import_timing, stop_import_timing
+start_import_timing()
+
+from telethon import TelegramClient
+from telethon.errors import SessionPasswordNeededError, PhoneCodeExpiredError, PhoneCodeInvalidError
+
 # ابزارها و هندلرها (بعد از init DB importمی‌شن تا DB آماده باشه)
-from utils import load_json, is_command_message  # Import utils برای چک command
+from database import close_databases, open_session_db
+from metrics import close_metrics, get_metrics, instrument_client, start_process_metrics, start_session_dump
+from cache import DisplayNameCache
+from delete_queue import get_deletion_queue
+from dispatcher import get_dispatcher
+from plugins import setup_plugins
+from rpc import install_rpc_scheduler
+from scheduler import close_scheduler, forget_session, get_scheduler, resume_scheduler
+from utils import load_json
 
 # ذخیره credentials
 async def save_credentials(credentials, filename):
@@ -19,8 +32,8 @@ async def save_credentials(credentials, filename):
         json.dump(credentials, f, indent=2)
 
 # لاگ لاگین موفق
-def log_login_success(session_name):
-    with open('login_log.txt', 'a') as f:
+def log_login_success(session_name, log_dir='.'):
+    with open(os.path.join(log_dir, 'login_log.txt'), 'a') as f:
         f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - لاگین موفق برای {session_name}\n")
     print("✅ لاگینلاگ شد.")
 
@@ -33,164 +46,110 @@ def fix_permissions(dir_path):
             os.chmod(os.path.join(root, f), 0o666)
     print(f"Permissions fixed for {dir_path}.")
 
-# مقداردهی اولیه دیتابیس SQLite (sync) with WAL mode for concurrency
-def init_sqlite_db(db_path):
-    # Fix permissions forDB file and directory
-    user_dir = os.path.dirname(db_path)
-    fix_permissions(user_dir)
-    if os.path.exists(db_path):
-        os.chmod(db_path, 0o666)
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    # Enable WAL mode for concurrentaccess (prevents lock)
-    cursor.execute("PRAGMA journal_mode=WAL;")
-    cursor.execute('''
-                   CREATE TABLE IF NOT EXISTS settings (
-                                                           id INTEGER PRIMARY KEY,
-                                                           lang TEXT DEFAULT 'fa',
-                                                           welcome_enabled BOOLEAN DEFAULT 0,
-                                                           welcome_text TEXT DEFAULT '',
-                                                           welcome_delete_time INTEGER DEFAULT 0,
-                                                           clock_enabled BOOLEAN DEFAULT 0,
-                                                           clock_location TEXT DEFAULT 'name',
-                                                           clock_bio_text TEXT DEFAULT '',
-                                                           clock_fonts TEXT DEFAULT '[1]',
-                                                           clock_timezone TEXT DEFAULT 'Asia/Tehran',
-                                                           action_enabled BOOLEAN DEFAULT 0,
-                                                           action_types TEXT DEFAULT '{}',
-                                                           text_format_enabled BOOLEAN DEFAULT 0,
-                                                           text_formats TEXT DEFAULT '{}',
-                                                           locks TEXT DEFAULT '{}',
-                                                           antilog_enabled BOOLEAN DEFAULT 0,
-                                                           first_comment_enabled BOOLEAN DEFAULT 0,
-                                                           first_comment_text TEXT DEFAULT ''
-                   )
-                   ''')
-    # بررسی وجود رکورد با id=1
-    cursor.execute('SELECT id FROM settings WHERE id = 1')
-    if cursor.fetchone() is None:
-        cursor.execute('INSERT INTO settings (id) VALUES (1)')
-    conn.commit()
-    conn.close()  # Ensure closed
-    os.chmod(db_path, 0o666)  # Ensure writable
-    print("✅ دیتابیس SQLite مقداردهی شد (WAL mode enabled).")
-
-# تابع اصلی
-async def main():
-    # Fix: absolute path for credentials
-    credentials_file = os.path.join(os.path.dirname(__file__), 'credentials.json')
+# خواندن credentials
+def load_credentials(credentials_file):
     if not os.path.exists(credentials_file):
         print(f"❌ credentials.json یافت نشد در {credentials_file}")
-        return
-
+        return None
     try:
         with open(credentials_file, 'r') as f:
-            credentials = json.load(f)
+            return json.load(f)
     except json.JSONDecodeError as e:
         print(f"❌ خطا در خواندنcredentials.json: {e}")
-        return
+        return None
 
-    api_id = credentials.get('api_id')
-    api_hash = credentials.get('api_hash')
+# پاک کردن فایل session
+def remove_session_file(session_path):
+    session_file = f"{session_path}.session"
+    if os.path.exists(session_file):
+        os.remove(session_file)
+
+# ارسال کد جدید و ذخیره phone_code_hash
+async def request_new_code(client, credentials, credentials_file):
+    try:
+        result = await client.send_code_request(credentials.get("phone"))
+        credentials['phone_code_hash'] = result.phone_code_hash
+        credentials['code'] = None  # reset code
+        await save_credentials(credentials, credentials_file)
+        print("✅کد جدید ارسال شد. ربات restart می‌شود.")
+    except Exception as e:
+        print(f"خطا در ارسال کد جدید: {e}")
+    finally:
+        await client.disconnect()
+
+# لاگین سشن؛ True یعنی اکانت آماده اجراست
+async def login(client, credentials, credentials_file, session_path):
     session_name = credentials.get('session_name')
-    owner_id = credentials.get('owner_id')
     phone = credentials.get("phone")
     code = credentials.get("code")
     phone_code_hash = credentials.get("phone_code_hash")
-
-    if not phone:
-        print("⚠️ شماره تلفن در credentials.json پیدا نشد.")
-        return
-
-    if not api_id or not api_hash:
-        print("❌ api_id یا api_hash در credentials.json موجودنیست.")
-        return
-
-    db_path = os.path.join(os.path.dirname(__file__), f'selfbot_{session_name}.db')  # Absolute for DB
-    print(f"🔌 اتصال به دیتابیس: {db_path}")
-    init_sqlite_db(db_path)
-    print("✅ دیتابیس SQLite مقداردهی شد (WAL mode enabled).")
-
-    client = TelegramClient(session_name, api_id, api_hash)
+    log_dir = os.path.dirname(credentials_file)
 
     try:
         await client.connect()
-        if not await client.is_user_authorized():
-            if code and phone_code_hash:
-                try:
-                    await client.sign_in(phone=phone, code=code, phone_code_hash=phone_code_hash)
-                    print("✅ لاگین موفق.")
-                    credentials['code'] = None
-                    credentials['phone_code_hash'] = None
-                    await save_credentials(credentials, credentials_file)
-                    log_login_success(session_name)  # لاگ لاگین
-                    # Fix readonly session file
-                    session_file = os.path.join(os.path.dirname(__file__), f"{session_name}.session")
-                    if os.path.exists(session_file):
-                        os.chmod(session_file, 0o666)
-                        print("Session file permissions fixed.")
-                except (PhoneCodeExpiredError, PhoneCodeInvalidError, SessionPasswordNeededError) as e:
-                    print(f"⚠️ خطا در کد/رمز: {e}. ارسال کد جدید...")
-                    # پاک کردن session
-                    session_file = os.path.join(os.path.dirname(__file__), f"{session_name}.session")
-                    if os.path.exists(session_file):
-                        os.remove(session_file)
-                    # ارسال کد جدید
-                    try:
-                        result = await client.send_code_request(phone)
-                        credentials['phone_code_hash'] = result.phone_code_hash
-                        credentials['code'] = None  # reset code
-                        await save_credentials(credentials, credentials_file)
-                        print("✅کد جدید ارسال شد. ربات restart می‌شود.")
-                        await client.disconnect()
-                        return
-                    except Exception as e:
-                        print(f"خطا در ارسال کد جدید: {e}")
-                        await client.disconnect()
-                        return
-                except Exception as e:
-                    print(f"خطا در لاگین: {e}.ارسال کد جدید...")
-                    # پاک کردن session
-                    session_file = os.path.join(os.path.dirname(__file__), f"{session_name}.session")
-                    if os.path.exists(session_file):
-                        os.remove(session_file)
-                    # ارسال کد جدید
-                    try:
-                        result = await client.send_code_request(phone)
-                        credentials['phone_code_hash'] = result.phone_code_hash
-                        credentials['code'] = None
-                        await save_credentials(credentials, credentials_file)
-                        print("✅ کد جدید ارسال شد. ربات restart می‌شود.")
-                        await client.disconnect()
-                        return
-                    except Exception as e:
-                        print(f"خطا در ارسال کد جدید: {e}")
-                        await client.disconnect()
-                        return
-            else:
-                print("⚠️ کد لاگین یا phone_code_hash در credentials.json وجود ندارد. ارسال کد...")
-                try:
-                    result = await client.send_code_request(phone)
-                    print("✅ کد SMS ارسال شد.")
-                    credentials['phone_code_hash']=result.phone_code_hash
-                    await save_credentials(credentials, credentials_file)
-                except Exception as e:
-                    print(f"خطا در ارسال کد: {e}")
-                finally:
-                    await client.disconnect()
-                return
-        else:
+        if await client.is_user_authorized():
             print("✅ اکانت قبلاً لاگینشده است.")
-            log_login_success(session_name)  # لاگ برای session موجود
+            log_login_success(session_name, log_dir)  # لاگ برای session موجود
+            return True
+
+        if not (code and phone_code_hash):
+            print("⚠️ کد لاگین یا phone_code_hash در credentials.json وجود ندارد. ارسال کد...")
+            try:
+                result = await client.send_code_request(phone)
+                print("✅ کد SMS ارسال شد.")
+                credentials['phone_code_hash'] = result.phone_code_hash
+                await save_credentials(credentials, credentials_file)
+            except Exception as e:
+                print(f"خطا در ارسال کد: {e}")
+            finally:
+                await client.disconnect()
+            return False
+
+        try:
+            await client.sign_in(phone=phone, code=code, phone_code_hash=phone_code_hash)
+            print("✅ لاگین موفق.")
+            credentials['code'] = None
+            credentials['phone_code_hash'] = None
+            await save_credentials(credentials, credentials_file)
+            log_login_success(session_name, log_dir)  # لاگ لاگین
+            # Fix readonly session file
+            session_file = f"{session_path}.session"
+            if os.path.exists(session_file):
+                os.chmod(session_file, 0o666)
+                print("Session file permissions fixed.")
+            return True
+        except (PhoneCodeExpiredError, PhoneCodeInvalidError, SessionPasswordNeededError) as e:
+            print(f"⚠️ خطا در کد/رمز: {e}. ارسال کد جدید...")
+        except Exception as e:
+            print(f"خطا در لاگین: {e}.ارسال کد جدید...")
+        remove_session_file(session_path)
+        await request_new_code(client, credentials, credentials_file)
+        return False
     except Exception as e:
         print(f"خطا در اتصال: {e}")
-        return
+        return False
 
-    me = await client.get_me()
+# ثبت هندلرهای یک سشن روی کلاینت لاگین‌شده
+async def setup_session(client, session_name, owner_id):
+    metrics = get_metrics(session_name)
+    with metrics.timer("startup_phase_seconds", phase="get_me"):
+        me = await client.get_me()
     print(f"🚀 سلف‌بات راه‌اندازی شد برای: {me.first_name}")
 
-    # تغییر 1: ارسال پیام به owner که self run شده
+    with metrics.timer("startup_phase_seconds", phase="notify_owner"):
+        await notify_owner(client, session_name, owner_id, me)
+
+    with metrics.timer("startup_phase_seconds", phase="handlers"):
+        await register_handlers(client, session_name, owner_id)
+
+    # حذف‌های زمان‌بندی‌شده‌ی اجرای قبلی از سر گرفته می‌شن
+    with metrics.timer("startup_phase_seconds", phase="deletions"):
+        await get_deletion_queue(client, session_name)
+
+    print(f"✅ سلف‌بات کاملاً راه‌اندازی شد ({session_name})")
+
+# تغییر 1: ارسال پیام به owner که self run شده
+async def notify_owner(client, session_name, owner_id, me):
     if owner_id:
         try:
             await client.send_message(owner_id, f"✅ سلف‌بات راه‌اندازی شد برای {me.first_name} (Session: {session_name})")
@@ -198,53 +157,145 @@ async def main():
         except Exception as e:
             print(f"⚠️ خطا در ارسال پیام به owner: {e}")
 
-    # اتصال async به دیتابیس
-    async with aiosqlite.connect(db_path) as db:
-        await db.commit()
-
-    # import modules بعد از init DB
-    # from modules.profile import register_profile_handlers
-    # from modules.settings import setup_settings
-    # from modules.manage import register_manage_handlers
-    # from modules.group import register_group_handlers
-    # from modules.convert import register_convert_handlers
-    # from modules.download import register_download_handlers
-    # from modules.edit import register_edit_handlers
-    # from modules.enemy import register_enemy_handlers
-    # from modules.fresponse import register_fast_response_handlers
-    # from modules.fun import register_fun_handlers
-    # from modules.private import register_private_handlers
-    # from modules.vars import register_vars_handlers
-
-    # ثبت هندلرها
-    # await register_profile_handlers(client, session_name, owner_id)
-    # await setup_settings(client, db_path)
-    # await register_manage_handlers(client, session_name, owner_id)
-    # await register_group_handlers(client, session_name, owner_id)
-    # await register_vars_handlers(client, session_name, owner_id)
-    # await register_private_handlers(client, session_name, owner_id)
-    # await register_fun_handlers(client, session_name, owner_id)
-    # await register_fast_response_handlers(client, session_name, owner_id)
-    # await register_enemy_handlers(client, session_name, owner_id)
-    # await register_edit_handlers(client, session_name, owner_id)
-    # await register_download_handlers(client, session_name, owner_id)
-    # await register_convert_handlers(client, session_name, owner_id)
-
-    # تغییر 2: Handler برای print هر پیام incoming (بدون تداخل با commands)
-    @client.on(events.NewMessage(incoming=True))
+# ثبت هندلرهای ماژول‌ها
+async def register_handlers(client, session_name, owner_id):
+    # ماژول‌ها با اولین دستور مربوطشون بارگذاری می‌شن (plugins.py)
+    client._plugins = await setup_plugins(client, session_name, owner_id)
+
+    # نام فرستنده‌ها از حافظه؛ برای لاگ هیچ درخواستی به تلگرام نمی‌ره
+    names = DisplayNameCache()
+
+    # تغییر 2: Handler برای print هر پیام incoming
+    # (دستورات فقط از owner میان، پس اینجا چک command لازم نیست)
+    @get_dispatcher(client).hook(outgoing=False)
     async def log_incoming_messages(event):
         text = event.message.text
         if text:  # فقط اگر متن داشته باشه
-            # Skip اگر command باشه (از utils)
-            commands = load_json("cmd.json")
-            lang = "fa"  # یا از settings بگیر
-            if await is_command_message(text, lang, commands):
-                return  # Skip commands برای جلوگیری از تداخل
             # Print پیام (chat_id, sender, text)
-            sender = await event.get_sender()
-            print(f"📨 Incoming [{event.chat_id} from {sender.first_name if sender else 'Unknown'}]: {text}")
+            print(f"📨 Incoming [{event.chat_id} from {names.get(event)}]: {text}")
+
+# راه‌اندازی یک سشن از پوشه‌اش (credentials.json، فایل session و دیتابیس)
+# خروجی: کلاینت آماده اجرا یا None
+async def start_session(session_dir):
+    session_dir = os.path.abspath(session_dir)
+    credentials_file = os.path.join(session_dir, 'credentials.json')
+    credentials = load_credentials(credentials_file)
+    if credentials is None:
+        return None
+
+    api_id = credentials.get('api_id')
+    api_hash = credentials.get('api_hash')
+    session_name = credentials.get('session_name')
+    owner_id = credentials.get('owner_id')
+
+    if not credentials.get("phone"):
+        print("⚠️ شماره تلفن در credentials.json پیدا نشد.")
+        return None
+
+    if not api_id or not api_hash:
+        print("❌ api_id یا api_hash در credentials.json موجودنیست.")
+        return None
+
+    # متریک‌ها: زمان هر مرحله، هندلرها و درخواست‌های RPC
+    config = load_json("config.json", {})
+    metrics = get_metrics(session_name)
+    await start_process_metrics(config.get("metrics_port", 0))
+    if config.get("metrics_dump_interval"):
+        start_session_dump(
+            metrics, os.path.join(session_dir, f"metrics_{session_name}.prom"), config["metrics_dump_interval"]
+        )
+
+    db_path = os.path.join(session_dir, f'selfbot_{session_name}.db')  # Absolute for DB
+    print(f"🔌 اتصال به دیتابیس: {db_path}")
+    with metrics.timer("startup_phase_seconds", phase="fix_permissions"):
+        fix_permissions(session_dir)
+    # دیتابیس سشن (WAL)؛ یک اتصال ثابت تا پایان اجرا
+    with metrics.timer("startup_phase_seconds", phase="database"):
+        await open_session_db(session_name, db_path)
+    os.chmod(db_path, 0o666)  # Ensure writable
+    print("✅ دیتابیس SQLite مقداردهی شد (WAL mode enabled).")
+
+    # مسیر مطلق تا چند سشن در یک پروسه با هم تداخل نکنن
+    session_path = os.path.join(session_dir, session_name)
+    client = instrument_client(TelegramClient(session_path, api_id, api_hash), metrics)
+    # همه درخواست‌ها از زمان‌بند RPC رد می‌شن (بودجه، FloodWait، اولویت owner)
+    install_rpc_scheduler(client, owner_id, metrics)
+    with metrics.timer("startup_phase_seconds", phase="login"):
+        logged_in = await login(client, credentials, credentials_file, session_path)
+    if not logged_in:
+        return None
+
+    await setup_session(client, session_name, owner_id)
+    return client
+
+# ذخیره تنظیمات در صف و بستن دیتابیس‌ها (یک بار برای کل پروسه)
+async def shutdown_sessions():
+    # نوشتن تغییرات تنظیمات که هنوز در صف هستن
+    try:
+        from settings_store import close_settings_stores
+
+        await close_settings_stores()
+    except Exception as e:
+        print(f"❌ خطا در ذخیره تنظیمات: {e}")
+    try:
+        await close_databases()
+    except Exception as e:
+        print(f"❌ خطا در بستن دیتابیس: {e}")
+    try:
+        from translator import close_translation_service
+
+        await close_translation_service()
+    except Exception as e:
+        print(f"❌ خطا در ذخیره کش ترجمه: {e}")
+    try:
+        from clock import close_clock_ticker
+
+        await close_clock_ticker()
+    except Exception as e:
+        print(f"❌ خطا در توقف ساعت: {e}")
+    try:
+        await close_scheduler()
+    except Exception as e:
+        print(f"❌ خطا در توقف زمان‌بند: {e}")
+    try:
+        await close_metrics()
+    except Exception as e:
+        print(f"❌ خطا در ذخیره متریک‌ها: {e}")
+
+# قطع اتصال کلاینت
+async def disconnect_client(client):
+    plugins = getattr(client, "_plugins", None)
+    if plugins is not None:
+        await plugins.close()
+        forget_session(plugins.session_name)
+    deletions = getattr(client, "_deletion_queue", None)
+    if deletions is not None:
+        await deletions.close()
+    try:
+        await client.disconnect()
+        print("🔌 اتصال سلف‌بات قطع شد")
+    except Exception as e:
+        print(f"❌ خطا در قطع اتصال: {e}")
+
+# گزارش هزینه import ها بعد از راه‌اندازی
+def report_startup_imports():
+    stop_import_timing()
+    print(import_report())
+
+# تابع اصلی
+async def main():
+    # Fix: absolute path for credentials
+    session_dir = os.path.dirname(os.path.abspath(__file__))
+    # هر پروسه (یک کاربر) فایل کارهای زمان‌بندی‌شده‌ی خودش رو داره
+    get_scheduler(directory=session_dir)
+    client = await start_session(session_dir)
+    if client is None:
+        await shutdown_sessions()
+        return
+    # کارهای زمان‌بندی‌شده‌ی ذخیره‌شده بعد از بالا آمدن سشن اجرا می‌شن
+    resume_scheduler()
+    report_startup_imports()
 
-    print("✅ سلف‌بات کاملاً راه‌اندازی شد")
     try:
         await client.run_until_disconnected()
         print("🛑 سلف‌بات به صورت طبیعی متوقف شد")
@@ -255,11 +306,9 @@ async def main():
         import traceback
         traceback.print_exc()
     finally:
-        try:
-            await client.disconnect()
-            print("🔌 اتصال سلف‌بات قطع شد")
-        except Exception as e:
-            print(f"❌ خطا در قطع اتصال: {e}")
+        # پلاگین‌ها و صف حذف قبل از بستن دیتابیس‌ها بسته می‌شن
+        await disconnect_client(client)
+        await shutdown_sessions()
 
 # اجرای برنامه
 if __name__ == '__main__':
@@ -268,4 +317,4 @@ if __name__ == '__main__':
     except Exception as e:
         print(f"❌ خطا در اجرای برنامه اصلی: {e}")
         import traceback
-        traceback.print_exc() 
\ No newline at end of file
+        traceback.print_exc()
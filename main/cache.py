@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+
+from telethon.utils import get_display_name
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry.
+
+    With ``ttl`` set, entries older than ``ttl`` seconds since their last
+    write are treated as missing and dropped on access or by evict_expired().
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, self._MISSING) is not self._MISSING
+
+    def get(self, key, default=None):
+        item = self._data.get(key, self._MISSING)
+        if item is self._MISSING:
+            return default
+        value, stored_at = item
+        if self.ttl is not None and self._clock() - stored_at > self.ttl:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, self._clock())
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, self._MISSING)
+        return default if item is self._MISSING else item[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def items(self):
+        return [(key, value) for key, (value, _) in self._data.items()]
+
+    def evict_expired(self):
+        """Drop expired entries; returns how many were removed"""
+        if self.ttl is None:
+            return 0
+        deadline = self._clock() - self.ttl
+        expired = [key for key, (_, stored_at) in self._data.items() if stored_at < deadline]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+
+class DisplayNameCache:
+    """
+    Display names of message senders, from memory only. A name is learned
+    from the sender entity Telegram sends along with the update
+    (``event.sender``); when it isn't there the id is used instead, so
+    looking a name up never costs an RPC.
+    """
+
+    def __init__(self, maxsize=4096, ttl=3600):
+        # names change now and then, so they are learned again after ttl
+        self._names = LRUCache(maxsize, ttl=ttl)
+
+    def get(self, event):
+        sender_id = event.sender_id
+        name = self._names.get(sender_id)
+        if name is None:
+            sender = event.sender
+            if sender is None:
+                return str(sender_id) if sender_id is not None else "Unknown"
+            name = get_display_name(sender) or str(sender_id)
+            self._names.set(sender_id, name)
+        return name
+
+    def forget(self, sender_id):
+        self._names.pop(sender_id)
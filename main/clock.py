@@ -0,0 +1,143 @@
+"""
+Profile clock: the current time drawn in the configured digit fonts.
+
+Every font is a str.maketrans() table built once at import, so drawing
+the time in a font is one str.translate(). The text of a (timezone, font)
+pair is computed once per minute and shared by every session using it.
+
+ClockTicker is the one timer of the process: it calls its subscribers
+(each session's ProfileScheduler) right after every minute boundary,
+instead of every account running its own sleep loop.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+DIGITS = "0123456789"
+
+# شماره فونت -> ارقام (clock_fonts در تنظیمات لیستی از این شماره‌هاست)
+FONTS = {
+    1: DIGITS,
+    2: "𝟎𝟏𝟐𝟑𝟒𝟓𝟔𝟕𝟖𝟗",
+    3: "𝟘𝟙𝟚𝟛𝟜𝟝𝟞𝟟𝟠𝟡",
+    4: "０１２３４５６７８９",
+    5: "⓪①②③④⑤⑥⑦⑧⑨",
+    6: "𝟢𝟣𝟤𝟥𝟦𝟧𝟨𝟩𝟪𝟫",
+    7: "𝟬𝟭𝟮𝟯𝟰𝟱𝟲𝟳𝟴𝟵",
+    8: "𝟶𝟷𝟸𝟹𝟺𝟻𝟼𝟽𝟾𝟿",
+    9: "۰۱۲۳۴۵۶۷۸۹",
+    10: "⁰¹²³⁴⁵⁶⁷⁸⁹",
+    11: "₀₁₂₃₄₅₆₇₈₉",
+}
+
+FONT_TABLES = {font: str.maketrans(DIGITS, digits) for font, digits in FONTS.items()}
+
+CLOCK_FORMAT = "%H:%M"
+
+
+def apply_font(text, font):
+    """text with its digits drawn in font (unknown fonts leave it as is)"""
+    table = FONT_TABLES.get(font)
+    return text.translate(table) if table else text
+
+
+_minute = None
+_rendered = {}
+
+
+def clock_text(timezone, font=1, now=None):
+    """
+    The time in timezone drawn in font. Without ``now`` the text is cached
+    for the current minute, per (timezone, font).
+    """
+    if now is not None:
+        return apply_font(now.strftime(CLOCK_FORMAT), font)
+    global _minute
+    minute = int(time.time() // 60)
+    if minute != _minute:
+        _minute = minute
+        _rendered.clear()
+    key = (timezone, font)
+    text = _rendered.get(key)
+    if text is None:
+        plain = _rendered.get((timezone, 1))
+        if plain is None:
+            plain = _rendered[(timezone, 1)] = datetime.now(pytz.timezone(timezone)).strftime(CLOCK_FORMAT)
+        text = _rendered[key] = apply_font(plain, font)
+    return text
+
+
+class ClockTicker:
+    """Calls every subscriber just after each ``interval`` boundary"""
+
+    # ticks land this long after the boundary, so the new minute has begun
+    MARGIN = 0.05
+
+    def __init__(self, interval=60, clock=time.time):
+        self.interval = interval
+        self._clock = clock
+        self._subscribers = []
+        self._task = None
+
+    def seconds_to_next_tick(self):
+        return self.interval - self._clock() % self.interval + self.MARGIN
+
+    def subscribe(self, callback):
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+        self.start()
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def fire(self):
+        for callback in list(self._subscribers):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in clock subscriber: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.seconds_to_next_tick())
+            self.fire()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_ticker = None
+
+
+def get_clock_ticker():
+    """The ticker of the process (interval from config.json's clock_update_interval)"""
+    global _ticker
+    if _ticker is None:
+        from utils import load_json
+
+        _ticker = ClockTicker(load_json("config.json", {}).get("clock_update_interval", 60))
+    return _ticker
+
+
+async def close_clock_ticker():
+    global _ticker
+    if _ticker is not None:
+        await _ticker.close()
+        _ticker = None
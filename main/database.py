@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+
+from ormax import Database
+from ormax_models import ModelSet, setup_schema
+
+logger = logging.getLogger(__name__)
+
+# Applied on top of ormax's defaults (foreign_keys, WAL, synchronous=NORMAL)
+SQLITE_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+)
+
+
+def default_db_path(session_name):
+    """Absolute path of a session's database file (next to Self.py)"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), f"selfbot_{session_name}.db")
+
+
+class SessionDatabase:
+    """
+    The database of one session: its own SQLite file and one long-lived
+    connection, opened once and shared by every module of that session.
+
+    The connection lives for the whole run, so sqlite3's statement cache
+    reuses prepared statements across calls. ormax serializes every
+    operation on a connection behind a lock, giving a single reader/writer
+    per file; sessions never share a file, so they don't contend.
+    """
+
+    def __init__(self, session_name, path=None):
+        self.session_name = session_name
+        self.path = os.path.abspath(path or default_db_path(session_name))
+        self.db = Database(f"sqlite:///{self.path}")
+        self.models = None
+
+    @property
+    def connected(self):
+        return self.models is not None
+
+    async def connect(self):
+        if self.connected:
+            return self
+        db_dir = os.path.dirname(self.path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, mode=0o755, exist_ok=True)
+        await self.db.connect()
+        for pragma in SQLITE_PRAGMAS:
+            await self.db.execute(pragma)
+        models = ModelSet(self.db)
+        await setup_schema(models)
+        self.models = models
+        logger.info(f"Database of {self.session_name} opened at {self.path}")
+        return self
+
+    async def execute(self, query, params=None):
+        return await self.db.execute(query, params)
+
+    async def fetch_one(self, query, params=None):
+        return await self.db.fetch_one(query, params)
+
+    async def fetch_all(self, query, params=None):
+        return await self.db.fetch_all(query, params)
+
+    def transaction(self):
+        return self.db.transaction()
+
+    async def close(self):
+        if not self.connected:
+            return
+        self.models = None
+        await self.db.disconnect()
+        logger.info(f"Database of {self.session_name} closed")
+
+
+_databases = {}
+_databases_lock = asyncio.Lock()
+
+
+async def open_session_db(session_name, path=None):
+    """Open (once) and return the database of a session"""
+    database = _databases.get(session_name)
+    if database is not None:
+        return database
+    async with _databases_lock:
+        database = _databases.get(session_name)
+        if database is None:
+            database = await SessionDatabase(session_name, path).connect()
+            _databases[session_name] = database
+    return database
+
+
+def get_session_db(session_name):
+    """The already opened database of a session, or None"""
+    return _databases.get(session_name)
+
+
+async def close_databases():
+    """Close every session database (call on shutdown, after flushing)"""
+    while _databases:
+        _, database = _databases.popitem()
+        try:
+            await database.close()
+        except Exception as e:
+            logger.error(f"Error closing database of {database.session_name}: {e}")
@@ -0,0 +1,190 @@
+"""
+Delayed deletion of messages (welcome messages, temporary replies).
+
+A session has one DeletionQueue instead of a sleeping task per message:
+a min-heap of (due, chat_id, message_id), mirrored in the
+pending_deletions table so deletions survive a restart (the queue is
+loaded when the session starts). One timer on the process's TimerWheel
+(scheduler.py) is set for the tick of the earliest due message; then
+everything due is deleted, one DeleteMessagesRequest per chat (up to 100
+ids each), so a burst of welcomes in a busy group costs a few RPCs
+instead of one per message.
+
+    queue = await get_deletion_queue(client, session_name)
+    await queue.schedule(chat_id, [message.id], delay=30)
+"""
+import asyncio
+import heapq
+import logging
+import math
+import time
+from collections import defaultdict
+
+from database import get_session_db
+from ormax_models import add_pending_deletions, delete_pending_deletions, load_pending_deletions
+from rpc import BACKGROUND, rpc_priority
+from scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# ids per DeleteMessagesRequest (Telegram's maximum)
+DELETE_BATCH = 100
+
+
+class DeletionQueue:
+    """
+    Deletes queued messages when they are due. Due times are rounded up to
+    a ``tick``, so messages due close together are deleted together.
+    Without a ``wheel`` nothing is deleted until flush() is called.
+    """
+
+    def __init__(self, client, database=None, wheel=None, tick=1.0, clock=time.time, metrics=None):
+        self.client = client
+        self.database = database
+        self.wheel = wheel
+        self.tick = tick
+        self.metrics = metrics
+        self._clock = clock
+        self._heap = []
+        # (chat_id, message_id) -> due; heap entries not matching it are stale
+        self._due = {}
+        self._timer = None
+        self._wake_at = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._due)
+
+    def _push(self, due, chat_id, message_id):
+        self._due[(chat_id, message_id)] = due
+        heapq.heappush(self._heap, (due, chat_id, message_id))
+
+    async def load(self):
+        """Queue the deletions stored by a previous run"""
+        for due, chat_id, message_id in await load_pending_deletions(self.database):
+            self._push(due, chat_id, message_id)
+        if self._heap:
+            logger.info(f"Resumed {len(self._due)} pending deletions")
+        return self
+
+    async def schedule(self, chat_id, message_ids, delay):
+        """Delete message_ids of chat_id in ``delay`` seconds"""
+        due = math.ceil(self._clock() + delay)
+        rows = [(due, chat_id, message_id) for message_id in message_ids]
+        if not rows:
+            return
+        await add_pending_deletions(rows, database=self.database)
+        for row in rows:
+            self._push(*row)
+        self._arm()
+
+    async def cancel(self, chat_id, message_ids):
+        """Keep message_ids after all"""
+        message_ids = [message_id for message_id in message_ids if self._due.pop((chat_id, message_id), None)]
+        if message_ids:
+            await delete_pending_deletions(chat_id, message_ids, database=self.database)
+
+    def next_due(self):
+        """Due time of the earliest queued message, or None"""
+        while self._heap:
+            due, chat_id, message_id = self._heap[0]
+            if self._due.get((chat_id, message_id)) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now=None):
+        """Remove and return {chat_id: [message_id, ...]} of everything due"""
+        if now is None:
+            now = self._clock()
+        chats = defaultdict(list)
+        while True:
+            due = self.next_due()
+            if due is None or due > now:
+                break
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            del self._due[(chat_id, message_id)]
+            chats[chat_id].append(message_id)
+        return chats
+
+    async def flush(self, now=None):
+        """Delete everything due; returns the number of messages"""
+        count = 0
+        for chat_id, message_ids in self.pop_due(now).items():
+            for start in range(0, len(message_ids), DELETE_BATCH):
+                batch = message_ids[start:start + DELETE_BATCH]
+                try:
+                    await self.client.delete_messages(chat_id, batch, revoke=True)
+                    if self.metrics is not None:
+                        self.metrics.inc("queued_deletions", len(batch))
+                        self.metrics.inc("queued_deletion_requests")
+                except Exception as e:
+                    # gone already or no longer allowed; retrying won't help
+                    logger.error(f"Error deleting queued messages in {chat_id}: {e}")
+            await delete_pending_deletions(chat_id, message_ids, database=self.database)
+            count += len(message_ids)
+        return count
+
+    def _arm(self):
+        """Set the wheel timer for the tick of the earliest due message"""
+        due = self.next_due()
+        if due is None or self.wheel is None:
+            return
+        wake_at = math.ceil(due / self.tick) * self.tick
+        if self._timer is not None:
+            if self._wake_at <= wake_at:
+                return
+            self._timer.cancel()
+        self._wake_at = wake_at
+        self._timer = self.wheel.call_later(max(0.0, wake_at - self._clock()), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        # a flush still running re-arms when it's done
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush_due())
+
+    async def _flush_due(self):
+        # deletions yield to command replies
+        rpc_priority.set(BACKGROUND)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error in deletion queue: {e}")
+        self._arm()
+
+    def start(self):
+        self._arm()
+        return self
+
+    async def close(self):
+        # queued deletions stay in the table for the next run
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def get_deletion_queue(client, session_name):
+    """
+    The session's queue, loaded from its database and started on first use
+    (at session start, so deletions stored by the last run are resumed)
+    """
+    queue = getattr(client, "_deletion_queue", None)
+    if queue is None:
+        database = get_session_db(session_name)
+        if database is None:
+            raise RuntimeError(f"Session database of {session_name} is not open")
+        queue = DeletionQueue(
+            client, database, wheel=get_scheduler().start().wheel, metrics=getattr(client, "_metrics", None)
+        )
+        client._deletion_queue = queue
+        await queue.load()
+        queue.start()
+    return queue
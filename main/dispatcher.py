@@ -0,0 +1,149 @@
+"""
+One NewMessage handler per client.
+
+Instead of every module adding its own ``events.NewMessage(pattern=...)``
+handler — each one's pattern tested against every message — the modules
+register with the client's Dispatcher:
+
+    dispatcher = get_dispatcher(client)
+
+    @dispatcher.command("name_toggle")      # cmd.json key
+    async def toggle_name(event): ...
+
+    @dispatcher.hook(outgoing=False, private=True, feature="antispam_enabled")
+    async def check_spam(event): ...
+
+A message is classified once. Messages from the owner (or outgoing ones)
+go through the CommandRouter, which only tries the patterns sharing the
+message's first word, and a command is routed with a dict lookup
+(``event.pattern_match`` is set as Telethon would). Other people's
+messages never reach the router: commands are owner-only. Everything
+else goes to the hooks of its direction, whose cheap prefilters (chat
+type, a settings flag) are checked before they are called; with no hook
+for incoming messages, other people's messages cost one comparison.
+
+Commands whose module isn't loaded yet are handed to the plugin registry
+(see plugins.py), which loads it on the spot.
+"""
+import logging
+
+from metrics import instrument_handler
+from router import get_command_router
+from telethon import events
+
+logger = logging.getLogger(__name__)
+
+
+class Hook:
+    __slots__ = ("callback", "incoming", "outgoing", "private", "feature")
+
+    def __init__(self, callback, incoming=True, outgoing=True, private=None, feature=None):
+        self.callback = callback
+        # other people's messages / the owner's (and outgoing) ones
+        self.incoming = incoming
+        self.outgoing = outgoing
+        # True: private chats only, False: groups and channels only
+        self.private = private
+        # settings key that must be truthy
+        self.feature = feature
+
+    def accepts(self, event, settings):
+        if self.private is not None and event.is_private != self.private:
+            return False
+        return self.feature is None or bool(settings.get(self.feature))
+
+
+class Dispatcher:
+    def __init__(self, client, owner_id, settings, router=None):
+        self.client = client
+        self.owner_id = owner_id
+        self.settings = settings
+        self.router = router
+        self.registry = None
+        self._commands = {}
+        # hooks by direction, so a message only walks the hooks that want it
+        self._incoming_hooks = []
+        self._owner_hooks = []
+        self._metrics = getattr(client, "_metrics", None)
+
+    def _wrap(self, callback):
+        if self._metrics is not None:
+            return instrument_handler(callback, self._metrics)
+        return callback
+
+    def command(self, key):
+        """Decorator: handle the cmd.json command ``key``"""
+
+        def decorator(callback):
+            if key in self._commands:
+                logger.warning(f"Command {key} registered twice; the last handler wins")
+            self._commands[key] = self._wrap(callback)
+            return callback
+
+        return decorator
+
+    def hook(self, incoming=True, outgoing=True, private=None, feature=None):
+        """Decorator: called for messages that aren't commands"""
+
+        def decorator(callback):
+            hook = Hook(self._wrap(callback), incoming, outgoing, private, feature)
+            if incoming:
+                self._incoming_hooks.append(hook)
+            if outgoing:
+                self._owner_hooks.append(hook)
+            return callback
+
+        return decorator
+
+    async def _run(self, callback, event):
+        try:
+            await callback(event)
+        except events.StopPropagation:
+            raise
+        except Exception as e:
+            name = getattr(callback, "__name__", repr(callback))
+            logger.error(f"Error in handler {name}: {e}")
+
+    async def dispatch(self, event):
+        from_owner = event.out or (self.owner_id is not None and event.sender_id == self.owner_id)
+        if not from_owner:
+            for hook in self._incoming_hooks:
+                if hook.accepts(event, self.settings):
+                    await self._run(hook.callback, event)
+            return
+
+        text = event.raw_text
+        if text:
+            router = self.router or get_command_router()
+            command = router.match(text, self.settings.get("lang", "fa"))
+            if command is not None:
+                handler = self._commands.get(command.key)
+                if handler is None and self.registry is not None:
+                    await self.registry.load_command(command.key)
+                    handler = self._commands.get(command.key)
+                if handler is not None:
+                    event.pattern_match = command.match
+                    await self._run(handler, event)
+                return
+            if self.registry is not None:
+                await self.registry.load_matching(text)
+
+        for hook in self._owner_hooks:
+            if hook.accepts(event, self.settings):
+                await self._run(hook.callback, event)
+
+    def install(self):
+        self.client.add_event_handler(self.dispatch, events.NewMessage())
+        return self
+
+
+def install_dispatcher(client, owner_id, settings, router=None):
+    """Create the client's dispatcher and register its single handler"""
+    dispatcher = getattr(client, "_dispatcher", None)
+    if dispatcher is None:
+        dispatcher = client._dispatcher = Dispatcher(client, owner_id, settings, router).install()
+    return dispatcher
+
+
+def get_dispatcher(client):
+    return client._dispatcher
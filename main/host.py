@@ -0,0 +1,131 @@
+"""
+Multi-account host: runs many self-bot sessions in one process.
+
+Every users/<id>/ directory with a credentials.json is one session. All
+clients share a single asyncio loop (and one copy of every imported
+library); with --workers N the sessions are split into N shards, one
+process each.
+
+    python main/host.py --users-dir users --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import zlib
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from scheduler import get_scheduler, resume_scheduler
+from Self import disconnect_client, report_startup_imports, shutdown_sessions, start_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USERS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "users")
+
+# logins running at the same time while the host starts
+START_CONCURRENCY = 10
+
+
+def discover_sessions(users_dir):
+    """Session directories (containing credentials.json) under users_dir"""
+    if not os.path.isdir(users_dir):
+        return []
+    return [
+        os.path.join(users_dir, name)
+        for name in sorted(os.listdir(users_dir))
+        if os.path.isfile(os.path.join(users_dir, name, "credentials.json"))
+    ]
+
+
+def shard_sessions(session_dirs, shard_count, shard_index):
+    """
+    Sessions of one shard. Assignment hashes the directory name, so adding
+    a user doesn't move the existing ones to another worker.
+    """
+    if shard_count <= 1:
+        return list(session_dirs)
+    return [
+        path
+        for path in session_dirs
+        if zlib.crc32(os.path.basename(path).encode()) % shard_count == shard_index
+    ]
+
+
+async def run_sessions(session_dirs, start_concurrency=START_CONCURRENCY, shard=None):
+    """Start every session and run them until all are disconnected"""
+    semaphore = asyncio.Semaphore(start_concurrency)
+    # one job store per shard process
+    get_scheduler(shard=shard)
+
+    async def start(session_dir):
+        async with semaphore:
+            try:
+                return await start_session(session_dir)
+            except Exception as e:
+                logger.error(f"Error starting session in {session_dir}: {e}")
+                return None
+
+    clients = [client for client in await asyncio.gather(*map(start, session_dirs)) if client]
+    logger.info(f"{len(clients)} of {len(session_dirs)} sessions running")
+    # stored jobs wait until their sessions have registered their handlers
+    resume_scheduler()
+    report_startup_imports()
+    try:
+        if clients:
+            # one session going down doesn't stop the others
+            results = await asyncio.gather(
+                *(client.run_until_disconnected() for client in clients),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Session stopped with error: {result}")
+    finally:
+        # plugins and deletion queues write to the databases while closing
+        await asyncio.gather(*(disconnect_client(client) for client in clients))
+        await shutdown_sessions()
+
+
+def run_shard(users_dir, shard_count=1, shard_index=0):
+    session_dirs = shard_sessions(discover_sessions(users_dir), shard_count, shard_index)
+    if not session_dirs:
+        logger.warning(f"No sessions for shard {shard_index + 1}/{shard_count} in {users_dir}")
+        return
+    try:
+        asyncio.run(run_sessions(session_dirs, shard=shard_index if shard_count > 1 else None))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many self-bot sessions in one process")
+    parser.add_argument("--users-dir", default=DEFAULT_USERS_DIR)
+    parser.add_argument("--workers", type=int, default=1, help="number of shard processes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    users_dir = os.path.abspath(args.users_dir)
+    workers = max(1, args.workers)
+    if workers == 1:
+        run_shard(users_dir)
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_shard, args=(users_dir, workers, index), name=f"shard-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Lazy imports and a startup import-cost report.
+
+Heavy optional libraries (translation, media processing) are bound to
+LazyImport stand-ins and imported on first use, so sessions that never run
+those commands don't pay for them. start_import_timing() records how long
+every top-level import takes until stop_import_timing(); lazy imports are
+recorded when they happen. import_report() formats both.
+"""
+import builtins
+import importlib
+import importlib.util
+import logging
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# module name -> seconds spent importing it
+IMPORT_TIMES = {}
+LAZY_LOADED = set()
+
+_original_import = None
+_depth = 0
+
+
+def _record(name, seconds):
+    IMPORT_TIMES[name] = IMPORT_TIMES.get(name, 0.0) + seconds
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    global _depth
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        # nested imports are part of the outermost one's cost
+        if _depth == 0:
+            _record(name.partition(".")[0], time.perf_counter() - start)
+
+
+def start_import_timing():
+    """Record the cost of every new top-level import from now on"""
+    global _original_import
+    if _original_import is None:
+        _original_import = builtins.__import__
+        builtins.__import__ = _timed_import
+
+
+def stop_import_timing():
+    global _original_import
+    if _original_import is not None:
+        builtins.__import__ = _original_import
+        _original_import = None
+
+
+def import_report(limit=15):
+    """Most expensive imports so far, one per line"""
+    if not IMPORT_TIMES:
+        return "No imports recorded"
+    items = sorted(IMPORT_TIMES.items(), key=lambda item: item[1], reverse=True)
+    total = sum(IMPORT_TIMES.values())
+    lines = [f"Import time: {total * 1000:.1f} ms in {len(items)} modules"]
+    for name, seconds in items[:limit]:
+        suffix = " (lazy)" if name in LAZY_LOADED else ""
+        lines.append(f"  {seconds * 1000:8.1f} ms  {name}{suffix}")
+    return "\n".join(lines)
+
+
+def is_available(module):
+    """True if module can be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyImport:
+    """
+    Stand-in for a module, or one attribute of it, that is imported the
+    first time it is used (attribute access or call).
+    """
+
+    def __init__(self, module, attr=None):
+        self._module = module
+        self._attr = attr
+        self._target = None
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def load(self):
+        if self._target is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self._module)
+            elapsed = time.perf_counter() - start
+            if elapsed > 0.001:
+                name = self._module.partition(".")[0]
+                _record(name, elapsed)
+                LAZY_LOADED.add(name)
+                logger.info(f"Lazy import of {self._module} took {elapsed * 1000:.1f} ms")
+            self._target = getattr(module, self._attr) if self._attr else module
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __repr__(self):
+        target = f"{self._module}.{self._attr}" if self._attr else self._module
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyImport {target} ({state})>"
+
+
+def lazy_import(module, attr=None):
+    """``lazy_import("deep_translator", "GoogleTranslator")``"""
+    return LazyImport(module, attr)
@@ -0,0 +1,384 @@
+"""
+In-process metrics: counters, gauges and latency histograms per session.
+
+What gets measured:
+  - startup phases (``with metrics.timer("startup_phase_seconds", phase=...)``)
+  - every event handler registered on an instrumented client: latency,
+    invocations and errors
+  - Telegram RPC calls by request type: latency, count and errors
+  - event loop lag (one monitor per process)
+
+Everything is exposed in the Prometheus text format, either by a small
+local HTTP endpoint (MetricsServer) or by a file rewritten periodically
+(MetricsDumper).
+"""
+import asyncio
+import bisect
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from telethon.events import StopPropagation
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "selfbot_"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# label of the metrics that belong to the process rather than a session
+PROCESS = "_process"
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative counts are computed on render)"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+class Metrics:
+    """Metric registry of one session"""
+
+    def __init__(self, session_name):
+        self.session_name = session_name
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def histogram(self, name, **labels):
+        return self._histograms.get((name, _labels(labels)))
+
+    def counter(self, name, **labels):
+        return self._counters.get((name, _labels(labels)), 0)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the wall time of the block (works around awaits too)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def samples(self):
+        """(family, type, sample lines) of every metric, labelled with the session"""
+        session = (("session", self.session_name),)
+        for (name, labels), value in sorted(self._counters.items()):
+            yield name + "_total", "counter", [f"{PREFIX}{name}_total{_format_labels(session + labels)} {value}"]
+        for (name, labels), value in sorted(self._gauges.items()):
+            yield name, "gauge", [f"{PREFIX}{name}{_format_labels(session + labels)} {value}"]
+        for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+            lines = []
+            for bound, total in histogram.cumulative():
+                bucket_labels = session + labels + (("le", _format_bound(bound)),)
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(bucket_labels)} {total}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(session + labels)} {histogram.sum:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(session + labels)} {histogram.count}")
+            yield name, "histogram", lines
+
+    def render(self):
+        """Metrics in the Prometheus text exposition format"""
+        return render_registries([self])
+
+
+def render_registries(registries):
+    """
+    The metrics of several registries as one exposition: the samples of a
+    family are grouped under a single TYPE line, whatever session they
+    belong to.
+    """
+    families = {}
+    for metrics in registries:
+        for family, kind, lines in metrics.samples():
+            families.setdefault(family, (kind, []))[1].extend(lines)
+    lines = []
+    for family, (kind, samples) in families.items():
+        lines.append(f"# TYPE {PREFIX}{family} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+_registries = {}
+
+
+def get_metrics(session_name=PROCESS):
+    """The metric registry of a session (created on first use)"""
+    metrics = _registries.get(session_name)
+    if metrics is None:
+        metrics = _registries[session_name] = Metrics(session_name)
+    return metrics
+
+
+def render_all():
+    return render_registries(metrics for _, metrics in sorted(_registries.items()))
+
+
+def instrument_handler(callback, metrics):
+    """Wrap an event handler to record its latency, calls and errors"""
+    name = getattr(callback, "__name__", repr(callback))
+
+    @functools.wraps(callback)
+    async def handler(event):
+        start = time.perf_counter()
+        try:
+            return await callback(event)
+        except StopPropagation:
+            raise
+        except Exception:
+            metrics.inc("handler_errors", handler=name)
+            raise
+        finally:
+            metrics.inc("handler_calls", handler=name)
+            metrics.observe("handler_seconds", time.perf_counter() - start, handler=name)
+
+    handler.__wrapped__ = callback
+    return handler
+
+
+def instrument_client(client, metrics):
+    """
+    Measure every handler registered on client from now on and every RPC
+    call it makes. Call before registering handlers.
+    """
+    if getattr(client, "_metrics", None) is not None:
+        return client
+    client._metrics = metrics
+    wrappers = {}
+    add_event_handler = client.add_event_handler
+    remove_event_handler = client.remove_event_handler
+
+    def add(callback, event=None):
+        wrapper = wrappers.get(callback)
+        if wrapper is None:
+            wrapper = wrappers[callback] = instrument_handler(callback, metrics)
+        return add_event_handler(wrapper, event)
+
+    def remove(callback, event=None):
+        return remove_event_handler(wrappers.pop(callback, callback), event)
+
+    client.add_event_handler = add
+    client.remove_event_handler = remove
+
+    call = client._call
+
+    async def timed_call(sender, request, ordered=False, flood_sleep_threshold=None):
+        kind = "batch" if isinstance(request, (list, tuple)) else type(request).__name__
+        start = time.perf_counter()
+        try:
+            return await call(sender, request, ordered=ordered, flood_sleep_threshold=flood_sleep_threshold)
+        except Exception as e:
+            metrics.inc("rpc_errors", request=kind, error=type(e).__name__)
+            raise
+        finally:
+            metrics.inc("rpc_calls", request=kind)
+            metrics.observe("rpc_seconds", time.perf_counter() - start, request=kind)
+
+    client._call = timed_call
+    return client
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes a task that sleeps ``interval``;
+    a busy loop (blocking handlers, heavy CPU work) shows up as lag.
+    """
+
+    def __init__(self, metrics=None, interval=0.5):
+        self.metrics = metrics or get_metrics(PROCESS)
+        self.interval = interval
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.metrics.observe("event_loop_lag_seconds", lag)
+            self.metrics.set_gauge("event_loop_lag_last_seconds", round(lag, 6))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class MetricsServer:
+    """Serves render_all() over HTTP on a local port (any GET path)"""
+
+    def __init__(self, host="127.0.0.1", port=9464):
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            # request line and headers are not needed
+            await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+            body = render_all().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Metrics endpoint on http://{self.host}:{self.port}/metrics")
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+class MetricsDumper:
+    """Rewrites a session's metrics file every ``interval`` seconds"""
+
+    def __init__(self, metrics, path, interval=60):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._task = None
+
+    def dump(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.metrics.render())
+        os.replace(tmp_path, self.path)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.dump()
+            except OSError as e:
+                logger.error(f"Error writing metrics to {self.path}: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            self.dump()
+        except OSError as e:
+            logger.error(f"Error writing metrics to {self.path}: {e}")
+
+
+_services = []
+_process_started = False
+
+
+async def start_process_metrics(port=0, lag_interval=0.5):
+    """Loop lag monitor and, with a port, the HTTP endpoint (once per process)"""
+    global _process_started
+    if _process_started:
+        return
+    _process_started = True
+    monitor = LoopLagMonitor(interval=lag_interval)
+    monitor.start()
+    _services.append(monitor)
+    if port:
+        try:
+            _services.append(await MetricsServer(port=port).start())
+        except OSError as e:
+            logger.error(f"Cannot serve metrics on port {port}: {e}")
+
+
+def start_session_dump(metrics, path, interval=60):
+    """Write a session's metrics to path every interval seconds"""
+    dumper = MetricsDumper(metrics, path, interval)
+    dumper.start()
+    _services.append(dumper)
+    return dumper
+
+
+async def close_metrics():
+    """Stop the monitor, endpoint and dumpers (dumpers write a last time)"""
+    global _process_started
+    while _services:
+        service = _services.pop()
+        try:
+            await service.close()
+        except Exception as e:
+            logger.error(f"Error closing metrics service: {e}")
+    _process_started = False
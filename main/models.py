@@ -1,56 +1,27 @@
 import asyncio
 import logging
 
+from database import open_session_db
 from ormax_models import init_db as ormax_init_db
-from ormax_models import load_settings as ormax_load_settings
 from ormax_models import load_spam_protection as ormax_load_spam_protection
-from ormax_models import update_settings as ormax_update_settings
 from ormax_models import update_spam_protection as ormax_update_spam_protection
+from settings_store import apply_default_settings, get_settings_store
 
 logger = logging.getLogger(__name__)
 
 
-class MockDB:
-    """Mock database class for compatibility with existing code"""
-
-    def __init__(self):
-        self._closed = False
-
-    async def close(self):
-        self._closed = True
-
-    def __getitem__(self, key):
-        # Make it behave like a dictionary for settings access
-        return None
-
-    def __setitem__(self, key, value):
-        pass
-
-    def __contains__(self, key):
-        return False
-
-    def get(self, key, default=None):
-        return default
-
-    def keys(self):
-        return []
-
-    def values(self):
-        return []
-
-    def items(self):
-        return []
-
-
 async def get_database(session_name):
-    """Get database connection - returns MockDB for compatibility"""
-    return MockDB()
+    """Return the session's SessionDatabase, opening it on first use"""
+    return await open_session_db(session_name)
 
 
 async def init_db(db=None):
-    """Initialize Ormax database"""
+    """Initialize a session database, or the module-level Ormax database"""
     try:
-        await ormax_init_db()
+        if db is not None:
+            await db.connect()
+        else:
+            await ormax_init_db()
         logger.info("Ormax database initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
@@ -58,92 +29,28 @@ async def init_db(db=None):
 
 
 async def load_settings(db=None):
-    """Load settings with proper error handling"""
+    """
+    Return the in-memory settings snapshot of the session (see SettingsStore).
+    The first call per session loads from the database; later calls don't.
+    """
     try:
-        settings = await ormax_load_settings()
-        # Ensure essential keys exist
-        if not settings:
-            settings = {}
-
-        # Set default values for critical settings
-        default_settings = {
-            "lang": "fa",
-            "self_enabled": {},
-            "self_global_enabled": False,
-            "profile_settings": {
-                "name_enabled": False,
-                "bio_enabled": False,
-                "status_enabled": False,
-                "online_enabled": False,
-                "title_enabled": False,
-                "names": [],
-                "bios": [],
-                "statuses": [],
-                "title": [],
-            },
-            "save_profile_enabled": {},
-            "reaction_enabled": {},
-            "typing_enabled": {},
-            "action_enabled": {},
-            "tick_enabled": {},
-            "tag_enabled": {},
-            "translate_mode_enabled": {},
-            "translate_enabled": {},
-            "hashtag_enabled": {},
-            "signature_enabled": {},
-            "auto_approve_enabled": {},
-            "emoji_enabled": {},
-            "bold_enabled": {},
-            "underline_enabled": {},
-            "code_enabled": {},
-            "font_en_enabled": {},
-            "font_fa_enabled": {},
-            "strikethrough_enabled": {},
-            "italic_enabled": {},
-            "spoiler_enabled": {},
-            "poker_enabled": {},
-            "save_enabled": {},
-            "save_pv_enabled": {},
-        }
-
-        # Merge defaults with existing settings
-        for key, value in default_settings.items():
-            if key not in settings:
-                settings[key] = value
-
-        logger.info(f"Settings loaded successfully with {len(settings)} keys")
-        return settings
-
+        store = await get_settings_store(getattr(db, "session_name", None))
+        return store.settings
     except Exception as e:
         logger.error(f"Error loading settings: {e}")
         # Return default settings on error
-        return {
-            "lang": "fa",
-            "self_global_enabled": False,
-            "profile_settings": {
-                "name_enabled": False,
-                "bio_enabled": False,
-                "status_enabled": False,
-                "online_enabled": False,
-                "title_enabled": False,
-                "names": [],
-                "bios": [],
-                "statuses": [],
-                "title": [],
-            },
-        }
+        return apply_default_settings({})
 
 
 async def update_settings(settings, db=None):
-    """Update settings with proper error handling"""
+    """Record changed settings; they are written behind by the settings store"""
     try:
         if not settings or not isinstance(settings, dict):
             logger.warning("update_settings called with invalid settings")
             return False
 
-        result = await ormax_update_settings(settings)
-        logger.info(f"Settings updated successfully with {len(settings)} keys")
-        return result
+        store = await get_settings_store(getattr(db, "session_name", None))
+        return store.update(settings)
 
     except Exception as e:
         logger.error(f"Error updating settings: {e}")
@@ -153,7 +60,7 @@ async def update_settings(settings, db=None):
 async def load_spam_protection(db=None, user_id=None):
     """Load spam protection settings"""
     try:
-        return await ormax_load_spam_protection(user_id)
+        return await ormax_load_spam_protection(user_id, db)
     except Exception as e:
         logger.error(f"Error loading spam protection: {e}")
         return {}
@@ -162,7 +69,7 @@ async def load_spam_protection(db=None, user_id=None):
 async def update_spam_protection(spam_data, db=None):
     """Update spam protection settings"""
     try:
-        await ormax_update_spam_protection(spam_data)
+        await ormax_update_spam_protection(spam_data, db)
         return True
     except Exception as e:
         logger.error(f"Error updating spam protection: {e}")
@@ -217,3 +124,24 @@ async def set_global_setting(settings, setting_key, value):
     except Exception as e:
         logger.error(f"Error setting global setting {setting_key}: {e}")
         return False
+
+
+async def get_chat_setting(setting_key, chat_id, default=None, db=None):
+    """Per-chat setting lookup served from the session's settings snapshot"""
+    try:
+        store = await get_settings_store(getattr(db, "session_name", None))
+        return store.get_chat(setting_key, chat_id, default)
+    except Exception as e:
+        logger.error(f"Error getting chat setting {setting_key} for chat {chat_id}: {e}")
+        return default
+
+
+async def set_chat_setting(setting_key, chat_id, value, db=None):
+    """Set a per-chat setting; only its row is written"""
+    try:
+        store = await get_settings_store(getattr(db, "session_name", None))
+        store.set_chat(setting_key, chat_id, value)
+        return True
+    except Exception as e:
+        logger.error(f"Error setting chat setting {setting_key} for chat {chat_id}: {e}")
+        return False
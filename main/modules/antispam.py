@@ -0,0 +1,270 @@
+import array
+import asyncio
+import logging
+import math
+import os
+import sys
+import time
+from datetime import datetime
+
+# Add the main directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from cache import LRUCache
+from database import get_session_db
+from delete_queue import get_deletion_queue
+from dispatcher import get_dispatcher
+from ormax_models import load_spam_states, save_spam_states
+from pytz import utc
+from scheduler import get_scheduler
+from settings_store import get_settings_store
+from utils import get_message, load_json
+
+logger = logging.getLogger(__name__)
+
+# نتیجه بررسی هر پیام
+ALLOWED = "allowed"
+VIOLATION = "violation"
+MUTED = "muted"
+RELEASED = "released"
+
+
+class _Window:
+    """Fixed-size ring buffer of a user's latest message timestamps"""
+
+    __slots__ = ("times", "pos", "count")
+
+    def __init__(self, size):
+        self.times = array.array("d", bytes(8 * size))
+        self.pos = 0
+        self.count = 0
+
+
+class SpamGuard:
+    """
+    Sliding-window spam detector.
+
+    Every user gets a ring buffer of their last ``max_count`` message times;
+    a message is a violation when the buffer is full and its oldest entry is
+    still inside ``time_window``, which is an O(1) check. Idle users are
+    evicted (LRU with a TTL of one window). Violation counters and mute
+    deadlines live in memory and are checkpointed to SQLite when they change
+    (coalesced) and periodically, never per message.
+    """
+
+    def __init__(
+        self,
+        max_count=10,
+        time_window=10,
+        mute_duration=60,
+        max_users=10000,
+        checkpoint_interval=30,
+        clock=time.time,
+        database=None,
+    ):
+        self.max_count = max(1, int(max_count))
+        self.time_window = time_window
+        self.mute_duration = mute_duration
+        self.checkpoint_interval = checkpoint_interval
+        self._clock = clock
+        self.database = database
+        self._windows = LRUCache(maxsize=max_users, ttl=time_window)
+        self._states = {}
+        self._dirty = set()
+        self._changed = asyncio.Event()
+        self._task = None
+
+    async def load(self):
+        try:
+            self._states = await load_spam_states(int(self._clock()), self.database)
+        except Exception as e:
+            logger.error(f"Error loading spam states: {e}")
+            self._states = {}
+        return self._states
+
+    def is_muted(self, user_id, now=None):
+        state = self._states.get(user_id)
+        if not state:
+            return False
+        return (now or self._clock()) < state["mute_until"]
+
+    def mute_until(self, user_id):
+        state = self._states.get(user_id)
+        return state["mute_until"] if state else 0
+
+    def release(self, user_id, now=None):
+        """End an expired mute; False if the user isn't muted or still is"""
+        state = self._states.get(user_id)
+        if not state or not state["mute_until"] or (now or self._clock()) < state["mute_until"]:
+            return False
+        state["mute_until"] = 0
+        self._mark(user_id)
+        return True
+
+    def _mark(self, user_id):
+        self._dirty.add(user_id)
+        self._changed.set()
+
+    def check(self, user_id, now=None):
+        """Record one message of user_id and return the verdict"""
+        if now is None:
+            now = self._clock()
+        released = False
+        state = self._states.get(user_id)
+        if state and state["mute_until"]:
+            if now < state["mute_until"]:
+                return MUTED
+            state["mute_until"] = 0
+            released = True
+            self._mark(user_id)
+
+        window = self._windows.get(user_id)
+        if window is None:
+            window = _Window(self.max_count)
+        self._windows.set(user_id, window)
+
+        window.times[window.pos] = now
+        window.pos = (window.pos + 1) % self.max_count
+        if window.count < self.max_count:
+            window.count += 1
+
+        # the slot at pos now holds the oldest timestamp of a full buffer
+        if window.count == self.max_count and now - window.times[window.pos] <= self.time_window:
+            state = self._states.setdefault(user_id, {"violations": 0, "mute_until": 0})
+            state["violations"] += 1
+            state["mute_until"] = int(now + self.mute_duration)
+            window.count = 0
+            self._mark(user_id)
+            return VIOLATION
+        return RELEASED if released else ALLOWED
+
+    async def checkpoint(self):
+        """Write the state of changed users"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        states = {user_id: dict(self._states[user_id]) for user_id in dirty if user_id in self._states}
+        try:
+            await save_spam_states(states, int(self._clock()), self.database)
+        except Exception as e:
+            logger.error(f"Error saving spam states: {e}")
+            self._dirty.update(dirty)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.checkpoint_interval)
+                # let a burst of violations land in the same checkpoint
+                await asyncio.sleep(1)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            self._windows.evict_expired()
+            await self.checkpoint()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.checkpoint()
+
+
+async def register_antispam_handlers(client, session_name, owner_id):
+    store = await get_settings_store(session_name)
+    settings = store.settings
+    lang = settings.get("lang", "fa")
+    config = load_json("config.json", {})
+
+    guard = SpamGuard(
+        max_count=config.get("max_spam_count", 10),
+        time_window=config.get("spam_time_window", 10),
+        mute_duration=config.get("default_mute_duration", 60),
+        database=get_session_db(session_name),
+    )
+    await guard.load()
+    guard.start()
+    dispatcher = get_dispatcher(client)
+    scheduler = get_scheduler()
+
+    # the stored job tells the user when the mute ends; a message sent
+    # before it runs is released by check() instead
+    async def unmute(user_id):
+        if guard.release(user_id):
+            await client.send_message(user_id, get_message("spam_released", lang))
+
+    scheduler.handle(session_name, "spam_unmute", unmute)
+
+    @dispatcher.hook(outgoing=False, private=True, feature="antispam_enabled")
+    async def check_spam(event):
+        try:
+            if event.sender_id is None or event.sender_id == owner_id:
+                return
+
+            verdict = guard.check(event.sender_id)
+            if verdict == MUTED:
+                await event.delete()
+            elif verdict == VIOLATION:
+                scheduler.add_session_job(
+                    session_name,
+                    "spam_unmute",
+                    "date",
+                    args=(event.sender_id,),
+                    job_id=f"{session_name}:spam_unmute:{event.sender_id}",
+                    run_date=datetime.fromtimestamp(guard.mute_until(event.sender_id), utc),
+                )
+                warning = await event.reply(
+                    get_message(
+                        "spam_warning",
+                        lang,
+                        time=guard.time_window,
+                        count=guard.max_count,
+                        duration=max(1, math.ceil(guard.mute_duration / 60)),
+                    )
+                )
+                # the warning is a temporary reply: gone when the mute ends
+                deletions = await get_deletion_queue(client, session_name)
+                await deletions.schedule(event.chat_id, [warning.id], guard.mute_duration)
+            elif verdict == RELEASED:
+                await event.reply(get_message("spam_released", lang))
+        except Exception as e:
+            logger.error(f"Error checking spam: {e}")
+
+    @dispatcher.command("antispam_toggle")
+    async def toggle_antispam(event):
+        try:
+            if event.sender_id != owner_id:
+                await event.edit(get_message("unauthorized", lang), parse_mode="html")
+                return
+
+            status = event.pattern_match.group(1)
+            status_value = status == "روشن" if lang == "fa" else status == "on"
+            store.set("antispam_enabled", status_value)
+
+            status_text = (
+                "روشن"
+                if lang == "fa" and status_value
+                else "خاموش"
+                if lang == "fa"
+                else "on"
+                if status_value
+                else "off"
+            )
+            emoji = "✅" if status_value else "❌"
+
+            await event.edit(
+                get_message("antispam_toggle", lang, status=status_text, emoji=emoji),
+                parse_mode="html",
+            )
+        except Exception as e:
+            logger.error(f"Error toggling antispam: {e}")
+
+    return guard
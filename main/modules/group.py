@@ -0,0 +1,397 @@
+import asyncio
+import html
+import logging
+import os
+import sys
+import time
+
+# Add the main directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from cache import LRUCache
+from delete_queue import get_deletion_queue
+from dispatcher import get_dispatcher
+from rpc import BACKGROUND, rpc_priority
+from settings_store import get_settings_store
+from telethon import events
+from template import compile_template, render_template
+from utils import get_message, load_json
+
+logger = logging.getLogger(__name__)
+
+# Telegram's limit on message length
+MAX_MESSAGE_LENGTH = 4096
+# mentions per tag message (well under the 100 entities a message may carry)
+MENTIONS_PER_MESSAGE = 50
+# seconds between two tag messages of the queue
+SEND_INTERVAL = 1.5
+# joins this close together are welcomed in one message
+WELCOME_WINDOW = 3.0
+# a chat welcoming RAID_SIZE newcomers at once collects the next joins
+# for RAID_WINDOW seconds
+RAID_WINDOW = 30.0
+RAID_SIZE = 10
+# welcome messages per batch; newcomers beyond them are only counted
+MAX_WELCOME_MESSAGES = 3
+# longest mention: the link plus 64 characters of name, html-escaped
+MENTION_ROOM = 512
+
+
+def display_name(user):
+    name = " ".join(filter(None, (getattr(user, "first_name", None), getattr(user, "last_name", None))))
+    return name or str(user.id)
+
+
+def build_mention_chunks(members, header="", per_message=MENTIONS_PER_MESSAGE, max_length=MAX_MESSAGE_LENGTH):
+    """
+    Split {user_id: name} into html messages of at most per_message
+    mentions and max_length characters; header starts the first one.
+    """
+    chunks = []
+    parts = [header] if header else []
+    # the html of header and links is longer than the visible text, so this overestimates
+    length = len(header)
+    count = 0
+    for user_id, name in members.items():
+        mention = f'<a href="tg://user?id={user_id}">{html.escape(name[:64])}</a>'
+        if count and (count == per_message or length + len(mention) + 1 > max_length):
+            chunks.append(" ".join(parts))
+            parts, length, count = [], 0, 0
+        parts.append(mention)
+        length += len(mention) + 1
+        count += 1
+    if count:
+        chunks.append(" ".join(parts))
+    return chunks
+
+
+def build_welcome_messages(
+    text, members, per_message=MENTIONS_PER_MESSAGE, max_messages=MAX_WELCOME_MESSAGES, max_length=MAX_MESSAGE_LENGTH
+):
+    """
+    Welcome messages for {user_id: name}: text with {name} replaced by the
+    mentions (put in front when text has no {name}), split like tag_all.
+    Newcomers that don't fit in max_messages are added as "+N". Every
+    message fits max_length once rendered: each {name} gets the mentions
+    and the "+N", so they share what the text leaves. A text leaving no
+    room for a mention is sent on its own, followed by the mentions.
+    """
+    if "{name}" not in text:
+        text = "{name} " + text
+    slots = text.count("{name}")
+    suffix = len(f" +{len(members)}")
+    room = (max_length - len(text) + slots * len("{name}")) // slots - suffix
+    if room < MENTION_ROOM:
+        head = text.replace("{name}", "").strip()[:max_length]
+        return [head] + build_welcome_messages("{name}", members, per_message, max(1, max_messages - 1), max_length)
+    chunks = build_mention_chunks(members, per_message=per_message, max_length=room)
+    if len(chunks) > max_messages:
+        chunks = chunks[:max_messages]
+        mentioned = sum(chunk.count("tg://user?id=") for chunk in chunks)
+        chunks[-1] += f" +{len(members) - mentioned}"
+    return [text.replace("{name}", chunk) for chunk in chunks]
+
+
+class ParticipantCache:
+    """
+    Member lists of groups, {user_id: name} per chat. A list is downloaded
+    once (200 per GetParticipantsRequest page) and then kept current from
+    join/leave events; it is downloaded again only after ``ttl`` seconds,
+    in case updates were missed. Concurrent fetches of a chat share one
+    download.
+    """
+
+    def __init__(self, client, ttl=6 * 3600, maxsize=64, clock=time.monotonic):
+        self.client = client
+        self._chats = LRUCache(maxsize, ttl=ttl, clock=clock)
+        self._loading = {}
+
+    async def _download(self, chat_id):
+        members = {}
+        async for user in self.client.iter_participants(chat_id):
+            if not user.bot and not user.deleted and not user.is_self:
+                members[user.id] = display_name(user)
+        self._chats.set(chat_id, members)
+        return members
+
+    async def get(self, chat_id):
+        members = self._chats.get(chat_id)
+        if members is not None:
+            return members
+        task = self._loading.get(chat_id)
+        if task is None:
+            task = self._loading[chat_id] = asyncio.ensure_future(self._download(chat_id))
+            task.add_done_callback(lambda _: self._loading.pop(chat_id, None))
+        return await asyncio.shield(task)
+
+    def add(self, chat_id, users):
+        members = self._chats.get(chat_id)
+        if members is not None:
+            for user in users:
+                if not getattr(user, "bot", False) and not getattr(user, "deleted", False):
+                    members[user.id] = display_name(user)
+
+    def remove(self, chat_id, user_ids):
+        members = self._chats.get(chat_id)
+        if members is not None:
+            for user_id in user_ids:
+                members.pop(user_id, None)
+
+    def invalidate(self, chat_id):
+        self._chats.pop(chat_id)
+
+    async def on_action(self, event):
+        """Apply a ChatAction event to the cached list of its chat"""
+        if event.chat_id not in self._chats:
+            return
+        if event.user_joined or event.user_added:
+            self.add(event.chat_id, await event.get_users())
+        elif event.user_left or event.user_kicked:
+            self.remove(event.chat_id, event.user_ids)
+
+
+class WelcomeBatcher:
+    """
+    Collects the newcomers of each chat for ``window`` seconds and passes
+    them to ``await on_batch(chat_id, {user_id: name})`` together. After a
+    batch of raid_size or more, the chat's next joins are collected for
+    raid_window seconds instead, so a mass-join raid makes a few messages.
+    """
+
+    def __init__(self, on_batch, window=WELCOME_WINDOW, raid_window=RAID_WINDOW, raid_size=RAID_SIZE, clock=time.monotonic):
+        self.on_batch = on_batch
+        self.window = window
+        self.raid_window = raid_window
+        self.raid_size = raid_size
+        self._clock = clock
+        self._pending = {}
+        self._tasks = {}
+        # chat_id -> (time, size) of its last batch
+        self._last_batch = {}
+
+    def _delay(self, chat_id):
+        last = self._last_batch.get(chat_id)
+        if last is not None and last[1] >= self.raid_size and self._clock() - last[0] < self.raid_window:
+            return self.raid_window
+        return self.window
+
+    def add(self, chat_id, users):
+        members = self._pending.get(chat_id)
+        if members is None:
+            members = self._pending[chat_id] = {}
+            self._tasks[chat_id] = asyncio.create_task(self._flush_later(chat_id, self._delay(chat_id)))
+        for user in users:
+            if not getattr(user, "bot", False) and not getattr(user, "deleted", False) and not getattr(user, "is_self", False):
+                members[user.id] = display_name(user)
+
+    async def _flush_later(self, chat_id, delay):
+        await asyncio.sleep(delay)
+        await self.flush(chat_id)
+
+    async def flush(self, chat_id):
+        task = self._tasks.pop(chat_id, None)
+        # flushed early: the timer of the batch is no longer needed
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        members = self._pending.pop(chat_id, None)
+        if not members:
+            return
+        self._last_batch[chat_id] = (self._clock(), len(members))
+        try:
+            await self.on_batch(chat_id, members)
+        except Exception as e:
+            logger.error(f"Error welcoming in {chat_id}: {e}")
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class SendQueue:
+    """
+    Sends queued messages one at a time, ``interval`` seconds apart, in the
+    background RPC lane; put() returns a future resolved when its messages
+    are out. on_sent, if given, is awaited with every sent message.
+    """
+
+    def __init__(self, client, interval=SEND_INTERVAL):
+        self.client = client
+        self.interval = interval
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def put(self, chat_id, texts, parse_mode="html", on_sent=None):
+        done = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((chat_id, list(texts), parse_mode, on_sent, done))
+        self.start()
+        return done
+
+    async def _run(self):
+        rpc_priority.set(BACKGROUND)
+        while True:
+            chat_id, texts, parse_mode, on_sent, done = await self._queue.get()
+            sent = 0
+            try:
+                for text in texts:
+                    message = await self.client.send_message(chat_id, text, parse_mode=parse_mode)
+                    sent += 1
+                    if on_sent is not None:
+                        await on_sent(message)
+                    await asyncio.sleep(self.interval)
+            except Exception as e:
+                logger.error(f"Error sending queued message to {chat_id}: {e}")
+            if not done.done():
+                done.set_result(sent)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class GroupServices:
+    """What the group plugin keeps running (closed with the plugin)"""
+
+    def __init__(self, queue, welcomes):
+        self.queue = queue
+        self.welcomes = welcomes
+
+    async def close(self):
+        await self.welcomes.close()
+        await self.queue.close()
+
+
+async def register_group_handlers(client, session_name, owner_id):
+    store = await get_settings_store(session_name)
+    lang = store.settings.get("lang", "fa")
+
+    participants = ParticipantCache(client)
+    queue = SendQueue(client)
+    dispatcher = get_dispatcher(client)
+    config = load_json("config.json", {})
+
+    async def send_welcome(chat_id, members):
+        settings = store.settings
+        text = settings.get("welcome_text") or get_message("welcome_text", lang)
+        template = compile_template(text)
+        if template is not None:
+            text = await render_template(template, settings.get("clock_timezone") or "Asia/Tehran")
+        on_sent = None
+        # the session's own time, or config.json's default (0: keep)
+        delay = settings.get("welcome_delete_time") or config.get("welcome_delete_delay", 0)
+        if delay > 0:
+            deletions = await get_deletion_queue(client, session_name)
+
+            async def on_sent(message):
+                await deletions.schedule(chat_id, [message.id], delay)
+
+        queue.put(chat_id, build_welcome_messages(text, members), on_sent=on_sent)
+
+    welcomes = WelcomeBatcher(send_welcome)
+
+    # chats without welcome are dropped by the filter, before any await
+    @client.on(
+        events.ChatAction(
+            func=lambda e: (e.user_joined or e.user_added) and store.get_chat("welcome_chats", e.chat_id, False)
+        )
+    )
+    async def welcome_newcomers(event):
+        try:
+            welcomes.add(event.chat_id, await event.get_users())
+        except Exception as e:
+            logger.error(f"Error queueing welcome: {e}")
+
+    @client.on(events.ChatAction(func=lambda e: e.user_joined or e.user_added or e.user_left or e.user_kicked))
+    async def track_members(event):
+        try:
+            await participants.on_action(event)
+        except Exception as e:
+            logger.error(f"Error updating participant cache: {e}")
+
+    @dispatcher.command("tag_all")
+    async def tag_all(event):
+        try:
+            if event.sender_id != owner_id:
+                await event.edit(get_message("unauthorized", lang), parse_mode="html")
+                return
+            if event.is_private:
+                return
+
+            members = await participants.get(event.chat_id)
+            chunks = build_mention_chunks(members, get_message("tag_all", lang))
+            if not chunks:
+                return
+            # mentions notify only in new messages, so the command message is removed
+            await event.delete()
+            queue.put(event.chat_id, chunks)
+        except Exception as e:
+            logger.error(f"Error in tag_all: {e}")
+
+    @dispatcher.command("welcome_toggle")
+    async def toggle_welcome(event):
+        try:
+            if event.sender_id != owner_id:
+                await event.edit(get_message("unauthorized", lang), parse_mode="html")
+                return
+            if event.is_private:
+                return
+
+            status = event.pattern_match.group(1)
+            status_value = status == "روشن" if lang == "fa" else status == "on"
+            store.set_chat("welcome_chats", event.chat_id, status_value)
+            # روشن بودن در هر گروهی یعنی این ماژول از ابتدا بارگذاری بشه
+            store.set("welcome_enabled", any(store.get("welcome_chats", {}).values()))
+
+            status_text = (
+                "روشن"
+                if lang == "fa" and status_value
+                else "خاموش"
+                if lang == "fa"
+                else "on"
+                if status_value
+                else "off"
+            )
+            emoji = "✅" if status_value else "❌"
+            await event.edit(get_message("welcome_toggle", lang, status=status_text, emoji=emoji), parse_mode="html")
+        except Exception as e:
+            logger.error(f"Error toggling welcome: {e}")
+
+    @dispatcher.command("set_welcome_text")
+    async def set_welcome_text(event):
+        try:
+            if event.sender_id != owner_id:
+                await event.edit(get_message("unauthorized", lang), parse_mode="html")
+                return
+
+            text = event.pattern_match.group(1).strip()
+            store.set("welcome_text", text)
+            await event.edit(get_message("welcome_text_set", lang, text=html.escape(text)), parse_mode="html")
+        except Exception as e:
+            logger.error(f"Error setting welcome text: {e}")
+
+    @dispatcher.command("set_welcome_delete_time")
+    async def set_welcome_delete_time(event):
+        try:
+            if event.sender_id != owner_id:
+                await event.edit(get_message("unauthorized", lang), parse_mode="html")
+                return
+
+            seconds = int(event.pattern_match.group(1))
+            store.set("welcome_delete_time", seconds)
+            await event.edit(get_message("welcome_delete_time_set", lang, time=seconds), parse_mode="html")
+        except Exception as e:
+            logger.error(f"Error setting welcome delete time: {e}")
+
+    return GroupServices(queue, welcomes)
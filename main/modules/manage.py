@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import sys
+
+# Add the main directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from dispatcher import get_dispatcher
+from rpc import BACKGROUND, priority
+from settings_store import get_settings_store
+from utils import get_message, load_json
+
+logger = logging.getLogger(__name__)
+
+# ids per DeleteMessagesRequest (Telegram's maximum)
+DELETE_BATCH = 100
+# delete requests in flight at once
+DELETE_CONCURRENCY = 3
+# progress edits: at most MAX_PROGRESS_EDITS, PROGRESS_INTERVAL seconds apart
+PROGRESS_INTERVAL = 3.0
+MAX_PROGRESS_EDITS = 3
+
+
+async def purge_messages(
+    client,
+    chat,
+    limit,
+    max_id=0,
+    from_user=None,
+    concurrency=DELETE_CONCURRENCY,
+    on_progress=None,
+    progress_interval=PROGRESS_INTERVAL,
+    max_progress_edits=MAX_PROGRESS_EDITS,
+):
+    """
+    Delete the last ``limit`` messages of chat older than max_id (only
+    from_user's, if given) and return how many were deleted.
+
+    History is read page by page while earlier pages are being deleted;
+    ids go out in 100-id DeleteMessagesRequest batches, ``concurrency`` at
+    a time, in the background RPC lane (pacing and flood waits are left to
+    the RPC scheduler). on_progress(deleted) is awaited now and then.
+    """
+    batches = asyncio.Queue(maxsize=concurrency * 2)
+    deleted = 0
+
+    async def collect():
+        batch = []
+        async for message in client.iter_messages(
+            chat, limit=limit, max_id=max_id, from_user=from_user, wait_time=0
+        ):
+            batch.append(message.id)
+            if len(batch) == DELETE_BATCH:
+                await batches.put(batch)
+                batch = []
+        if batch:
+            await batches.put(batch)
+        for _ in range(concurrency):
+            await batches.put(None)
+
+    async def delete():
+        nonlocal deleted
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                return
+            results = await client.delete_messages(chat, batch, revoke=True)
+            deleted += sum(result.pts_count for result in results)
+
+    # tasks copy the lane they are created in
+    with priority(BACKGROUND):
+        tasks = [asyncio.create_task(collect())]
+        tasks += [asyncio.create_task(delete()) for _ in range(concurrency)]
+
+    edits = 0
+    reported = 0
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=progress_interval, return_when=asyncio.FIRST_EXCEPTION
+            )
+            for task in done:
+                task.result()  # re-raises a failed step
+            if pending and on_progress and edits < max_progress_edits and deleted != reported:
+                edits += 1
+                reported = deleted
+                await on_progress(deleted)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return deleted
+
+
+async def can_delete_others(event):
+    """True if the account may delete everyone's messages in the event's chat"""
+    if event.is_private:
+        return True
+    chat = await event.get_chat()
+    if getattr(chat, "creator", False):
+        return True
+    rights = getattr(chat, "admin_rights", None)
+    return bool(rights and rights.delete_messages)
+
+
+async def register_manage_handlers(client, session_name, owner_id):
+    store = await get_settings_store(session_name)
+    lang = store.settings.get("lang", "fa")
+    config = load_json("config.json", {})
+    max_delete = config.get("max_delete_messages", 1000)
+    dispatcher = get_dispatcher(client)
+
+    @dispatcher.command("delete_messages")
+    async def delete_messages(event):
+        try:
+            if event.sender_id != owner_id:
+                await event.edit(get_message("unauthorized", lang), parse_mode="html")
+                return
+
+            count = int(event.pattern_match.group(1))
+            if count > max_delete:
+                await event.edit(get_message("delete_limit", lang, max=max_delete), parse_mode="html")
+                return
+
+            # بدون دسترسی ادمین فقط پیام‌های خود اکانت حذف می‌شن
+            from_user = None if await can_delete_others(event) else "me"
+
+            async def report(deleted):
+                await event.edit(get_message("deleting_messages", lang, count=deleted), parse_mode="html")
+
+            deleted = await purge_messages(
+                client, event.chat_id, count, max_id=event.id, from_user=from_user, on_progress=report
+            )
+            await event.edit(get_message("messages_deleted", lang, count=deleted), parse_mode="html")
+        except Exception as e:
+            logger.error(f"Error deleting messages: {e}")
@@ -1,33 +1,62 @@
 import asyncio
+import json
 import logging
 import os
 import random
 import sys
+import time
 from datetime import datetime
 
 # Add the main directory to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 import pytz
-from models import get_database, load_settings, update_settings
+from clock import clock_text, get_clock_ticker
+from database import get_session_db
+from dispatcher import get_dispatcher
+from ormax_models import delete_owned_chat, load_owned_chats, replace_owned_chats, save_owned_chat
+from rpc import BACKGROUND, rpc_priority
+from settings_store import get_settings_store
 from telethon import events
+from telethon.errors import (
+    ChannelInvalidError,
+    ChannelPrivateError,
+    ChatAdminRequiredError,
+    ChatIdInvalidError,
+    ChatNotModifiedError,
+    PeerIdInvalidError,
+)
 from telethon.tl.functions.account import (
     UpdateProfileRequest,
     UpdateStatusRequest,
     UpdateUsernameRequest,
 )
-from telethon.tl.functions.channels import (
-    UpdateUsernameRequest as UpdateChannelUsername,
-)
+from telethon.tl.functions.channels import EditTitleRequest
+from telethon.tl.functions.messages import EditChatTitleRequest
 from telethon.tl.functions.photos import DeletePhotosRequest, UploadProfilePhotoRequest
-from utils import get_command_pattern, get_message
+from telethon.tl.types import (
+    Channel,
+    Chat,
+    InputChannel,
+    MessageActionChannelCreate,
+    MessageActionChatCreate,
+    MessageActionChatDeleteUser,
+    MessageActionChatMigrateTo,
+    MessageService,
+    PeerChannel,
+    UpdateChannel,
+    UpdateNewChannelMessage,
+    UpdateNewMessage,
+)
+from telethon.utils import get_peer_id
+from utils import get_message
 
 logger = logging.getLogger(__name__)
 
-async def update_dynamic_text(text, timezone="UTC"):
+def render_dynamic_text(text, timezone="UTC", now=None):
     """Replace dynamic variables like time and date"""
-    tz = pytz.timezone(timezone)
-    now = datetime.now(tz)
+    if now is None:
+        now = datetime.now(pytz.timezone(timezone))
     replacements = {
         "time": now.strftime("%H:%M"),
         "date": now.strftime("%Y-%m-%d"),
@@ -40,84 +69,311 @@ async def update_dynamic_text(text, timezone="UTC"):
     return text
 
 
-async def update_profile_loop(client,settings, owner_id):
-    """Main loop for updating name, bio, and title with dynamic variables"""
-    while True:
-        try:
-            if (
-                settings["profile_settings"]["name_enabled"]
-                and settings["profile_settings"]["names"]
-            ):
-                name = random.choice(settings["profile_settings"]["names"])
-                name = await update_dynamic_text(
-                    name, settings.get("clock_timezone", "UTC")
-                )
-                await client(UpdateProfileRequest(last_name=name))
-
-            if (
-                settings["profile_settings"]["bio_enabled"]
-                and settings["profile_settings"]["bios"]
-            ):
-                bio = random.choice(settings["profile_settings"]["bios"])
-                bio = await update_dynamic_text(
-                    bio, settings.get("clock_timezone", "UTC")
-                )
-                await client(UpdateProfileRequest(about=bio))
-
-            if (
-                settings["profile_settings"]["title_enabled"]
-                and settings["profile_settings"]["title"]
-            ):
-                title = random.choice(settings["profile_settings"]["title"])
-                title = await update_dynamic_text(
-                    title, settings.get("clock_timezone", "UTC")
-                )
-                # Update channel title if user is creator of any channel
-                async for dialog in client.iter_dialogs():
-                    if (
-                        dialog.is_group
-                        and hasattr(dialog.entity, "creator")
-                        and dialog.entity.creator
-                        and dialog.entity.id == owner_id
-                    ):
-                        try:
-                            await client(
-                                UpdateChannelUsername(
-                                    channel=dialog.entity, username=title
-                                )
-                            )
-                        except Exception as e:
-                            logger.error(f"Failed to update channel title: {e}")
-                            continue
-
-            if settings["profile_settings"]["online_enabled"]:
-                await client(UpdateStatusRequest(offline=False))
+async def update_dynamic_text(text, timezone="UTC"):
+    """Replace dynamic variables like time and date"""
+    return render_dynamic_text(text, timezone)
+
+
+class OwnedChatIndex:
+    """
+    Groups and channels created by the account, persisted in owned_chats.
+
+    Built by a single dialog scan the first time titles are needed; after
+    that it is kept current from updates (channel changes, chats created,
+    migrated or left), so title rotation only touches owned chats and never
+    enumerates dialogs again.
+    """
+
+    INDEXED_KEY = "owned_chats_indexed"
+    UPDATE_TYPES = [UpdateChannel, UpdateNewMessage, UpdateNewChannelMessage]
+    _TRACKED_ACTIONS = (
+        MessageActionChatCreate,
+        MessageActionChannelCreate,
+        MessageActionChatMigrateTo,
+        MessageActionChatDeleteUser,
+    )
+
+    def __init__(self, client, store, database=None):
+        self.client = client
+        self.store = store
+        self.database = database
+        self.chats = None
+
+    @staticmethod
+    def describe(entity):
+        """Index row of an owned chat or channel, None for anything else"""
+        if isinstance(entity, Channel):
+            if not entity.creator or entity.left:
+                return None
+            return {
+                "chat_id": entity.id,
+                "access_hash": entity.access_hash or 0,
+                "is_channel": True,
+                "title": entity.title or "",
+            }
+        if isinstance(entity, Chat):
+            if not entity.creator or entity.left or entity.deactivated or entity.migrated_to:
+                return None
+            return {"chat_id": entity.id, "access_hash": 0, "is_channel": False, "title": entity.title or ""}
+        return None
+
+    async def ensure(self):
+        if self.chats is None:
+            if self.store.get(self.INDEXED_KEY):
+                rows = await load_owned_chats(self.database)
+                self.chats = {row["chat_id"]: row for row in rows}
             else:
-                await client(UpdateStatusRequest(offline=True))
-
-            await asyncio.sleep(60)  # Update every minute
-        except Exception as e:
-            logger.error(f"Error in profile update loop: {e}")
-            await asyncio.sleep(60)
+                await self.rebuild()
+        return self.chats
+
+    async def rebuild(self):
+        chats = {}
+        async for dialog in self.client.iter_dialogs():
+            row = self.describe(dialog.entity)
+            if row:
+                chats[row["chat_id"]] = row
+        await replace_owned_chats(chats.values(), self.database)
+        self.chats = chats
+        self.store.set(self.INDEXED_KEY, True)
+        logger.info(f"Indexed {len(chats)} owned chats")
+
+    async def track(self, entity):
+        # before the first scan there is nothing to maintain
+        if self.chats is None:
+            return
+        row = self.describe(entity)
+        if row is None:
+            await self.discard(entity.id)
+        elif self.chats.get(entity.id) != row:
+            self.chats[entity.id] = row
+            await save_owned_chat(row, self.database)
+
+    async def discard(self, chat_id):
+        if self.chats and self.chats.pop(chat_id, None) is not None:
+            await delete_owned_chat(chat_id, self.database)
+
+    async def refresh(self, peer, chat_id):
+        try:
+            entity = await self.client.get_entity(peer)
+        except (ChannelPrivateError, ChannelInvalidError, ChatIdInvalidError, PeerIdInvalidError, ValueError):
+            await self.discard(chat_id)
+            return
+        await self.track(entity)
+
+    async def on_update(self, update):
+        if self.chats is None:
+            return
+        if isinstance(update, UpdateChannel):
+            # most of these are about channels that aren't ours: only an
+            # indexed channel, or one that came with the update and is owned,
+            # is looked at, and the entity sent along saves the request
+            channel_id = update.channel_id
+            entity = getattr(update, "_entities", {}).get(get_peer_id(PeerChannel(channel_id)))
+            if entity is not None:
+                if channel_id in self.chats or self.describe(entity):
+                    await self.track(entity)
+            elif channel_id in self.chats:
+                await self.refresh(PeerChannel(channel_id), channel_id)
+            return
+        message = getattr(update, "message", None)
+        if not isinstance(message, MessageService) or not isinstance(message.action, self._TRACKED_ACTIONS):
+            return
+        if isinstance(message.action, MessageActionChatDeleteUser) and not message.out:
+            return
+        peer = message.peer_id
+        chat_id = getattr(peer, "channel_id", None) or getattr(peer, "chat_id", None)
+        if chat_id is not None:
+            await self.refresh(peer, chat_id)
+
+    async def set_titles(self, title):
+        """Set title on every owned chat whose title differs"""
+        for row in list((await self.ensure()).values()):
+            if row["title"] == title:
+                continue
+            try:
+                if row["is_channel"]:
+                    await self.client(
+                        EditTitleRequest(
+                            channel=InputChannel(row["chat_id"], row["access_hash"]), title=title
+                        )
+                    )
+                else:
+                    await self.client(EditChatTitleRequest(chat_id=row["chat_id"], title=title))
+            except ChatNotModifiedError:
+                pass
+            except (ChannelPrivateError, ChannelInvalidError, ChatAdminRequiredError, ChatIdInvalidError, PeerIdInvalidError):
+                # no longer ours
+                await self.discard(row["chat_id"])
+                continue
+            except Exception as e:
+                logger.error(f"Failed to update title of {row['chat_id']}: {e}")
+                continue
+            row["title"] = title
+            await save_owned_chat(row, self.database)
+
+
+class ProfileScheduler:
+    """
+    Keeps the profile name/bio/title and online status up to date.
+
+    Ticks when the process-wide ClockTicker passes a minute boundary (so
+    clock text changes right on time) or as soon as profile settings
+    change. Each tick renders the texts once and compares them with the
+    values last pushed: only changed fields are sent, in a single
+    UpdateProfileRequest; titles go to the chats of the OwnedChatIndex.
+    With clock_enabled the time, in one of clock_fonts, replaces the name
+    and/or bio (clock_location: name, bio or both). Online status is
+    refreshed every ONLINE_PING_INTERVAL and set offline once when turned
+    off. Settings are read from the store on every tick.
+    """
+
+    # Telegram keeps a user online for about five minutes after a ping
+    ONLINE_PING_INTERVAL = 240
+    # settings that change what a tick renders
+    WAKE_KEYS = {"profile_settings", "clock_enabled", "clock_location", "clock_bio_text", "clock_fonts", "clock_timezone"}
+
+    def __init__(self, client, store, owner_id, clock=time.time, titles=None, database=None, ticker=None):
+        self.client = client
+        self.store = store
+        self.owner_id = owner_id
+        self.titles = titles or OwnedChatIndex(client, store, database)
+        self.ticker = ticker
+        self._clock = clock
+        self._pushed = {}
+        self._pushed_title = None
+        self._online = None
+        self._last_ping = 0.0
+        self._wake = asyncio.Event()
+        self._task = None
+        store.subscribe(self._on_settings_change)
+
+    def _on_settings_change(self, keys):
+        if not self.WAKE_KEYS.isdisjoint(keys):
+            self.wake()
+
+    def wake(self):
+        self._wake.set()
+
+    def _profile(self):
+        profile = self.store.settings.get("profile_settings")
+        return profile if isinstance(profile, dict) else {}
+
+    def active(self):
+        profile = self._profile()
+        return any(
+            profile.get(key, False)
+            for key in ("name_enabled", "bio_enabled", "title_enabled", "online_enabled")
+        ) or bool(self.store.settings.get("clock_enabled")) or self._online
+
+    def _clock_fonts(self):
+        fonts = self.store.settings.get("clock_fonts") or [1]
+        if isinstance(fonts, str):
+            try:
+                fonts = json.loads(fonts)
+            except ValueError:
+                fonts = [1]
+        return fonts if isinstance(fonts, list) and fonts else [1]
+
+    def render(self, now=None):
+        """Next values of the enabled profile fields"""
+        settings = self.store.settings
+        profile = self._profile()
+        timezone = settings.get("clock_timezone") or "UTC"
+        # without a given time the clock text is the one shared for this minute
+        clock_now = now
+        if now is None:
+            now = datetime.now(pytz.timezone(timezone))
+        rendered = {}
+        for field, enabled, choices in (
+            ("last_name", "name_enabled", "names"),
+            ("about", "bio_enabled", "bios"),
+            ("title", "title_enabled", "title"),
+        ):
+            if profile.get(enabled) and profile.get(choices):
+                rendered[field] = render_dynamic_text(random.choice(profile[choices]), now=now)
+
+        if settings.get("clock_enabled"):
+            clock = clock_text(timezone, random.choice(self._clock_fonts()), clock_now)
+            location = settings.get("clock_location") or "name"
+            if location in ("name", "both"):
+                rendered["last_name"] = clock
+            if location in ("bio", "both"):
+                rendered["about"] = f"{settings.get('clock_bio_text') or ''} {clock}".strip()
+        return rendered
+
+    async def tick(self, now=None):
+        rendered = self.render(now)
+        changes = {
+            field: value
+            for field, value in rendered.items()
+            if field != "title" and self._pushed.get(field) != value
+        }
+        if changes:
+            await self.client(UpdateProfileRequest(**changes))
+            self._pushed.update(changes)
+
+        title = rendered.get("title")
+        if title is not None and title != self._pushed_title:
+            await self._update_titles(title)
+            self._pushed_title = title
+
+        await self._update_status()
+
+    async def _update_titles(self, title):
+        await self.titles.set_titles(title)
+
+    async def _update_status(self):
+        online = bool(self._profile().get("online_enabled", False))
+        now = self._clock()
+        if online:
+            if not self._online or now - self._last_ping >= self.ONLINE_PING_INTERVAL:
+                await self.client(UpdateStatusRequest(offline=False))
+                self._last_ping = now
+        elif self._online:
+            await self.client(UpdateStatusRequest(offline=True))
+        self._online = online
+
+    def _on_minute(self):
+        # idle until a setting changes when nothing is enabled
+        if self.active():
+            self.wake()
+
+    async def _run(self):
+        # profile updates yield to command replies
+        rpc_priority.set(BACKGROUND)
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Error in profile update loop: {e}")
+            self._wake.clear()
+            await self._wake.wait()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            if self.ticker is None:
+                self.ticker = get_clock_ticker()
+            self.ticker.subscribe(self._on_minute)
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def close(self):
+        if self.ticker is not None:
+            self.ticker.unsubscribe(self._on_minute)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
 
 
 async def register_profile_handlers(client, session_name, owner_id):
-    print("check")
-    @client.on(events.NewMessage('check'))
-    async def check(event):
-        print(event)
-
-    db = await get_database(session_name)
-
-    # Initialize the database
-    from models import init_db
-
-    await init_db(db)
-
-    settings = await load_settings()
+    store = await get_settings_store(session_name)
+    settings = store.settings
     if not settings:
         logger.error("Failed to load settings, cannot register profile handlers")
-        await db.close()
         return
 
     lang = settings.get("lang", "fa")
@@ -135,7 +391,7 @@ async def register_profile_handlers(client, session_name, owner_id):
             "statuses": [],
             "title": [],
         }
-        await update_settings(settings)
+        store.mark_dirty("profile_settings")
 
     # Ensure profile_settings exists with default values
     profile_settings = settings.get("profile_settings", {})
@@ -153,16 +409,19 @@ async def register_profile_handlers(client, session_name, owner_id):
         }
         settings["profile_settings"] = profile_settings
 
-    # Start the profile update loop if any feature is enabled
-    profile_settings = settings.get("profile_settings", {})
-    if (
-        profile_settings.get("name_enabled", False)
-        or profile_settings.get("bio_enabled", False)
-        or profile_settings.get("title_enabled", False)
-    ):
-        asyncio.create_task(update_profile_loop(client, settings, owner_id))
-
-    @client.on(events.NewMessage(pattern=get_command_pattern("check", lang)))
+    # Profile updates follow the settings; idle while nothing is enabled
+    scheduler = ProfileScheduler(client, store, owner_id, database=get_session_db(session_name))
+    scheduler.start()
+    dispatcher = get_dispatcher(client)
+
+    @client.on(events.Raw(types=OwnedChatIndex.UPDATE_TYPES))
+    async def track_owned_chats(update):
+        try:
+            await scheduler.titles.on_update(update)
+        except Exception as e:
+            logger.error(f"Error updating owned chats index: {e}")
+
+    @dispatcher.command("check")
     async def check(event):
         try:
             await event.reply("✅ Bot is working!")
@@ -170,20 +429,19 @@ async def register_profile_handlers(client, session_name, owner_id):
         except Exception as e:
             logger.error(f"Error in check command: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("name_toggle", lang)))
+    @dispatcher.command("name_toggle")
     async def toggle_name(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             status = event.pattern_match.group(1)
             status_value = status == "روشن" if lang == "fa" else status == "on"
 
             settings["profile_settings"]["name_enabled"] = status_value
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             status_text = (
                 "روشن"
@@ -200,45 +458,41 @@ async def register_profile_handlers(client, session_name, owner_id):
                 get_message("name_toggle", lang, status=status_text, emoji=emoji),
                 parse_mode="html",
             )
-            await db.close()
         except Exception as e:
             logger.error(f"Error toggling name: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("add_name", lang)))
+    @dispatcher.command("add_name")
     async def add_name(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             name = event.pattern_match.group(1)
 
             settings["profile_settings"]["names"].append(name)
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             await event.edit(
                 get_message("name_added", lang, name=name), parse_mode="html"
             )
-            await db.close()
         except Exception as e:
             logger.error(f"Error adding name: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("delete_name", lang)))
+    @dispatcher.command("delete_name")
     async def delete_name(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             name = event.pattern_match.group(1)
 
             if name in settings["profile_settings"]["names"]:
                 settings["profile_settings"]["names"].remove(name)
-                await update_settings(settings)
+                store.mark_dirty("profile_settings")
                 await event.edit(
                     get_message("name_deleted", lang, name=name), parse_mode="html"
                 )
@@ -247,36 +501,32 @@ async def register_profile_handlers(client, session_name, owner_id):
                     get_message("name_not_found", lang, name=name), parse_mode="html"
                 )
 
-            await db.close()
         except Exception as e:
             logger.error(f"Error deleting name: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("clear_names", lang)))
+    @dispatcher.command("clear_names")
     async def clear_names(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             settings["profile_settings"]["names"] = []
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             await event.edit(get_message("names_cleared", lang), parse_mode="html")
-            await db.close()
         except Exception as e:
             logger.error(f"Error clearing names: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("list_names", lang)))
+    @dispatcher.command("list_names")
     async def list_names(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             names = settings["profile_settings"]["names"]
 
             if names:
@@ -289,24 +539,22 @@ async def register_profile_handlers(client, session_name, owner_id):
             else:
                 await event.edit(get_message("no_names", lang), parse_mode="html")
 
-            await db.close()
         except Exception as e:
             logger.error(f"Error listing names: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("bio_toggle", lang)))
+    @dispatcher.command("bio_toggle")
     async def toggle_bio(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             status = event.pattern_match.group(1)
             status_value = status == "روشن" if lang == "fa" else status == "on"
 
             settings["profile_settings"]["bio_enabled"] = status_value
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             status_text = (
                 "روشن"
@@ -323,43 +571,39 @@ async def register_profile_handlers(client, session_name, owner_id):
                 get_message("bio_toggle", lang, status=status_text, emoji=emoji),
                 parse_mode="html",
             )
-            await db.close()
         except Exception as e:
             logger.error(f"Error toggling bio: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("add_bio", lang)))
+    @dispatcher.command("add_bio")
     async def add_bio(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             bio = event.pattern_match.group(1)
 
             settings["profile_settings"]["bios"].append(bio)
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             await event.edit(get_message("bio_added", lang, bio=bio), parse_mode="html")
-            await db.close()
         except Exception as e:
             logger.error(f"Error adding bio: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("delete_bio", lang)))
+    @dispatcher.command("delete_bio")
     async def delete_bio(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             bio = event.pattern_match.group(1)
 
             if bio in settings["profile_settings"]["bios"]:
                 settings["profile_settings"]["bios"].remove(bio)
-                await update_settings(settings)
+                store.mark_dirty("profile_settings")
                 await event.edit(
                     get_message("bio_deleted", lang, bio=bio), parse_mode="html"
                 )
@@ -368,36 +612,32 @@ async def register_profile_handlers(client, session_name, owner_id):
                     get_message("bio_not_found", lang, bio=bio), parse_mode="html"
                 )
 
-            await db.close()
         except Exception as e:
             logger.error(f"Error deleting bio: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("clear_bios", lang)))
+    @dispatcher.command("clear_bios")
     async def clear_bios(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             settings["profile_settings"]["bios"] = []
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             await event.edit(get_message("bios_cleared", lang), parse_mode="html")
-            await db.close()
         except Exception as e:
             logger.error(f"Error clearing bios: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("list_bios", lang)))
+    @dispatcher.command("list_bios")
     async def list_bios(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             bios = settings["profile_settings"]["bios"]
 
             if bios:
@@ -408,24 +648,22 @@ async def register_profile_handlers(client, session_name, owner_id):
             else:
                 await event.edit(get_message("no_bios", lang), parse_mode="html")
 
-            await db.close()
         except Exception as e:
             logger.error(f"Error listing bios: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("status_toggle", lang)))
+    @dispatcher.command("status_toggle")
     async def toggle_status(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             status = event.pattern_match.group(1)
             status_value = status == "روشن" if lang == "fa" else status == "on"
 
             settings["profile_settings"]["status_enabled"] = status_value
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             status_text = (
                 "روشن"
@@ -442,45 +680,41 @@ async def register_profile_handlers(client, session_name, owner_id):
                 get_message("status_toggle", lang, status=status_text, emoji=emoji),
                 parse_mode="html",
             )
-            await db.close()
         except Exception as e:
             logger.error(f"Error toggling status: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("add_status", lang)))
+    @dispatcher.command("add_status")
     async def add_status(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             status = event.pattern_match.group(1)
 
             settings["profile_settings"]["statuses"].append(status)
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             await event.edit(
                 get_message("status_added", lang, status=status), parse_mode="html"
             )
-            await db.close()
         except Exception as e:
             logger.error(f"Error adding status: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("delete_status", lang)))
+    @dispatcher.command("delete_status")
     async def delete_status(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             status = event.pattern_match.group(1)
 
             if status in settings["profile_settings"]["statuses"]:
                 settings["profile_settings"]["statuses"].remove(status)
-                await update_settings(settings)
+                store.mark_dirty("profile_settings")
                 await event.edit(
                     get_message("status_deleted", lang, status=status),
                     parse_mode="html",
@@ -491,36 +725,32 @@ async def register_profile_handlers(client, session_name, owner_id):
                     parse_mode="html",
                 )
 
-            await db.close()
         except Exception as e:
             logger.error(f"Error deleting status: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("clear_statuses", lang)))
+    @dispatcher.command("clear_statuses")
     async def clear_statuses(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             settings["profile_settings"]["statuses"] = []
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             await event.edit(get_message("statuses_cleared", lang), parse_mode="html")
-            await db.close()
         except Exception as e:
             logger.error(f"Error clearing statuses: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("list_statuses", lang)))
+    @dispatcher.command("list_statuses")
     async def list_statuses(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             statuses = settings["profile_settings"]["statuses"]
 
             if statuses:
@@ -534,25 +764,23 @@ async def register_profile_handlers(client, session_name, owner_id):
             else:
                 await event.edit(get_message("no_statuses", lang), parse_mode="html")
 
-            await db.close()
         except Exception as e:
             logger.error(f"Error listing statuses: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("online_toggle", lang)))
+    @dispatcher.command("online_toggle")
     async def toggle_online(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             status = event.pattern_match.group(1)
             status_value = status == "روشن" if lang == "fa" else status == "on"
 
             settings["profile_settings"]["online_enabled"] = status_value
-            await client(UpdateStatusRequest(offline=not status_value))
-            await update_settings(settings)
+            # the profile scheduler sends the status change
+            store.mark_dirty("profile_settings")
 
             status_text = (
                 "روشن"
@@ -569,24 +797,22 @@ async def register_profile_handlers(client, session_name, owner_id):
                 get_message("online_toggle", lang, status=status_text, emoji=emoji),
                 parse_mode="html",
             )
-            await db.close()
         except Exception as e:
             logger.error(f"Error toggling online status: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("title_toggle", lang)))
+    @dispatcher.command("title_toggle")
     async def toggle_title(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             status = event.pattern_match.group(1)
             status_value = status == "روشن" if lang == "fa" else status == "on"
 
             settings["profile_settings"]["title_enabled"] = status_value
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             status_text = (
                 "روشن"
@@ -603,45 +829,41 @@ async def register_profile_handlers(client, session_name, owner_id):
                 get_message("title_toggle", lang, status=status_text, emoji=emoji),
                 parse_mode="html",
             )
-            await db.close()
         except Exception as e:
             logger.error(f"Error toggling title: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("add_title", lang)))
+    @dispatcher.command("add_title")
     async def add_title(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             title = event.pattern_match.group(1)
 
             settings["profile_settings"]["title"].append(title)
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             await event.edit(
                 get_message("title_added", lang, title=title), parse_mode="html"
             )
-            await db.close()
         except Exception as e:
             logger.error(f"Error adding title: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("delete_title", lang)))
+    @dispatcher.command("delete_title")
     async def delete_title(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             title = event.pattern_match.group(1)
 
             if title in settings["profile_settings"]["title"]:
                 settings["profile_settings"]["title"].remove(title)
-                await update_settings(settings)
+                store.mark_dirty("profile_settings")
                 await event.edit(
                     get_message("title_deleted", lang, title=title), parse_mode="html"
                 )
@@ -650,36 +872,32 @@ async def register_profile_handlers(client, session_name, owner_id):
                     get_message("title_not_found", lang, title=title), parse_mode="html"
                 )
 
-            await db.close()
         except Exception as e:
             logger.error(f"Error deleting title: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("clear_titles", lang)))
+    @dispatcher.command("clear_titles")
     async def clear_titles(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             settings["profile_settings"]["title"] = []
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
 
             await event.edit(get_message("titles_cleared", lang), parse_mode="html")
-            await db.close()
         except Exception as e:
             logger.error(f"Error clearing titles: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("list_titles", lang)))
+    @dispatcher.command("list_titles")
     async def list_titles(event):
         try:
             if event.sender_id != owner_id:
                 await event.edit(get_message("unauthorized", lang), parse_mode="html")
                 return
 
-            db = await get_database(session_name)
-            settings = await load_settings()
+            settings = store.settings
             titles = settings["profile_settings"]["title"]
 
             if titles:
@@ -693,11 +911,10 @@ async def register_profile_handlers(client, session_name, owner_id):
             else:
                 await event.edit(get_message("no_titles", lang), parse_mode="html")
 
-            await db.close()
         except Exception as e:
             logger.error(f"Error listing titles: {e}")
 
-    @client.on(events.NewMessage(pattern=get_command_pattern("delete_profile", lang)))
+    @dispatcher.command("delete_profile")
     async def delete_profile(event):
         try:
             if event.sender_id != owner_id:
@@ -705,7 +922,7 @@ async def register_profile_handlers(client, session_name, owner_id):
                 return
 
             # Clear all profile settings
-            settings = await load_settings()
+            settings = store.settings
             settings["profile_settings"] = {
                 "name_enabled": False,
                 "bio_enabled": False,
@@ -717,9 +934,9 @@ async def register_profile_handlers(client, session_name, owner_id):
                 "statuses": [],
                 "title": [],
             }
-            await update_settings(settings)
+            store.mark_dirty("profile_settings")
             await event.edit(get_message("profile_deleted", lang), parse_mode="html")
         except Exception as e:
             logger.error(f"Error deleting profile: {e}")
 
-    await db.close()
+    return scheduler
@@ -1,24 +1,72 @@
 import asyncio
 import logging
-import random
-import re
-from datetime import datetime
 
 import pytz
+from cache import LRUCache
 from models import get_database, load_settings, update_settings
-from ormax_models import init_db as init_ormax_db
-from telethon import events
+from ormax_models import add_warn as db_add_warn
+from ormax_models import get_rank as db_get_rank
+from ormax_models import get_warns as db_get_warns
+from ormax_models import list_ranks as db_list_ranks
+from ormax_models import reset_warns as db_reset_warns
+from ormax_models import set_rank as db_set_rank
 from telethon.errors import FloodWaitError
-from utils import get_command_pattern, load_json, send_message
+from template import compile_template, render_template
+from dispatcher import get_dispatcher
+from utils import load_json, resolve_users, send_message
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+
+class RankWarnCache:
+    """
+    LRU cache in front of the ranks and warns tables, for the per-message
+    RANK/WARNS variables. Writes go to the table and the cache together.
+    """
+
+    def __init__(self, database=None, maxsize=4096):
+        self.database = database
+        self._ranks = LRUCache(maxsize)
+        self._warns = LRUCache(maxsize)
+
+    async def get_rank(self, chat_id, user_id):
+        key = (chat_id, user_id)
+        rank = self._ranks.get(key, _MISSING)
+        if rank is _MISSING:
+            rank = await db_get_rank(chat_id, user_id, self.database)
+            self._ranks.set(key, rank)
+        return rank
+
+    async def set_rank(self, chat_id, user_id, rank):
+        await db_set_rank(chat_id, user_id, rank, self.database)
+        self._ranks.set((chat_id, user_id), rank)
+
+    async def list_ranks(self, chat_id):
+        return await db_list_ranks(chat_id, self.database)
+
+    async def get_warns(self, chat_id, user_id):
+        key = (chat_id, user_id)
+        count = self._warns.get(key)
+        if count is None:
+            count = await db_get_warns(chat_id, user_id, self.database)
+            self._warns.set(key, count)
+        return count
+
+    async def add_warn(self, chat_id, user_id, amount=1):
+        count = await db_add_warn(chat_id, user_id, amount, self.database)
+        self._warns.set((chat_id, user_id), count)
+        return count
+
+    async def reset_warns(self, chat_id, user_id):
+        await db_reset_warns(chat_id, user_id, self.database)
+        self._warns.set((chat_id, user_id), 0)
+
 
 async def register_vars_handlers(client, session_name, owner_id):
-    # Initialize Ormax database
-    await init_ormax_db()
     db = await get_database(session_name)
-    settings = await load_settings()
+    settings = await load_settings(db)
     if not settings:
         logger.error("Failed to load settings for vars handlers")
         return
@@ -30,76 +78,49 @@ async def register_vars_handlers(client, session_name, owner_id):
     def get_message(key, **kwargs):
         return messages.get(lang, {}).get("vars", {}).get(key, key).format(**kwargs)
 
-    # Note: These tables are not migrated to Ormax yet
-    # They will continue to use the old database connection
-    pass
+    # مقام‌ها و اخطارها (جدول‌های ranks و warns)
+    records = RankWarnCache(db)
+    dispatcher = get_dispatcher(client)
 
     # متغیرهای پیش‌فرض
     if "vars" not in settings:
         settings["vars"] = {"timezone": "Asia/Tehran"}  # منطقه زمانی پیش‌فرض
-        await update_settings(settings)
-
-    # لیست قلب‌های تصادفی
-    hearts = ["❤️", "🧡", "💛", "💚", "💙", "💜", "💓", "💞", "💕", "💗"]
+        await update_settings(settings, db)
 
     # تابع جایگزینی متغیرها
-    async def replace_vars(text, event):
+    async def replace_vars(template, event):
+        # RANK و WARNS مربوط به کاربر ریپلای‌شده هستن، وگرنه خود فرستنده
+        target = {}
+
+        async def target_user():
+            if "id" not in target:
+                target["id"] = event.sender_id
+                if event.message.is_reply:
+                    reply = await event.get_reply_message()
+                    if reply and reply.sender_id:
+                        target["id"] = reply.sender_id
+            return target["id"]
+
+        async def resolve_rank():
+            rank = await records.get_rank(event.chat_id, await target_user())
+            return rank if rank else get_message("no_rank")
+
+        async def resolve_warns():
+            return await records.get_warns(event.chat_id, await target_user())
+
         try:
-            user = await event.get_sender()
-            timezone = settings["vars"].get("timezone", "Asia/Tehran")
-            tz = pytz.timezone(timezone)
-            now = datetime.now(tz)
-
-            # متغیرهای زمانی
-            replacements = {
-                "STRDAY": now.strftime("%A"),  # روز به حروف
-                "STRMONTH": now.strftime("%B"),  # ماه به حروف
-                "YEAR": str(now.year),  # سال
-                "MONTH": str(now.month).zfill(2),  # ماه به عدد
-                "DATE": now.strftime("%Y/%m/%d"),  # تاریخ کامل
-                "TIME": now.strftime("%H:%M:%S"),  # زمان کامل
-                "SEC": str(now.second).zfill(2),  # ثانیه
-                "MIN": str(now.minute).zfill(2),  # دقیقه
-                "HOUR": str(now.hour).zfill(2),  # ساعت
-                "DAY": str(now.day).zfill(2),  # روز به عدد
-                "ID": str(user.id),  # شناسه کاربر
-                "USERNAME": user.username or "None",  # نام کاربری
-                "NAME": user.first_name or "Unknown",  # نام کاربر
-                "HEART": random.choice(hearts),  # قلب تصادفی
-            }
-
-            # متغیر RANDNUM
-            randnum_matches = re.findall(r"RANDNUM(\d+)-(\d+)", text)
-            for start, end in randnum_matches:
-                try:
-                    num = random.randint(int(start), int(end))
-                    text = text.replace(f"RANDNUM{start}-{end}", str(num))
-                except ValueError:
-                    continue
-
-            # متغیر RANK
-            if "RANK" in text:
-                # Note: ranks table operations are not migrated to Ormax yet
-                rank = None
-                text = text.replace("RANK", rank if rank else get_message("no_rank"))
-
-            # متغیر WARNS
-            if "WARNS" in text:
-                # Note: warns table operations are not migrated to Ormax yet
-                warn_count = None
-                text = text.replace("WARNS", str(warn_count if warn_count else 0))
-
-            # جایگزینی سایر متغیرها
-            for key, value in replacements.items():
-                text = text.replace(key, value)
-
-            return text
+            return await render_template(
+                template,
+                timezone=settings["vars"].get("timezone", "Asia/Tehran"),
+                get_sender=event.get_sender,
+                resolvers={"RANK": resolve_rank, "WARNS": resolve_warns},
+            )
         except Exception as e:
             logger.error(f"Error replacing vars: {e}")
-            return text
+            return event.text
 
     # نمایش لیست مناطق زمانی
-    @client.on(events.NewMessage(pattern=get_command_pattern("list_timezones", lang)))
+    @dispatcher.command("list_timezones")
     async def handle_list_timezones(event):
         try:
             if event.sender_id != owner_id:
@@ -115,7 +136,7 @@ async def register_vars_handlers(client, session_name, owner_id):
             await send_message(event, get_message("error_occurred"))
 
     # تنظیم منطقه زمانی
-    @client.on(events.NewMessage(pattern=get_command_pattern("set_timezone", lang)))
+    @dispatcher.command("set_timezone")
     async def handle_set_timezone(event):
         try:
             if event.sender_id != owner_id:
@@ -126,7 +147,7 @@ async def register_vars_handlers(client, session_name, owner_id):
                 await send_message(event, get_message("invalid_timezone"))
                 return
             settings["vars"]["timezone"] = timezone
-            await update_settings(settings)
+            await update_settings(settings, db)
             # Note: vars_settings table operations are not migrated to Ormax yet
             await send_message(event, get_message("timezone_set", timezone=timezone))
         except Exception as e:
@@ -134,7 +155,7 @@ async def register_vars_handlers(client, session_name, owner_id):
             await send_message(event, get_message("error_occurred"))
 
     # تنظیم مقام
-    @client.on(events.NewMessage(pattern=get_command_pattern("set_rank", lang)))
+    @dispatcher.command("set_rank")
     async def handle_set_rank(event):
         try:
             if event.sender_id != owner_id:
@@ -149,8 +170,7 @@ async def register_vars_handlers(client, session_name, owner_id):
                 return
             reply_msg = await event.get_reply_message()
             user_id = reply_msg.sender_id
-            # Note: ranks table operations are not migrated to Ormax yet
-            pass
+            await records.set_rank(event.chat_id, user_id, rank)
             await send_message(
                 event, get_message("rank_set", user_id=user_id, rank=rank)
             )
@@ -161,21 +181,22 @@ async def register_vars_handlers(client, session_name, owner_id):
             await send_message(event, get_message("error_occurred"))
 
     # نمایش لیست مقام‌ها
-    @client.on(events.NewMessage(pattern=get_command_pattern("list_ranks", lang)))
+    @dispatcher.command("list_ranks")
     async def handle_list_ranks(event):
         try:
             if event.sender_id != owner_id:
                 await send_message(event, get_message("unauthorized"))
                 return
-            # Note: ranks table operations are not migrated to Ormax yet
-            ranks = []
+            ranks = await records.list_ranks(event.chat_id)
             if not ranks:
                 await send_message(event, get_message("no_ranks"))
                 return
+            # one GetUsersRequest for all ranked users
+            users = await resolve_users(client, [user_id for user_id, _ in ranks])
             response = get_message("rank_list") + "\n"
             for user_id, rank in ranks:
-                user = await client.get_entity(user_id)
-                response += f"@{user.username or user_id}: {rank}\n"
+                user = users.get(user_id)
+                response += f"@{(user.username if user else None) or user_id}: {rank}\n"
             await send_message(event, response)
         except FloodWaitError as e:
             await send_message(event, get_message("flood_wait", seconds=e.seconds))
@@ -184,44 +205,16 @@ async def register_vars_handlers(client, session_name, owner_id):
             await send_message(event, get_message("error_occurred"))
 
     # تابع عمومی برای پردازش متغیرها در پیام‌ها
-    @client.on(events.NewMessage)
+    # فقط پیام‌های owner که دستور نیستن به اینجا می‌رسن
+    @dispatcher.hook(incoming=False)
     async def handle_message_with_vars(event):
         try:
-            if event.sender_id != owner_id:
-                return
-
-            # بررسی اینکه آیا پیام یک command است یا نه
-            from utils import is_command_message
-
-            if await is_command_message(event.text or "", lang):
-                return
-
-            text = event.text
-            if any(
-                var in text
-                for var in [
-                    "STRDAY",
-                    "STRMONTH",
-                    "YEAR",
-                    "MONTH",
-                    "DATE",
-                    "TIME",
-                    "SEC",
-                    "MIN",
-                    "HOUR",
-                    "DAY",
-                    "ID",
-                    "USERNAME",
-                    "NAME",
-                    "HEART",
-                    "RANDNUM",
-                    "RANK",
-                    "WARNS",
-                ]
-            ):
-                processed_text = await replace_vars(text, event)
+            # قالب کامپایل‌شده؛ None یعنی متغیری در متن نیست
+            template = compile_template(event.text)
+            if template is not None:
+                processed_text = await replace_vars(template, event)
                 await send_message(event, processed_text)
         except Exception as e:
             logger.error(f"Error processing message with vars: {e}")
 
-    # db.close() not needed with Ormax
+    # the session database stays open until shutdown
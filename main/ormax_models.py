@@ -1,8 +1,8 @@
 import asyncio
-from ormax import Database, Model
+from ormax import Database, DoesNotExist, Model
 from ormax.fields import AutoField, CharField, BooleanField, IntegerField, TextField, JSONField, DateTimeField
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import aiosqlite
 import os
 
@@ -36,7 +36,7 @@ class Settings(Model):
 
 class MuteList(Model):
     id = AutoField()
-    user_id = IntegerField()
+    user_id = IntegerField(index=True)
     mute_until = IntegerField(default=0)
 
     class Meta:
@@ -44,7 +44,7 @@ class MuteList(Model):
 
 class SpamProtection(Model):
     id = AutoField()
-    user_id = IntegerField()
+    user_id = IntegerField(index=True)
     messages = JSONField(default=None)
     mute_until = IntegerField(default=0)
     violations = IntegerField(default=0)
@@ -52,6 +52,135 @@ class SpamProtection(Model):
     class Meta:
         table_name = 'spam_protection'
 
+class ChatSetting(Model):
+    """One value of a per-chat (or global, chat_id=0) setting"""
+    id = AutoField()
+    setting_key = CharField(max_length=64)
+    chat_id = IntegerField(default=0)
+    value = TextField(default='null')
+
+    class Meta:
+        table_name = 'chat_settings'
+
+class OwnedChat(Model):
+    """A group or channel created by the account (used for title rotation)"""
+    id = AutoField()
+    chat_id = IntegerField()
+    access_hash = IntegerField(default=0)
+    is_channel = BooleanField(default=False)
+    title = TextField(default='')
+
+    class Meta:
+        table_name = 'owned_chats'
+
+class Rank(Model):
+    """Rank (title) given to a user in a chat"""
+    id = AutoField()
+    chat_id = IntegerField()
+    user_id = IntegerField()
+    rank = CharField(max_length=128, default='')
+
+    class Meta:
+        table_name = 'ranks'
+
+class Warn(Model):
+    """Warning count of a user in a chat"""
+    id = AutoField()
+    chat_id = IntegerField()
+    user_id = IntegerField()
+    count = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'warns'
+
+class PendingDeletion(Model):
+    """A message to delete at ``due`` (unix time), see delete_queue.py"""
+    id = AutoField()
+    chat_id = IntegerField()
+    message_id = IntegerField()
+    due = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'pending_deletions'
+
+# chat_id used for settings that are not bound to a chat
+GLOBAL_CHAT_ID = 0
+
+# Every model of the schema, in creation order
+MODELS = (Settings, MuteList, SpamProtection, ChatSetting, OwnedChat, Rank, Warn, PendingDeletion)
+
+class ModelSet:
+    """
+    The models bound to one Database.
+
+    ormax binds a model class to a single Database, so every session gets
+    subclasses of the models above registered on its own connection.
+    """
+
+    def __init__(self, database: Database, bind_copies: bool = True):
+        self.db = database
+        for model in MODELS:
+            if bind_copies:
+                model = type(model.__name__, (model,), {'__module__': __name__})
+            database.register_model(model)
+            setattr(self, model.__name__, model)
+
+_default_models: Optional[ModelSet] = None
+
+def get_models(database=None) -> ModelSet:
+    """Models of a SessionDatabase, or the module-level ones bound to ``db``"""
+    global _default_models
+    if database is not None:
+        return database.models
+    if _default_models is None or _default_models.db is not db:
+        _default_models = ModelSet(db, bind_copies=False)
+    return _default_models
+
+async def setup_schema(models: ModelSet):
+    """Create tables and indexes and the default settings row"""
+    await models.db.create_tables()
+    await models.db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_settings_key_chat "
+        "ON chat_settings (setting_key, chat_id)"
+    )
+    await models.db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_owned_chats_chat ON owned_chats (chat_id)"
+    )
+    await models.db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_ranks_chat_user ON ranks (chat_id, user_id)"
+    )
+    await models.db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_warns_chat_user ON warns (chat_id, user_id)"
+    )
+    await models.db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_pending_deletions_message "
+        "ON pending_deletions (chat_id, message_id)"
+    )
+    # Create default settings if not exists
+    try:
+        await models.Settings.objects().get(id=1)
+    except DoesNotExist:
+        await models.Settings.create(
+            id=1,
+            lang='fa',
+            welcome_enabled=False,
+            welcome_text='',
+            welcome_delete_time=0,
+            clock_enabled=False,
+            clock_location='name',
+            clock_bio_text='',
+            clock_fonts='[1]',
+            clock_timezone='Asia/Tehran',
+            action_enabled=False,
+            action_types='{}',
+            text_format_enabled=False,
+            text_formats='{}',
+            locks='{}',
+            antilog_enabled=False,
+            first_comment_enabled=False,
+            first_comment_text=''
+        )
+
 async def init_db():
     """Initialize the database and create tables"""
     try:
@@ -89,10 +218,7 @@ async def init_db():
         
         print(f"Connecting to database: {final_db_path}")
         await db.connect()
-        db.register_model(Settings)
-        db.register_model(MuteList)
-        db.register_model(SpamProtection)
-        await db.create_tables()
+        await setup_schema(get_models())
         print("Database initialized successfully")
     except Exception as e:
         print(f"Error initializing database: {e}")
@@ -100,37 +226,13 @@ async def init_db():
         traceback.print_exc()
         raise
     
-    # Create default settings if not exists
-    try:
-        settings = await Settings.objects().get(id=1)
-    except:
-        settings = await Settings.create(
-            id=1,
-            lang='fa',
-            welcome_enabled=False,
-            welcome_text='',
-            welcome_delete_time=0,
-            clock_enabled=False,
-            clock_location='name',
-            clock_bio_text='',
-            clock_fonts='[1]',
-            clock_timezone='Asia/Tehran',
-            action_enabled=False,
-            action_types='{}',
-            text_format_enabled=False,
-            text_formats='{}',
-            locks='{}',
-            antilog_enabled=False,
-            first_comment_enabled=False,
-            first_comment_text=''
-        )
-    
     return db
 
-async def load_settings() -> Dict[str, Any]:
+async def load_settings(database=None) -> Dict[str, Any]:
     """Load settings from database"""
+    models = get_models(database)
     try:
-        settings = await Settings.objects().get(id=1)
+        settings = await models.Settings.objects().get(id=1)
         return {
             'id': settings.id,
             'lang': settings.lang,
@@ -175,10 +277,11 @@ async def load_settings() -> Dict[str, Any]:
             'first_comment_text': ''
         }
 
-async def update_settings(settings_data: Dict[str, Any]):
+async def update_settings(settings_data: Dict[str, Any], database=None):
     """Update settings in database"""
+    models = get_models(database)
     try:
-        settings = await Settings.objects().get(id=1)
+        settings = await models.Settings.objects().get(id=1)
         # Update all fields
         settings.lang = settings_data['lang']
         settings.welcome_enabled = settings_data['welcome_enabled']
@@ -204,10 +307,90 @@ async def update_settings(settings_data: Dict[str, Any]):
         print(f"Error updating settings: {e}")
         return False
 
-async def load_spam_protection(user_id: int) -> Dict[str, Any]:
+# Settings columns that can be written individually
+SETTINGS_COLUMNS = (
+    'lang', 'welcome_enabled', 'welcome_text', 'welcome_delete_time',
+    'clock_enabled', 'clock_location', 'clock_bio_text', 'clock_fonts',
+    'clock_timezone', 'action_enabled', 'action_types', 'text_format_enabled',
+    'text_formats', 'locks', 'antilog_enabled', 'first_comment_enabled',
+    'first_comment_text',
+)
+
+async def update_settings_fields(fields: Dict[str, Any], database=None) -> bool:
+    """Update only the given settings columns"""
+    models = get_models(database)
+    values = {key: value for key, value in fields.items() if key in SETTINGS_COLUMNS}
+    if not values:
+        return True
+    try:
+        await models.Settings.objects().filter(id=1).update(**values)
+        return True
+    except Exception as e:
+        print(f"Error updating settings fields: {e}")
+        return False
+
+async def load_chat_settings(database=None) -> Dict[str, Dict[int, Any]]:
+    """Load all per-chat setting rows as {setting_key: {chat_id: value}}"""
+    models = get_models(database)
+    result: Dict[str, Dict[int, Any]] = {}
+    rows = await models.db.fetch_all("SELECT setting_key, chat_id, value FROM chat_settings")
+    for row in rows:
+        try:
+            value = json.loads(row['value'])
+        except (TypeError, ValueError):
+            continue
+        result.setdefault(row['setting_key'], {})[int(row['chat_id'])] = value
+    return result
+
+async def get_chat_setting(setting_key: str, chat_id: int = GLOBAL_CHAT_ID, default: Any = None, database=None) -> Any:
+    """Point lookup of one setting value for a chat"""
+    models = get_models(database)
+    row = await models.db.fetch_one(
+        "SELECT value FROM chat_settings WHERE setting_key = ? AND chat_id = ?",
+        (setting_key, int(chat_id)),
+    )
+    if row is None:
+        return default
+    try:
+        return json.loads(row['value'])
+    except (TypeError, ValueError):
+        return default
+
+async def upsert_chat_settings(rows, batch_size: int = 300, database=None) -> int:
+    """
+    Insert or update (setting_key, chat_id, value) rows in batches.
+    Each batch is a single multi-row INSERT ... ON CONFLICT statement.
+    """
+    models = get_models(database)
+    rows = [(key, int(chat_id), json.dumps(value, ensure_ascii=False)) for key, chat_id, value in rows]
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        placeholders = ", ".join(["(?, ?, ?)"] * len(batch))
+        params = tuple(item for row in batch for item in row)
+        await models.db.execute(
+            "INSERT INTO chat_settings (setting_key, chat_id, value) "
+            f"VALUES {placeholders} "
+            "ON CONFLICT(setting_key, chat_id) DO UPDATE SET value = excluded.value",
+            params,
+        )
+    return len(rows)
+
+async def delete_chat_settings(keys, batch_size: int = 300, database=None) -> int:
+    """Delete (setting_key, chat_id) rows in batches"""
+    models = get_models(database)
+    keys = [(key, int(chat_id)) for key, chat_id in keys]
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        conditions = " OR ".join(["(setting_key = ? AND chat_id = ?)"] * len(batch))
+        params = tuple(item for key in batch for item in key)
+        await models.db.execute(f"DELETE FROM chat_settings WHERE {conditions}", params)
+    return len(keys)
+
+async def load_spam_protection(user_id: int, database=None) -> Dict[str, Any]:
     """Load spam protection data for a user"""
+    models = get_models(database)
     try:
-        spam_data = await SpamProtection.objects().get(user_id=user_id)
+        spam_data = await models.SpamProtection.objects().get(user_id=user_id)
         return {
             'id': spam_data.id,
             'user_id': spam_data.user_id,
@@ -215,9 +398,9 @@ async def load_spam_protection(user_id: int) -> Dict[str, Any]:
             'mute_until': spam_data.mute_until,
             'violations': spam_data.violations
         }
-    except:
+    except DoesNotExist:
         # Create new spam protection entry
-        spam_data = await SpamProtection.create(
+        spam_data = await models.SpamProtection.create(
             user_id=user_id,
             messages='[]',
             mute_until=0,
@@ -231,20 +414,192 @@ async def load_spam_protection(user_id: int) -> Dict[str, Any]:
             'violations': spam_data.violations
         }
 
-async def update_spam_protection(spam_data: Dict[str, Any]):
+async def update_spam_protection(spam_data: Dict[str, Any], database=None):
     """Update spam protection data"""
+    models = get_models(database)
     try:
         # Try to get existing record
-        spam_record = await SpamProtection.objects().get(user_id=spam_data['user_id'])
+        spam_record = await models.SpamProtection.objects().get(user_id=spam_data['user_id'])
         spam_record.messages = json.dumps(spam_data['messages'])
         spam_record.mute_until = spam_data['mute_until']
         spam_record.violations = spam_data['violations']
         await spam_record.save()
-    except:
+    except DoesNotExist:
         # Create new record
-        await SpamProtection.create(
+        await models.SpamProtection.create(
             user_id=spam_data['user_id'],
             messages=json.dumps(spam_data['messages']),
             mute_until=spam_data['mute_until'],
             violations=spam_data['violations']
-        )
\ No newline at end of file
+        )
+
+async def load_spam_states(now: int, database=None) -> Dict[int, Dict[str, int]]:
+    """Load users that have violations or an active mute"""
+    models = get_models(database)
+    states: Dict[int, Dict[str, int]] = {}
+    rows = await models.db.fetch_all(
+        "SELECT user_id, violations, mute_until FROM spam_protection "
+        "WHERE violations > 0 OR mute_until > ?",
+        (now,),
+    )
+    for row in rows:
+        states[int(row['user_id'])] = {
+            'violations': row['violations'] or 0,
+            'mute_until': row['mute_until'] or 0,
+        }
+    rows = await models.db.fetch_all(
+        "SELECT user_id, mute_until FROM mute_list WHERE mute_until > ?", (now,)
+    )
+    for row in rows:
+        state = states.setdefault(int(row['user_id']), {'violations': 0, 'mute_until': 0})
+        state['mute_until'] = max(state['mute_until'], row['mute_until'] or 0)
+    return states
+
+async def save_spam_states(states: Dict[int, Dict[str, int]], now: int, database=None):
+    """Checkpoint violation counters and mute deadlines of the given users"""
+    models = get_models(database)
+    async with models.db.transaction():
+        for user_id, state in states.items():
+            updated = await models.SpamProtection.objects().filter(user_id=user_id).update(
+                violations=state['violations'], mute_until=state['mute_until']
+            )
+            if not updated:
+                await models.SpamProtection.create(
+                    user_id=user_id,
+                    messages='[]',
+                    mute_until=state['mute_until'],
+                    violations=state['violations']
+                )
+            if state['mute_until'] > now:
+                updated = await models.MuteList.objects().filter(user_id=user_id).update(
+                    mute_until=state['mute_until']
+                )
+                if not updated:
+                    await models.MuteList.create(user_id=user_id, mute_until=state['mute_until'])
+            else:
+                await models.MuteList.objects().filter(user_id=user_id).delete()
+
+async def load_owned_chats(database=None) -> List[Dict[str, Any]]:
+    """All indexed owned chats"""
+    models = get_models(database)
+    rows = await models.db.fetch_all(
+        "SELECT chat_id, access_hash, is_channel, title FROM owned_chats ORDER BY chat_id"
+    )
+    return [
+        {
+            'chat_id': int(row['chat_id']),
+            'access_hash': int(row['access_hash'] or 0),
+            'is_channel': bool(row['is_channel']),
+            'title': row['title'] or '',
+        }
+        for row in rows
+    ]
+
+async def save_owned_chat(chat: Dict[str, Any], database=None):
+    """Insert or update one owned chat"""
+    models = get_models(database)
+    await models.db.execute(
+        "INSERT INTO owned_chats (chat_id, access_hash, is_channel, title) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(chat_id) DO UPDATE SET access_hash = excluded.access_hash, "
+        "is_channel = excluded.is_channel, title = excluded.title",
+        (int(chat['chat_id']), int(chat.get('access_hash') or 0), int(bool(chat.get('is_channel'))), chat.get('title') or ''),
+    )
+
+async def delete_owned_chat(chat_id: int, database=None):
+    models = get_models(database)
+    await models.db.execute("DELETE FROM owned_chats WHERE chat_id = ?", (int(chat_id),))
+
+async def replace_owned_chats(chats, database=None):
+    """Replace the whole index (after a full dialog scan)"""
+    models = get_models(database)
+    async with models.db.transaction():
+        await models.db.execute("DELETE FROM owned_chats")
+        for chat in chats:
+            await save_owned_chat(chat, database)
+
+async def get_rank(chat_id: int, user_id: int, database=None) -> Optional[str]:
+    """Rank of a user in a chat, None if not set"""
+    models = get_models(database)
+    row = await models.db.fetch_one(
+        "SELECT rank FROM ranks WHERE chat_id = ? AND user_id = ?", (int(chat_id), int(user_id))
+    )
+    return row['rank'] if row else None
+
+async def set_rank(chat_id: int, user_id: int, rank: str, database=None):
+    models = get_models(database)
+    await models.db.execute(
+        "INSERT INTO ranks (chat_id, user_id, rank) VALUES (?, ?, ?) "
+        "ON CONFLICT(chat_id, user_id) DO UPDATE SET rank = excluded.rank",
+        (int(chat_id), int(user_id), rank),
+    )
+
+async def delete_rank(chat_id: int, user_id: int, database=None):
+    models = get_models(database)
+    await models.db.execute(
+        "DELETE FROM ranks WHERE chat_id = ? AND user_id = ?", (int(chat_id), int(user_id))
+    )
+
+async def list_ranks(chat_id: int, database=None) -> List[tuple]:
+    """(user_id, rank) pairs of a chat"""
+    models = get_models(database)
+    rows = await models.db.fetch_all(
+        "SELECT user_id, rank FROM ranks WHERE chat_id = ? ORDER BY id", (int(chat_id),)
+    )
+    return [(int(row['user_id']), row['rank']) for row in rows]
+
+async def get_warns(chat_id: int, user_id: int, database=None) -> int:
+    models = get_models(database)
+    row = await models.db.fetch_one(
+        "SELECT count FROM warns WHERE chat_id = ? AND user_id = ?", (int(chat_id), int(user_id))
+    )
+    return int(row['count']) if row else 0
+
+async def add_warn(chat_id: int, user_id: int, amount: int = 1, database=None) -> int:
+    """Add to a user's warnings and return the new count"""
+    models = get_models(database)
+    await models.db.execute(
+        "INSERT INTO warns (chat_id, user_id, count) VALUES (?, ?, ?) "
+        "ON CONFLICT(chat_id, user_id) DO UPDATE SET count = count + excluded.count",
+        (int(chat_id), int(user_id), int(amount)),
+    )
+    return await get_warns(chat_id, user_id, database)
+
+async def reset_warns(chat_id: int, user_id: int, database=None):
+    models = get_models(database)
+    await models.db.execute(
+        "DELETE FROM warns WHERE chat_id = ? AND user_id = ?", (int(chat_id), int(user_id))
+    )
+
+async def load_pending_deletions(database=None) -> List[tuple]:
+    """(due, chat_id, message_id) of every queued deletion"""
+    models = get_models(database)
+    rows = await models.db.fetch_all("SELECT due, chat_id, message_id FROM pending_deletions")
+    return [(int(row['due']), int(row['chat_id']), int(row['message_id'])) for row in rows]
+
+async def add_pending_deletions(rows, batch_size: int = 300, database=None) -> int:
+    """Queue (due, chat_id, message_id) rows; a queued message gets the new due time"""
+    models = get_models(database)
+    rows = [(int(chat_id), int(message_id), int(due)) for due, chat_id, message_id in rows]
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        placeholders = ", ".join(["(?, ?, ?)"] * len(batch))
+        params = tuple(item for row in batch for item in row)
+        await models.db.execute(
+            "INSERT INTO pending_deletions (chat_id, message_id, due) "
+            f"VALUES {placeholders} "
+            "ON CONFLICT(chat_id, message_id) DO UPDATE SET due = excluded.due",
+            params,
+        )
+    return len(rows)
+
+async def delete_pending_deletions(chat_id: int, message_ids, batch_size: int = 300, database=None):
+    """Forget queued deletions of a chat"""
+    models = get_models(database)
+    message_ids = [int(message_id) for message_id in message_ids]
+    for start in range(0, len(message_ids), batch_size):
+        batch = message_ids[start:start + batch_size]
+        placeholders = ", ".join(["?"] * len(batch))
+        await models.db.execute(
+            f"DELETE FROM pending_deletions WHERE chat_id = ? AND message_id IN ({placeholders})",
+            (int(chat_id), *batch),
+        )
@@ -0,0 +1,196 @@
+"""
+Plugin registry: feature modules are loaded on demand.
+
+Each module under modules/ is described by a Plugin: its registrar
+(``register_*_handlers(client, session_name, owner_id)``) and what makes it
+needed — its cmd.json commands, a text predicate, or a settings predicate
+for features that run without a command (profile rotation, antispam).
+
+At startup no module is imported unless its settings need it. When the
+client's Dispatcher routes a command nobody handles yet, it asks the
+registry to load the plugin that owns the command; the module registers
+its handlers with the dispatcher, which then runs the command. Plain
+owner messages are checked against the text predicates of the plugins
+not loaded yet (a loaded plugin costs nothing here).
+
+Plugins whose module is missing from the tree are skipped.
+"""
+import asyncio
+import importlib
+import logging
+import time
+
+from dispatcher import install_dispatcher
+from lazy import is_available
+from settings_store import get_settings_store
+from utils import load_json
+
+logger = logging.getLogger(__name__)
+
+
+class Plugin:
+    __slots__ = ("name", "module", "registrar", "section", "commands", "matches", "eager")
+
+    def __init__(self, name, module, registrar, section=None, commands=(), matches=None, eager=None):
+        self.name = name
+        self.module = module
+        self.registrar = registrar
+        # every command of this cmd.json section not claimed by another plugin
+        self.section = section
+        self.commands = tuple(commands)
+        # text -> bool, for plugins that react to more than commands
+        self.matches = matches
+        # settings -> bool: load at startup
+        self.eager = eager
+
+    @property
+    def triggered(self):
+        return bool(self.section or self.commands or self.matches)
+
+
+def _profile_enabled(settings):
+    if settings.get("clock_enabled"):
+        return True
+    profile = settings.get("profile_settings")
+    return isinstance(profile, dict) and any(
+        profile.get(key) for key in ("name_enabled", "bio_enabled", "status_enabled", "online_enabled", "title_enabled")
+    )
+
+
+def _has_variables(text):
+    from template import compile_template
+
+    return compile_template(text) is not None
+
+
+PLUGINS = (
+    Plugin("manage", "modules.manage", "register_manage_handlers", commands=("delete_messages",)),
+    Plugin(
+        "group",
+        "modules.group",
+        "register_group_handlers",
+        commands=("tag_all", "welcome_toggle", "set_welcome_text", "set_welcome_delete_time"),
+        eager=lambda settings: settings.get("welcome_enabled", False),
+    ),
+    Plugin(
+        "antispam",
+        "modules.antispam",
+        "register_antispam_handlers",
+        commands=("antispam_toggle",),
+        eager=lambda settings: settings.get("antispam_enabled", False),
+    ),
+    Plugin(
+        "comment",
+        "modules.comment",
+        "register_comment_handlers",
+        commands=("first_comment_toggle", "set_first_comment_text"),
+        eager=lambda settings: settings.get("first_comment_enabled", False),
+    ),
+    Plugin("profile", "modules.profile", "register_profile_handlers", section="profile", eager=_profile_enabled),
+    Plugin("vars", "modules.vars", "register_vars_handlers", section="vars", matches=_has_variables),
+    # ماژول‌هایی که هنوز در این نسخه نیستن؛ با اضافه شدن فایلشون فعال می‌شن
+    Plugin("private", "modules.private", "register_private_handlers"),
+    Plugin("fun", "modules.fun", "register_fun_handlers"),
+    Plugin("fresponse", "modules.fresponse", "register_fast_response_handlers"),
+    Plugin("enemy", "modules.enemy", "register_enemy_handlers"),
+    Plugin("edit", "modules.edit", "register_edit_handlers"),
+    Plugin("download", "modules.download", "register_download_handlers"),
+    Plugin("convert", "modules.convert", "register_convert_handlers"),
+)
+
+
+def command_keys(plugins, commands):
+    """{plugin name: [command keys]} for one language's cmd.json table"""
+    claimed = {key for plugin in plugins for key in plugin.commands}
+    keys = {}
+    for plugin in plugins:
+        plugin_keys = list(plugin.commands)
+        section = commands.get(plugin.section, {}) if plugin.section else {}
+        plugin_keys += [key for key in section if key not in claimed]
+        keys[plugin.name] = plugin_keys
+    return keys
+
+
+class PluginRegistry:
+    def __init__(self, client, session_name, owner_id, plugins=PLUGINS, commands=None):
+        self.client = client
+        self.session_name = session_name
+        self.owner_id = owner_id
+        self.plugins = {}
+        for plugin in plugins:
+            if is_available(plugin.module):
+                self.plugins[plugin.name] = plugin
+            else:
+                logger.debug(f"Plugin {plugin.name} skipped: {plugin.module} not found")
+        # name -> whatever the registrar returned (closed on shutdown)
+        self.loaded = {}
+        # name -> future of a load in progress
+        self._loading = {}
+        commands = commands if commands is not None else load_json("cmd.json", {})
+        # command key -> plugin name; keys are the same in every language
+        self._owners = {}
+        for sections in commands.values():
+            for name, keys in command_keys(self.plugins.values(), sections).items():
+                for key in keys:
+                    self._owners.setdefault(key, name)
+        self._matchers = [(name, plugin.matches) for name, plugin in self.plugins.items() if plugin.matches]
+
+    async def load(self, name):
+        """Import and register a plugin (once); callers arriving during the load wait for it"""
+        if name in self.loaded:
+            return self.loaded[name]
+        loading = self._loading.get(name)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        plugin = self.plugins[name]
+        loading = self._loading[name] = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        try:
+            module = importlib.import_module(plugin.module)
+            result = await getattr(module, plugin.registrar)(self.client, self.session_name, self.owner_id)
+            self.loaded[name] = result
+            self._matchers = [matcher for matcher in self._matchers if matcher[0] != name]
+            logger.info(f"Plugin {name} loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+        except Exception as e:
+            # not marked as loaded: the next command or match tries again
+            logger.error(f"Error loading plugin {name}: {e}")
+        finally:
+            del self._loading[name]
+            loading.set_result(self.loaded.get(name))
+        return self.loaded.get(name)
+
+    async def load_command(self, key):
+        """Load the plugin owning a command, if it isn't loaded"""
+        name = self._owners.get(key)
+        if name is not None and name not in self.loaded:
+            await self.load(name)
+
+    async def load_matching(self, text):
+        """Load the plugins whose text predicate accepts text"""
+        for name, matches in self._matchers:
+            if matches(text):
+                await self.load(name)
+
+    async def start(self, settings):
+        """Load the plugins needed from the start"""
+        for name, plugin in self.plugins.items():
+            if not plugin.triggered or (plugin.eager and plugin.eager(settings)):
+                await self.load(name)
+        return self
+
+    async def close(self):
+        for name, result in self.loaded.items():
+            close = getattr(result, "close", None)
+            if close is not None:
+                try:
+                    await close()
+                except Exception as e:
+                    logger.error(f"Error closing plugin {name}: {e}")
+
+
+async def setup_plugins(client, session_name, owner_id, plugins=PLUGINS):
+    """The client's dispatcher plus a registry feeding it modules on demand"""
+    store = await get_settings_store(session_name)
+    dispatcher = install_dispatcher(client, owner_id, store.settings)
+    registry = dispatcher.registry = PluginRegistry(client, session_name, owner_id, plugins)
+    return await registry.start(store.settings)
@@ -0,0 +1,125 @@
+import logging
+import re
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# پیشوندهایی که دستورات با آن شروع می‌شوند
+COMMAND_PREFIXES = "/!"
+
+# الگوهای cmd.json به شکل ^[/!]word\s+... یا ^[/!]word$ هستند
+_PREFIXED_PATTERN = re.compile(r"^\^\[[/!]{2}\]")
+_REGEX_META = set("\\()[]{}?*+.|^$ ")
+
+CommandMatch = namedtuple("CommandMatch", ["section", "key", "match"])
+
+
+def _first_word(pattern):
+    """
+    Extract the literal first word of a prefixed command pattern.
+    Returns None when the pattern cannot be dispatched by its first word.
+    """
+    head = _PREFIXED_PATTERN.match(pattern)
+    if not head:
+        return None
+    rest = pattern[head.end():]
+    word = []
+    for i, ch in enumerate(rest):
+        if ch in _REGEX_META:
+            tail = rest[i:]
+            # The word must be terminated by required whitespace (\s+) or end
+            # of input; \s* or a quantifier/group would change the first token
+            if tail.startswith("\\s+") or tail.startswith("$"):
+                break
+            return None
+        word.append(ch)
+    else:
+        return None
+    return "".join(word).lower() or None
+
+
+class CommandRouter:
+    """
+    Routes message text to a command key from cmd.json in a single pass.
+
+    Patterns are compiled once per language and bucketed by the first word
+    after the command prefix, so a message only runs the handful of patterns
+    sharing its first word. Patterns that cannot be bucketed are kept in a
+    short fallback list.
+    """
+
+    def __init__(self, commands_data):
+        self.source = commands_data
+        self._buckets = {}
+        self._fallback = {}
+        for lang, sections in (commands_data or {}).items():
+            if not isinstance(sections, dict):
+                continue
+            buckets = self._buckets.setdefault(lang, {})
+            fallback = self._fallback.setdefault(lang, [])
+            for section_name, section_commands in sections.items():
+                if not isinstance(section_commands, dict):
+                    continue
+                for command_key, pattern in section_commands.items():
+                    if not pattern:
+                        continue
+                    try:
+                        compiled = re.compile(pattern, re.IGNORECASE)
+                    except re.error as e:
+                        logger.error(f"Invalid pattern for {command_key}: {e}")
+                        continue
+                    entry = (section_name, command_key, compiled)
+                    word = _first_word(pattern)
+                    if word is None:
+                        fallback.append(entry)
+                    else:
+                        buckets.setdefault(word, []).append(entry)
+
+    def match(self, message_text, lang="fa"):
+        """Return a CommandMatch for the first matching command, or None"""
+        if not message_text:
+            return None
+        text = message_text.strip()
+        if not text:
+            return None
+
+        if text[0] in COMMAND_PREFIXES:
+            token = text[1:].split(None, 1)
+            if token:
+                for section_name, command_key, compiled in self._buckets.get(
+                    lang, {}
+                ).get(token[0].lower(), ()):
+                    match = compiled.match(text)
+                    if match:
+                        return CommandMatch(section_name, command_key, match)
+
+        for section_name, command_key, compiled in self._fallback.get(lang, ()):
+            match = compiled.match(text)
+            if match:
+                return CommandMatch(section_name, command_key, match)
+        return None
+
+    def is_command(self, message_text, lang="fa"):
+        return self.match(message_text, lang) is not None
+
+
+_router = None
+
+
+def get_command_router(commands_data=None):
+    """
+    Return the shared router for cmd.json.
+    cmd.json is served from the resource cache, so this is cheap enough to
+    call per message; the router is rebuilt only when the data changes.
+    """
+    global _router
+    if commands_data is None:
+        from utils import load_json
+
+        commands_data = load_json("cmd.json", {})
+    if _router is not None and (
+        _router.source is commands_data or not (commands_data or _router.source)
+    ):
+        return _router
+    _router = CommandRouter(commands_data)
+    return _router
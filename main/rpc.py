@@ -0,0 +1,285 @@
+"""
+Outbound request scheduler for a Telethon client.
+
+install_rpc_scheduler() wraps ``client._call`` so every request — from
+``client(...)``, ``event.edit``, ``event.reply``, ``send_message`` — passes
+through it:
+
+  - token buckets per request type and, for message requests, per chat
+  - priority lanes: a request waits while higher-priority ones are waiting
+    on one of its buckets; owner commands run as HIGH, background loops
+    mark themselves BACKGROUND. A request sitting out a flood wait holds
+    nobody up
+  - FloodWaitError blocks the request type's bucket for the wait, sleeps
+    and retries, so other requests of that type don't hit the same limit;
+    inside ``no_retry()`` it is raised at once instead (also for a request
+    whose bucket is already blocked), for requests only worth sending now
+  - time spent waiting is recorded in the client's metrics
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import time
+from contextlib import contextmanager
+
+from telethon.errors import FloodWaitError
+from telethon.utils import get_peer_id
+
+logger = logging.getLogger(__name__)
+
+# اولویت درخواست‌ها؛ عدد کمتر یعنی زودتر
+HIGH = 0
+NORMAL = 1
+BACKGROUND = 2
+
+rpc_priority = contextvars.ContextVar("rpc_priority", default=NORMAL)
+rpc_retry = contextvars.ContextVar("rpc_retry", default=True)
+
+# (tokens per second, burst) per request type; "default" is the budget of
+# each of the other types
+DEFAULT_LIMITS = {
+    "default": (25.0, 30),
+    "SendMessageRequest": (20.0, 20),
+    "SendMediaRequest": (10.0, 10),
+    "SendMultiMediaRequest": (5.0, 5),
+    "ForwardMessagesRequest": (10.0, 10),
+    "EditMessageRequest": (10.0, 10),
+    "DeleteMessagesRequest": (5.0, 10),
+    "UpdateProfileRequest": (0.2, 3),
+    "UpdateStatusRequest": (0.2, 3),
+    "EditTitleRequest": (0.5, 3),
+    "EditChatTitleRequest": (0.5, 3),
+}
+
+# budget of message requests inside one chat
+DEFAULT_CHAT_LIMIT = (1.0, 5)
+CHAT_SCOPED = {
+    "SendMessageRequest",
+    "SendMediaRequest",
+    "SendMultiMediaRequest",
+    "ForwardMessagesRequest",
+    "EditMessageRequest",
+}
+
+# longer flood waits are raised to the caller instead of slept through
+MAX_FLOOD_WAIT = 300
+MAX_RETRIES = 3
+
+
+@contextmanager
+def priority(level):
+    """Run the block's requests in the given lane"""
+    token = rpc_priority.set(level)
+    try:
+        yield
+    finally:
+        rpc_priority.reset(token)
+
+
+@contextmanager
+def no_retry():
+    """Raise the block's flood waits instead of sleeping through them"""
+    token = rpc_retry.set(False)
+    try:
+        yield
+    finally:
+        rpc_retry.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated", "blocked_until", "waiting", "_clock")
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._clock = clock
+        self.updated = clock()
+        self.blocked_until = 0.0
+        # requests queued for this bucket, per lane
+        self.waiting = [0, 0, 0]
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available (0 if one is now)"""
+        now = self._clock()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def blocked_for(self):
+        """Seconds left of a flood wait block"""
+        return max(0.0, self.blocked_until - self._clock())
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, self._clock() + seconds)
+
+
+class RpcScheduler:
+    def __init__(self, limits=None, chat_limit=DEFAULT_CHAT_LIMIT, metrics=None, clock=time.monotonic):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.chat_limit = chat_limit
+        self.metrics = metrics
+        self._clock = clock
+        self._buckets = {}
+        self._chat_buckets = {}
+
+    def _bucket(self, kind):
+        bucket = self._buckets.get(kind)
+        if bucket is None:
+            rate, burst = self.limits.get(kind, self.limits["default"])
+            bucket = self._buckets[kind] = TokenBucket(rate, burst, self._clock)
+        return bucket
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets.clear()
+            bucket = self._chat_buckets[chat_id] = TokenBucket(*self.chat_limit, self._clock)
+        return bucket
+
+    def buckets_for(self, request):
+        if isinstance(request, (list, tuple)):
+            return "batch", [self._bucket("batch")]
+        # every type has its own bucket; unlisted ones get the default budget
+        kind = type(request).__name__
+        buckets = [self._bucket(kind)]
+        if kind in CHAT_SCOPED:
+            try:
+                buckets.append(self._chat_bucket(get_peer_id(request.peer)))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        return kind, buckets
+
+    @staticmethod
+    def _ahead(buckets, level):
+        """Whether a higher lane is queued for one of the buckets"""
+        return any(any(bucket.waiting[:level]) for bucket in buckets)
+
+    @staticmethod
+    def _queue(buckets, level, count):
+        for bucket in buckets:
+            bucket.waiting[level] += count
+
+    async def acquire(self, buckets, level):
+        """Wait for a token in every bucket; returns seconds waited"""
+        start = self._clock()
+        queued = False
+        try:
+            while True:
+                blocked = max(bucket.blocked_for() for bucket in buckets)
+                if blocked > 0:
+                    # out of the queue while blocked, so lower lanes of the
+                    # other buckets aren't held up by a flood wait
+                    if queued:
+                        self._queue(buckets, level, -1)
+                        queued = False
+                    await asyncio.sleep(blocked)
+                    continue
+                if not queued:
+                    self._queue(buckets, level, 1)
+                    queued = True
+                delay = max(bucket.delay() for bucket in buckets)
+                if delay <= 0 and not self._ahead(buckets, level):
+                    for bucket in buckets:
+                        bucket.take()
+                    return self._clock() - start
+                # lower lanes re-check often so they go as soon as the lanes ahead clear
+                await asyncio.sleep(delay if delay > 0 else 0.05)
+        finally:
+            if queued:
+                self._queue(buckets, level, -1)
+
+    def _record(self, name, value, **labels):
+        if self.metrics is not None:
+            if name.endswith("_seconds"):
+                self.metrics.observe(name, value, **labels)
+            else:
+                self.metrics.inc(name, value, **labels)
+
+    async def call(self, call, sender, request, ordered=False):
+        kind, buckets = self.buckets_for(request)
+        level = rpc_priority.get()
+        lane = ("high", "normal", "background")[level]
+        retries = MAX_RETRIES if rpc_retry.get() else 0
+        if not retries:
+            blocked = max(bucket.blocked_for() for bucket in buckets)
+            if blocked > 0:
+                raise FloodWaitError(request=request, capture=math.ceil(blocked))
+        for attempt in range(retries + 1):
+            waited = await self.acquire(buckets, level)
+            self._record("rpc_wait_seconds", waited, request=kind, lane=lane)
+            try:
+                # flood waits are handled here, not slept inside Telethon
+                return await call(sender, request, ordered=ordered, flood_sleep_threshold=0)
+            except FloodWaitError as e:
+                self._record("rpc_flood_waits", 1, request=kind)
+                if e.seconds > MAX_FLOOD_WAIT:
+                    raise
+                buckets[0].block(e.seconds)
+                if attempt == retries:
+                    raise
+                logger.warning(f"Flood wait of {e.seconds}s on {kind}, retrying")
+                self._record("rpc_flood_wait_seconds", e.seconds, request=kind)
+
+
+def install_rpc_scheduler(client, owner_id=None, metrics=None, limits=None):
+    """
+    Route all of client's requests through an RpcScheduler. Handlers for
+    the owner's messages (including outgoing ones) run in the HIGH lane.
+    """
+    if getattr(client, "_rpc_scheduler", None) is not None:
+        return client._rpc_scheduler
+    scheduler = RpcScheduler(limits=limits, metrics=metrics or getattr(client, "_metrics", None))
+    client._rpc_scheduler = scheduler
+
+    call = client._call
+
+    async def scheduled_call(sender, request, ordered=False, flood_sleep_threshold=None):
+        return await scheduler.call(call, sender, request, ordered=ordered)
+
+    client._call = scheduled_call
+
+    add_event_handler = client.add_event_handler
+    wrappers = {}
+
+    def lane_for(callback):
+        @functools.wraps(callback)
+        async def handler(event):
+            from_owner = getattr(event, "out", False) or (
+                owner_id is not None and getattr(event, "sender_id", None) == owner_id
+            )
+            token = rpc_priority.set(HIGH if from_owner else NORMAL)
+            try:
+                return await callback(event)
+            finally:
+                rpc_priority.reset(token)
+
+        return handler
+
+    def add(callback, event=None):
+        wrapper = wrappers.get(callback)
+        if wrapper is None:
+            wrapper = wrappers[callback] = lane_for(callback)
+        return add_event_handler(wrapper, event)
+
+    remove_event_handler = client.remove_event_handler
+
+    def remove(callback, event=None):
+        return remove_event_handler(wrappers.pop(callback, callback), event)
+
+    client.add_event_handler = add
+    client.remove_event_handler = remove
+    return scheduler
@@ -0,0 +1,426 @@
+"""
+Timers and scheduled jobs of every session of the process.
+
+HostScheduler is one APScheduler AsyncIOScheduler per process (per shard
+with host.py --workers):
+
+- jobs are stored in SQLite (SQLiteJobStore, on the standard sqlite3
+  module), so a restarted process resumes its pending jobs from the store
+  instead of rescanning chats or settings;
+- recurring jobs get a random jitter, spreading the RPCs of many accounts
+  instead of firing them all on the same second;
+- missed runs are coalesced into one and dropped after a grace time;
+- it starts paused and resume() is called once the sessions are up, so
+  due jobs find their session's handler.
+
+A stored job only names a session and a kind of job; the session
+registers the coroutine that does the work at startup:
+
+    scheduler = get_scheduler()
+    scheduler.handle(session_name, "spam_unmute", unmute)
+    scheduler.add_session_job(session_name, "spam_unmute", "date", args=(user_id,), run_date=when)
+
+(modules/antispam.py ends mutes this way). Thousands of short one-shot
+timers don't need the job store: they go to the in-memory TimerWheel
+(scheduler.wheel), which also wakes the deletion queues (delete_queue.py).
+"""
+import asyncio
+import logging
+import math
+import os
+import pickle
+import sqlite3
+import time
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+from pytz import utc
+from rpc import BACKGROUND, rpc_priority
+
+logger = logging.getLogger(__name__)
+
+# seconds of random delay added to recurring jobs
+DEFAULT_JITTER = 10
+# a run missed by more than this (process down) is skipped
+MISFIRE_GRACE_TIME = 3600
+
+
+class SQLiteJobStore(BaseJobStore):
+    """APScheduler job store in a SQLite file (the layout of SQLAlchemyJobStore)"""
+
+    def __init__(self, path, tablename="apscheduler_jobs", pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.path = path
+        self.tablename = tablename
+        self.pickle_protocol = pickle_protocol
+        self._conn = None
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.tablename} "
+            "(id TEXT PRIMARY KEY, next_run_time REAL, job_state BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{self.tablename}_next_run_time ON {self.tablename} (next_run_time)"
+        )
+        self._conn.commit()
+
+    def lookup_job(self, job_id):
+        row = self._conn.execute(f"SELECT job_state FROM {self.tablename} WHERE id = ?", (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs("WHERE next_run_time <= ?", (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        row = self._conn.execute(
+            f"SELECT next_run_time FROM {self.tablename} WHERE next_run_time IS NOT NULL "
+            "ORDER BY next_run_time LIMIT 1"
+        ).fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        try:
+            with self._conn:
+                self._conn.execute(
+                    f"INSERT INTO {self.tablename} (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                    (job.id, datetime_to_utc_timestamp(job.next_run_time), self._dump(job)),
+                )
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        with self._conn:
+            cursor = self._conn.execute(
+                f"UPDATE {self.tablename} SET next_run_time = ?, job_state = ? WHERE id = ?",
+                (datetime_to_utc_timestamp(job.next_run_time), self._dump(job), job.id),
+            )
+        if cursor.rowcount == 0:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        with self._conn:
+            cursor = self._conn.execute(f"DELETE FROM {self.tablename} WHERE id = ?", (job_id,))
+        if cursor.rowcount == 0:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        with self._conn:
+            self._conn.execute(f"DELETE FROM {self.tablename}")
+
+    def shutdown(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _dump(self, job):
+        return pickle.dumps(job.__getstate__(), self.pickle_protocol)
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where="", params=()):
+        jobs = []
+        failed = []
+        rows = self._conn.execute(
+            f"SELECT id, job_state FROM {self.tablename} {where} ORDER BY next_run_time", params
+        ).fetchall()
+        for job_id, job_state in rows:
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except Exception:
+                logger.exception(f"Unable to restore job {job_id}, removing it")
+                failed.append(job_id)
+        if failed:
+            with self._conn:
+                self._conn.executemany(f"DELETE FROM {self.tablename} WHERE id = ?", [(job_id,) for job_id in failed])
+        return jobs
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} (path={self.path})>"
+
+
+class Timer:
+    __slots__ = ("rounds", "callback", "args", "cancelled")
+
+    def __init__(self, rounds, callback, args):
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel for many short one-shot timers. Adding and
+    cancelling a timer is O(1); one task advances the wheel a slot every
+    ``resolution`` seconds and runs the due timers of that slot (coroutine
+    functions as tasks). Timers live in memory only: work that must
+    survive a restart belongs in the job store.
+    """
+
+    def __init__(self, resolution=1.0, slots=512, clock=time.monotonic):
+        self.resolution = resolution
+        self._slots = [[] for _ in range(slots)]
+        self._position = 0
+        self._clock = clock
+        self._task = None
+        self._pending = set()
+
+    def __len__(self):
+        return sum(len(slot) for slot in self._slots)
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) in about ``delay`` seconds; returns a Timer with cancel()"""
+        ticks = max(1, math.ceil(delay / self.resolution))
+        rounds, offset = divmod(ticks, len(self._slots))
+        # a timer in the current slot is reached again after a full turn
+        if offset == 0:
+            rounds -= 1
+        timer = Timer(rounds, callback, args)
+        self._slots[(self._position + offset) % len(self._slots)].append(timer)
+        return timer
+
+    def advance(self):
+        """Move one slot forward and run the timers due there"""
+        self._position = (self._position + 1) % len(self._slots)
+        slot = self._slots[self._position]
+        if not slot:
+            return
+        due = []
+        waiting = []
+        for timer in slot:
+            if timer.cancelled:
+                continue
+            if timer.rounds > 0:
+                timer.rounds -= 1
+                waiting.append(timer)
+            else:
+                due.append(timer)
+        self._slots[self._position] = waiting
+        for timer in due:
+            self._fire(timer)
+
+    def _fire(self, timer):
+        try:
+            result = timer.callback(*timer.args)
+            if asyncio.iscoroutine(result):
+                task = asyncio.ensure_future(result)
+                self._pending.add(task)
+                task.add_done_callback(self._finished)
+        except Exception as e:
+            logger.error(f"Error in timer {timer.callback!r}: {e}")
+
+    def _finished(self, task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error in timer task: {task.exception()}")
+
+    async def _run(self):
+        # timer work is background RPC
+        rpc_priority.set(BACKGROUND)
+        # ticks are counted from the start, so sleeping late doesn't drift
+        next_tick = self._clock() + self.resolution
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - self._clock()))
+            while next_tick <= self._clock():
+                self.advance()
+                next_tick += self.resolution
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._pending):
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+
+
+class HostScheduler:
+    """The process's job scheduler (see the module docstring)"""
+
+    def __init__(self, path=None, jitter=DEFAULT_JITTER, misfire_grace_time=MISFIRE_GRACE_TIME, wheel=None):
+        self.path = path
+        self.jitter = jitter
+        self.wheel = wheel or TimerWheel()
+        self._handlers = {}
+        self._scheduler = AsyncIOScheduler(
+            jobstores={
+                "default": SQLiteJobStore(path) if path else MemoryJobStore(),
+                # jobs holding live objects, which can't be stored
+                "memory": MemoryJobStore(),
+            },
+            job_defaults={"coalesce": True, "misfire_grace_time": misfire_grace_time, "max_instances": 1},
+            timezone=utc,
+        )
+
+    @property
+    def running(self):
+        return self._scheduler.running
+
+    def start(self):
+        """Start paused: jobs are stored but nothing runs until resume()"""
+        if not self._scheduler.running:
+            self._scheduler.start(paused=True)
+        self.wheel.start()
+        return self
+
+    def resume(self):
+        self.start()
+        self._scheduler.resume()
+
+    def handle(self, session_name, kind, callback):
+        """Run ``kind`` jobs of the session with ``await callback(*args)``"""
+        self._handlers[(session_name, kind)] = callback
+
+    def forget(self, session_name):
+        """Drop the handlers of a stopped session (its stored jobs stay)"""
+        for key in [key for key in self._handlers if key[0] == session_name]:
+            del self._handlers[key]
+
+    def handler(self, session_name, kind):
+        return self._handlers.get((session_name, kind))
+
+    def _trigger_args(self, trigger, jitter, trigger_args):
+        if trigger != "date":
+            trigger_args["jitter"] = self.jitter if jitter is None else jitter
+        return trigger_args
+
+    def add_session_job(self, session_name, kind, trigger, args=(), job_id=None, jitter=None, **trigger_args):
+        """
+        Store a job of the session. The id defaults to "session:kind", and a
+        job with the same id is replaced. Recurring triggers get the
+        scheduler's jitter unless one is given.
+        """
+        self.start()
+        return self._scheduler.add_job(
+            run_session_job,
+            trigger,
+            args=(session_name, kind, *args),
+            id=job_id or f"{session_name}:{kind}",
+            replace_existing=True,
+            **self._trigger_args(trigger, jitter, trigger_args),
+        )
+
+    def add_local_job(self, func, trigger, job_id, jitter=None, **trigger_args):
+        """A job of this run only (func may be any callable; it isn't stored)"""
+        self.start()
+        return self._scheduler.add_job(
+            func,
+            trigger,
+            id=job_id,
+            jobstore="memory",
+            replace_existing=True,
+            **self._trigger_args(trigger, jitter, trigger_args),
+        )
+
+    def remove_job(self, job_id):
+        try:
+            self._scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
+
+    def get_job(self, job_id):
+        return self._scheduler.get_job(job_id)
+
+    def get_jobs(self, session_name=None):
+        jobs = self._scheduler.get_jobs()
+        if session_name is None:
+            return jobs
+        return [job for job in jobs if job.id.startswith(f"{session_name}:")]
+
+    async def close(self):
+        if self._scheduler.running:
+            # shutdown() is queued on the loop; give it a turn to run
+            self._scheduler.shutdown(wait=False)
+            await asyncio.sleep(0)
+        await self.wheel.close()
+
+
+async def run_session_job(session_name, kind, *args):
+    """Entry point of stored jobs: the session's handler for ``kind``"""
+    callback = _scheduler.handler(session_name, kind) if _scheduler is not None else None
+    if callback is None:
+        logger.warning(f"No handler for {kind} job of {session_name}; is the session running?")
+        return
+    rpc_priority.set(BACKGROUND)
+    try:
+        await callback(*args)
+    except Exception as e:
+        logger.error(f"Error in {kind} job of {session_name}: {e}")
+
+
+_scheduler = None
+
+
+def get_scheduler(path=None, shard=None, directory=None):
+    """
+    The scheduler of the process, created on first use with the job store
+    at ``path`` or config.json's scheduler_db_path, relative to
+    ``directory`` (main/ by default). Every process needs its own file:
+    a job store doesn't know which process's sessions its jobs belong to,
+    so Self.py keeps it in its session directory and shard processes of
+    host.py each get a suffixed file.
+    """
+    global _scheduler
+    if _scheduler is None:
+        from utils import load_json
+
+        config = load_json("config.json", {})
+        if path is None:
+            path = config.get("scheduler_db_path")
+            if path and not os.path.isabs(path):
+                path = os.path.join(directory or os.path.dirname(os.path.abspath(__file__)), path)
+        if path and shard is not None:
+            root, ext = os.path.splitext(path)
+            path = f"{root}_{shard}{ext}"
+        _scheduler = HostScheduler(path, jitter=config.get("scheduler_jitter", DEFAULT_JITTER))
+    return _scheduler
+
+
+def resume_scheduler():
+    """Let stored jobs run (called once the sessions have started)"""
+    if _scheduler is not None:
+        _scheduler.resume()
+
+
+def forget_session(session_name):
+    """Drop a stopped session's handlers; nothing to do once the scheduler is closed"""
+    if _scheduler is not None:
+        _scheduler.forget(session_name)
+
+
+async def close_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.close()
+        _scheduler = None
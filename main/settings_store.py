@@ -0,0 +1,350 @@
+import asyncio
+import copy
+import json
+import logging
+
+from database import get_session_db, open_session_db
+from ormax_models import GLOBAL_CHAT_ID, SETTINGS_COLUMNS
+from ormax_models import delete_chat_settings as ormax_delete_chat_settings
+from ormax_models import load_chat_settings as ormax_load_chat_settings
+from ormax_models import load_settings as ormax_load_settings
+from ormax_models import update_settings_fields as ormax_update_settings_fields
+from ormax_models import upsert_chat_settings as ormax_upsert_chat_settings
+
+logger = logging.getLogger(__name__)
+
+# Default values for critical settings
+DEFAULT_SETTINGS = {
+    "lang": "fa",
+    "self_enabled": {},
+    "self_global_enabled": False,
+    "profile_settings": {
+        "name_enabled": False,
+        "bio_enabled": False,
+        "status_enabled": False,
+        "online_enabled": False,
+        "title_enabled": False,
+        "names": [],
+        "bios": [],
+        "statuses": [],
+        "title": [],
+    },
+    "save_profile_enabled": {},
+    "reaction_enabled": {},
+    "typing_enabled": {},
+    "action_enabled": {},
+    "tick_enabled": {},
+    "tag_enabled": {},
+    "translate_mode_enabled": {},
+    "translate_enabled": {},
+    "hashtag_enabled": {},
+    "signature_enabled": {},
+    "auto_approve_enabled": {},
+    "emoji_enabled": {},
+    "bold_enabled": {},
+    "underline_enabled": {},
+    "code_enabled": {},
+    "font_en_enabled": {},
+    "font_fa_enabled": {},
+    "strikethrough_enabled": {},
+    "italic_enabled": {},
+    "spoiler_enabled": {},
+    "poker_enabled": {},
+    "save_enabled": {},
+    "save_pv_enabled": {},
+    "welcome_chats": {},
+    "comment_links": {},
+}
+
+
+# Settings kept as {chat_id: value} maps; each entry is one chat_settings row
+CHAT_MAP_SETTINGS = {
+    key for key, value in DEFAULT_SETTINGS.items() if isinstance(value, dict) and not value
+}
+
+
+def register_chat_map_setting(key):
+    """Declare a setting that maps chat ids to values"""
+    CHAT_MAP_SETTINGS.add(key)
+
+
+def apply_default_settings(settings):
+    """Fill missing keys with (copies of) the default values"""
+    for key, value in DEFAULT_SETTINGS.items():
+        if key not in settings:
+            settings[key] = copy.deepcopy(value)
+    return settings
+
+
+def _encode(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _chat_key(chat_id):
+    try:
+        return int(chat_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class SettingsStore:
+    """
+    Authoritative in-memory settings snapshot for one session.
+
+    Reads are served from ``settings`` without touching the database.
+    Changes are tracked per key and written behind: the first change opens a
+    short window, every change inside it is coalesced, and only the changed
+    columns and chat_settings rows are written when the window closes.
+    ``close()`` flushes whatever is still pending.
+
+    Values of the settings table live in its columns; every other key is
+    stored in chat_settings, per-chat maps as one row per chat and other
+    values as a single row with chat_id 0.
+
+    ``database`` is the session's SessionDatabase; without one the
+    module-level ormax database is used.
+    """
+
+    def __init__(self, session_name, flush_delay=1.0, database=None):
+        self.session_name = session_name
+        self.database = database
+        self.flush_delay = flush_delay
+        self.settings = None
+        self._persisted = {}
+        self._persisted_rows = {}
+        self._dirty = set()
+        self._dirty_rows = set()
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+        self._listeners = []
+
+    async def load(self):
+        settings = await ormax_load_settings(self.database)
+        if not settings:
+            settings = {}
+        try:
+            rows = await ormax_load_chat_settings(self.database)
+        except Exception as e:
+            logger.error(f"Error loading chat settings: {e}")
+            rows = {}
+        for key, per_chat in rows.items():
+            if key in SETTINGS_COLUMNS:
+                continue
+            if key in CHAT_MAP_SETTINGS or any(chat_id != GLOBAL_CHAT_ID for chat_id in per_chat):
+                settings[key] = per_chat
+            elif GLOBAL_CHAT_ID in per_chat:
+                settings[key] = per_chat[GLOBAL_CHAT_ID]
+        apply_default_settings(settings)
+        self.settings = settings
+        self._persisted = {key: _encode(value) for key, value in settings.items()}
+        self._persisted_rows = {
+            key: {chat_id: _encode(value) for chat_id, value in per_chat.items()}
+            for key, per_chat in rows.items()
+        }
+        self._dirty.clear()
+        self._dirty_rows.clear()
+        logger.info(f"Settings loaded for {self.session_name} with {len(settings)} keys")
+        return settings
+
+    def subscribe(self, callback):
+        """Call ``callback(keys)`` whenever keys are changed through the store"""
+        self._listeners.append(callback)
+
+    def _notify(self, keys):
+        for callback in self._listeners:
+            try:
+                callback(keys)
+            except Exception as e:
+                logger.error(f"Error in settings listener: {e}")
+
+    def get(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def set(self, key, value):
+        self.settings[key] = value
+        self.mark_dirty(key)
+
+    def get_chat(self, key, chat_id, default=None):
+        """O(1) lookup of a per-chat value, e.g. get_chat("reaction_enabled", chat_id)"""
+        per_chat = self.settings.get(key)
+        if not isinstance(per_chat, dict):
+            return default
+        return per_chat.get(chat_id, default)
+
+    def set_chat(self, key, chat_id, value):
+        """Set one per-chat value; only that row is written"""
+        per_chat = self.settings.get(key)
+        if not isinstance(per_chat, dict):
+            per_chat = self.settings[key] = {}
+        register_chat_map_setting(key)
+        per_chat[chat_id] = value
+        self._dirty_rows.add((key, chat_id))
+        self._schedule_flush()
+        self._notify({key})
+
+    def mark_dirty(self, *keys):
+        """Mark keys as changed after mutating ``settings`` in place"""
+        self._dirty.update(keys)
+        self._schedule_flush()
+        self._notify(set(keys))
+
+    def update(self, settings=None):
+        """
+        Detect changed keys by comparing against the last written values.
+        Used by callers that mutate the snapshot without naming the keys.
+        """
+        if settings is not None and settings is not self.settings:
+            self.settings.update(settings)
+        changed = set()
+        for key, value in self.settings.items():
+            if self._persisted.get(key) != _encode(value):
+                changed.add(key)
+        self._dirty.update(changed)
+        if self._dirty:
+            self._schedule_flush()
+        if changed:
+            self._notify(changed)
+        return True
+
+    def _schedule_flush(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(
+                self._delayed_flush()
+            )
+        except RuntimeError:
+            # no running loop; the next flush() call writes the changes
+            self._flush_task = None
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    def _diff_rows(self, key, upserts, deletes):
+        """Collect row changes of one non-column key"""
+        value = self.settings.get(key)
+        old_rows = self._persisted_rows.get(key, {})
+        if key in CHAT_MAP_SETTINGS and isinstance(value, dict):
+            new_rows = {}
+            for chat_id, chat_value in value.items():
+                chat_key = _chat_key(chat_id)
+                if chat_key is None:
+                    logger.warning(f"Ignoring non numeric chat id {chat_id!r} in {key}")
+                    continue
+                new_rows[chat_key] = chat_value
+        elif key in self.settings:
+            new_rows = {GLOBAL_CHAT_ID: value}
+        else:
+            new_rows = {}
+        for chat_id, chat_value in new_rows.items():
+            if old_rows.get(chat_id) != _encode(chat_value):
+                upserts[(key, chat_id)] = chat_value
+        for chat_id in old_rows:
+            if chat_id not in new_rows:
+                deletes.add((key, chat_id))
+
+    async def flush(self):
+        """Write all dirty columns in one update and dirty rows in batches"""
+        async with self._lock:
+            if not self._dirty and not self._dirty_rows:
+                return True
+            dirty, self._dirty = self._dirty, set()
+            dirty_rows, self._dirty_rows = self._dirty_rows, set()
+
+            columns = {}
+            upserts = {}
+            deletes = set()
+            for key in dirty:
+                if key in SETTINGS_COLUMNS:
+                    if key in self.settings and self._persisted.get(key) != _encode(self.settings[key]):
+                        columns[key] = self.settings[key]
+                else:
+                    self._diff_rows(key, upserts, deletes)
+            for key, chat_id in dirty_rows:
+                if key in dirty:
+                    continue
+                per_chat = self.settings.get(key)
+                if isinstance(per_chat, dict) and chat_id in per_chat:
+                    upserts[(key, _chat_key(chat_id))] = per_chat[chat_id]
+                else:
+                    deletes.add((key, _chat_key(chat_id)))
+
+            try:
+                if columns and not await ormax_update_settings_fields(columns, database=self.database):
+                    raise RuntimeError("settings columns were not written")
+                if upserts:
+                    await ormax_upsert_chat_settings(
+                        [(key, chat_id, value) for (key, chat_id), value in upserts.items()],
+                        database=self.database,
+                    )
+                if deletes:
+                    await ormax_delete_chat_settings(list(deletes), database=self.database)
+            except Exception as e:
+                logger.error(f"Error flushing settings for {self.session_name}: {e}")
+                # keep them dirty so the next flush retries
+                self._dirty.update(dirty)
+                self._dirty_rows.update(dirty_rows)
+                return False
+
+            for key, value in columns.items():
+                self._persisted[key] = _encode(value)
+            for (key, chat_id), value in upserts.items():
+                self._persisted_rows.setdefault(key, {})[chat_id] = _encode(value)
+            for key, chat_id in deletes:
+                self._persisted_rows.get(key, {}).pop(chat_id, None)
+            for key in dirty:
+                if key not in SETTINGS_COLUMNS and key in self.settings:
+                    self._persisted[key] = _encode(self.settings[key])
+            if columns or upserts or deletes:
+                logger.info(
+                    f"Flushed settings for {self.session_name}: {len(columns)} columns, "
+                    f"{len(upserts)} rows updated, {len(deletes)} rows deleted"
+                )
+            return True
+
+    async def close(self):
+        task = self._flush_task
+        self._flush_task = None
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+
+_stores = {}
+_stores_lock = asyncio.Lock()
+
+
+async def get_settings_store(session_name=None):
+    """
+    Return the loaded settings store for a session, opening the session's
+    database (at its default path) if nothing has opened it yet
+    """
+    store = _stores.get(session_name)
+    if store is not None:
+        return store
+    async with _stores_lock:
+        store = _stores.get(session_name)
+        if store is None:
+            database = None
+            if session_name is not None:
+                # a session reads its own file, never the module-level database
+                database = get_session_db(session_name) or await open_session_db(session_name)
+            store = SettingsStore(session_name, database=database)
+            await store.load()
+            _stores[session_name] = store
+    return store
+
+
+async def close_settings_stores():
+    """Flush and forget all stores (call on shutdown)"""
+    while _stores:
+        _, store = _stores.popitem()
+        try:
+            await store.close()
+        except Exception as e:
+            logger.error(f"Error flushing settings for {store.session_name}: {e}")
@@ -0,0 +1,142 @@
+"""
+Message templates with variables (TIME, NAME, RANDNUM1-10, ...).
+
+A text is tokenized once by a single precompiled regex and the compiled
+template is cached by text. Rendering evaluates only the variables the
+template contains: the sender is fetched only for ID/USERNAME/NAME, the
+current time is computed at most once per second and timezone, and
+RANK/WARNS come from resolvers supplied by the caller.
+
+Variables are matched on letter boundaries, so DAY inside STRDAY or TODAY
+and ID inside IDEA are left alone.
+"""
+import random
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
+
+import pytz
+
+HEARTS = ["❤️", "🧡", "💛", "💚", "💙", "💜", "💓", "💞", "💕", "💗"]
+
+# مقدار متغیرهای زمانی از روی زمان فعلی
+TIME_VARS = {
+    "STRDAY": lambda now: now.strftime("%A"),  # روز به حروف
+    "STRMONTH": lambda now: now.strftime("%B"),  # ماه به حروف
+    "YEAR": lambda now: str(now.year),  # سال
+    "MONTH": lambda now: str(now.month).zfill(2),  # ماه به عدد
+    "DATE": lambda now: now.strftime("%Y/%m/%d"),  # تاریخ کامل
+    "TIME": lambda now: now.strftime("%H:%M:%S"),  # زمان کامل
+    "SEC": lambda now: str(now.second).zfill(2),  # ثانیه
+    "MIN": lambda now: str(now.minute).zfill(2),  # دقیقه
+    "HOUR": lambda now: str(now.hour).zfill(2),  # ساعت
+    "DAY": lambda now: str(now.day).zfill(2),  # روز به عدد
+}
+
+# مقدار متغیرهای فرستنده
+SENDER_VARS = {
+    "ID": lambda user: str(user.id),  # شناسه کاربر
+    "USERNAME": lambda user: getattr(user, "username", None) or "None",  # نام کاربری
+    "NAME": lambda user: getattr(user, "first_name", None) or "Unknown",  # نام کاربر
+}
+
+# filled by the caller's resolvers
+RESOLVED_VARS = ("RANK", "WARNS")
+
+VARIABLES = tuple(TIME_VARS) + tuple(SENDER_VARS) + ("HEART",) + RESOLVED_VARS
+
+# longest names first so alternation never stops at a prefix (STRDAY before DAY)
+VAR_PATTERN = re.compile(
+    r"(?<![A-Za-z])(?:RANDNUM(\d+)-(\d+)|("
+    + "|".join(sorted(VARIABLES, key=len, reverse=True))
+    + r"))(?![A-Za-z])"
+)
+
+RANDNUM = "RANDNUM"
+
+
+class Template:
+    """A text split into literal parts and (name, args) variable parts"""
+
+    __slots__ = ("parts", "names")
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.names = frozenset(part[0] for part in parts if isinstance(part, tuple))
+
+
+@lru_cache(maxsize=512)
+def compile_template(text):
+    """Compiled template of text, or None when it has no variables"""
+    if not text:
+        return None
+    parts = []
+    position = 0
+    for match in VAR_PATTERN.finditer(text):
+        if match.start() > position:
+            parts.append(text[position:match.start()])
+        if match.group(3):
+            parts.append((match.group(3), None))
+        else:
+            parts.append((RANDNUM, (int(match.group(1)), int(match.group(2)))))
+        position = match.end()
+    if not parts:
+        return None
+    if position < len(text):
+        parts.append(text[position:])
+    return Template(parts)
+
+
+_now_cache = {}
+
+
+def current_time(timezone):
+    """datetime.now() in timezone, recomputed at most once per second"""
+    second = int(time.time())
+    cached = _now_cache.get(timezone)
+    if cached is None or cached[0] != second:
+        cached = _now_cache[timezone] = (second, datetime.now(pytz.timezone(timezone)))
+    return cached[1]
+
+
+def _random_number(bounds):
+    start, end = bounds
+    if start > end:
+        start, end = end, start
+    return str(random.randint(start, end))
+
+
+async def render_template(template, timezone="Asia/Tehran", get_sender=None, resolvers=None):
+    """
+    Render a compiled template in one pass.
+
+    get_sender is an awaitable factory (e.g. event.get_sender) used only
+    when a sender variable is present; resolvers maps RANK/WARNS to async
+    callables returning their text.
+    """
+    names = template.names
+    values = {}
+    if names & TIME_VARS.keys():
+        now = current_time(timezone)
+        for name in names & TIME_VARS.keys():
+            values[name] = TIME_VARS[name](now)
+    if names & SENDER_VARS.keys():
+        user = await get_sender() if get_sender else None
+        for name in names & SENDER_VARS.keys():
+            values[name] = SENDER_VARS[name](user) if user is not None else name
+    for name in names.intersection(RESOLVED_VARS):
+        resolver = (resolvers or {}).get(name)
+        values[name] = str(await resolver()) if resolver else name
+
+    out = []
+    for part in template.parts:
+        if isinstance(part, str):
+            out.append(part)
+        elif part[0] == RANDNUM:
+            out.append(_random_number(part[1]))
+        elif part[0] == "HEART":
+            out.append(random.choice(HEARTS))
+        else:
+            out.append(values[part[0]])
+    return "".join(out)
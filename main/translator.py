@@ -0,0 +1,187 @@
+"""
+Translation service shared by every session of the process.
+
+Backends are synchronous (deep_translator makes blocking HTTP calls), so
+they run in a thread pool and never block the event loop. On top of that:
+
+  - results are kept in an LRU keyed by (text, target language), optionally
+    saved to a JSON file on close and loaded on start
+  - identical requests in flight share one backend call
+  - short single-line texts requested within ``batch_delay`` of each other
+    are joined into one backend call and split again
+
+StubBackend translates locally, for tests and offline use.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the main directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cache import LRUCache
+from lazy import lazy_import
+
+GoogleTranslator = lazy_import("deep_translator", "GoogleTranslator")
+
+logger = logging.getLogger(__name__)
+
+# texts longer than this (or with line breaks) get a call of their own
+BATCH_TEXT_LENGTH = 200
+# characters per batched call
+BATCH_CHARS = 2000
+
+
+class GoogleBackend:
+    def translate(self, text, target):
+        return GoogleTranslator(source="auto", target=target).translate(text)
+
+
+class StubBackend:
+    """Offline backend: "[fa] text"; records the calls it gets"""
+
+    def __init__(self):
+        self.calls = []
+
+    def translate(self, text, target):
+        self.calls.append((text, target))
+        return "\n".join(f"[{target}] {line}" for line in text.split("\n"))
+
+
+class TranslationService:
+    def __init__(self, backend=None, maxsize=2048, cache_path=None, max_workers=4, batch_delay=0.05):
+        self.backend = backend or GoogleBackend()
+        self.cache_path = cache_path
+        self.batch_delay = batch_delay
+        self._cache = LRUCache(maxsize)
+        self._in_flight = {}
+        # target -> [(text, future)] waiting to be batched
+        self._pending = {}
+        self._flush_handles = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+        if cache_path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading translation cache {self.cache_path}: {e}")
+            return
+        for text, target, translation in entries:
+            self._cache.set((text, target), translation)
+
+    def save(self):
+        if not self.cache_path:
+            return
+        entries = [[text, target, translation] for (text, target), translation in self._cache.items()]
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    async def translate(self, text, target="fa"):
+        key = (text, target)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        future = self._in_flight.get(key)
+        if future is None:
+            future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+            if len(text) <= BATCH_TEXT_LENGTH and "\n" not in text:
+                self._queue(text, target, future)
+            else:
+                asyncio.ensure_future(self._run([text], target, [future]))
+        # shielded so a cancelled caller doesn't cancel the others' result
+        return await asyncio.shield(future)
+
+    async def translate_many(self, texts, target="fa"):
+        return await asyncio.gather(*(self.translate(text, target) for text in texts))
+
+    def _queue(self, text, target, future):
+        pending = self._pending.setdefault(target, [])
+        pending.append((text, future))
+        if sum(len(item) + 1 for item, _ in pending) >= BATCH_CHARS:
+            self._flush(target)
+        elif target not in self._flush_handles:
+            loop = asyncio.get_running_loop()
+            self._flush_handles[target] = loop.call_later(self.batch_delay, self._flush, target)
+
+    def _flush(self, target):
+        handle = self._flush_handles.pop(target, None)
+        if handle is not None:
+            handle.cancel()
+        pending = self._pending.pop(target, [])
+        if pending:
+            texts, futures = zip(*pending)
+            asyncio.ensure_future(self._run(list(texts), target, list(futures)))
+
+    def _call(self, texts, target):
+        """Backend call for texts (runs in the pool)"""
+        if len(texts) == 1:
+            return [self.backend.translate(texts[0], target)]
+        lines = self.backend.translate("\n".join(texts), target).split("\n")
+        if len(lines) == len(texts):
+            return lines
+        # the backend merged or split lines; translate one by one
+        return [self.backend.translate(text, target) for text in texts]
+
+    async def _run(self, texts, target, futures):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, self._call, texts, target)
+        except Exception as e:
+            for text, future in zip(texts, futures):
+                self._in_flight.pop((text, target), None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future, result in zip(texts, futures, results):
+            self._cache.set((text, target), result)
+            self._in_flight.pop((text, target), None)
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        for target in list(self._pending):
+            self._flush(target)
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+        try:
+            self.save()
+        except OSError as e:
+            logger.error(f"Error saving translation cache {self.cache_path}: {e}")
+        self._executor.shutdown(wait=False)
+
+
+_service = None
+
+
+def get_translation_service(cache_path=None):
+    """
+    The process-wide service (created on first use). The cache file is
+    config.json's translation_cache_path unless one is given.
+    """
+    global _service
+    if _service is None:
+        if cache_path is None:
+            from utils import load_json
+
+            path = load_json("config.json", {}).get("translation_cache_path")
+            if path:
+                cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        _service = TranslationService(cache_path=cache_path)
+    return _service
+
+
+async def close_translation_service():
+    global _service
+    if _service is not None:
+        await _service.close()
+        _service = None
@@ -1,5 +1,9 @@
-import json,logging,os
-from deep_translator import GoogleTranslator
+import json,logging,os,sys,time
+
+# Add the main directory to the path (also when imported as main.utils)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from translator import get_translation_service
 
 logger = logging.getLogger(__name__)
 
@@ -24,57 +28,160 @@ def load_data(filename, default=None):
     except Exception as e:
         print(f"Error loading {filename}: {e}")
         return default or {}
+class JsonResourceCache:
+    """
+    Process-wide cache for JSON resources such as cmd.json and msg.json.
+
+    Each file is located once, parsed once and then served from memory.
+    The file's mtime is checked at most every ``check_interval`` seconds and
+    the file is re-parsed only when it changed, so edited translations are
+    picked up without a restart. Returned data is shared and must not be
+    mutated by callers.
+    """
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._entries = {}
+
+    @staticmethod
+    def _candidates(filename):
+        if os.path.isabs(filename):
+            return [filename]
+        base_dir = os.path.dirname(os.path.abspath(__file__))  # .../main
+        return [
+            filename,  # as given (CWD relative)
+            os.path.join(base_dir, filename),  # next to utils.py (main)
+            os.path.join(base_dir, "modules", filename),  # main/modules
+            os.path.join(os.path.dirname(base_dir), filename),  # parent of main
+        ]
+
+    def _resolve(self, filename):
+        for path in self._candidates(filename):
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+        return None
+
+    def get(self, filename):
+        """Return parsed data for filename, or None if it can't be loaded"""
+        now = time.monotonic()
+        entry = self._entries.get(filename)
+        if entry is not None and now - entry["checked"] < self.check_interval:
+            return entry["data"]
+
+        path = entry["path"] if entry and entry["path"] else self._resolve(filename)
+        mtime = None
+        if path:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                # file moved or deleted; look it up again
+                path = self._resolve(filename)
+                if path:
+                    try:
+                        mtime = os.stat(path).st_mtime_ns
+                    except OSError:
+                        path = None
+
+        if path is None:
+            self._entries[filename] = {
+                "path": None, "mtime": None, "data": None, "checked": now
+            }
+            return None
+
+        if entry is not None and entry["path"] == path and entry["mtime"] == mtime:
+            entry["checked"] = now
+            return entry["data"]
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading {path}: {e}")
+            if entry is not None and entry["data"] is not None:
+                # keep serving the last good copy (e.g. half-saved edit)
+                entry["checked"] = now
+                return entry["data"]
+            data = None
+
+        self._entries[filename] = {
+            "path": path, "mtime": mtime, "data": data, "checked": now
+        }
+        return data
+
+    def invalidate(self, filename=None):
+        if filename is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(filename, None)
+
+
+resources = JsonResourceCache()
+
+
 def load_json(filename, default=None):
     """
-    Load a JSON file trying multiple likely locations:
+    Load a JSON file through the shared resource cache, trying:
     - Absolute path as given
     - CWD-relative (as given)
-    - Next to this utils.py (main/modules/<filename>)
-    - One directory up (main/<filename>)
+    - Next to this utils.py (main/<filename>)
+    - The modules directory (main/modules/<filename>)
+    - One directory up (<root>/<filename>)
     Returns default ({} by default) if not found or on error.
     """
-    candidates = []
     try:
-        if os.path.isabs(filename):
-            candidates.append(filename)
-        else:
-            # as given (CWD relative)
-            candidates.append(filename)
-            base_dir = os.path.dirname(__file__)  # .../main/modules
-            # next to utils.py (main/modules)
-            candidates.append(os.path.join(base_dir, filename))
-            # parent directory (main)
-            candidates.append(os.path.join(os.path.dirname(base_dir), filename))
-
-        for path in candidates:
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                return data if data else (default or {})
-            except FileNotFoundError:
-                continue
-            except Exception:
-                continue
-        return default or {}
+        data = resources.get(filename)
+        return data if data else (default or {})
     except Exception:
         return default or {}
-def get_message(key, lang="fa", **kwargs):
+_message_index = {"source": None, "langs": {}}
+def _message_table(lang):
+    """
+    Flattened {key: text} table of msg.json for a language; keys inside
+    sections (e.g. "profile") are found as well. Rebuilt when msg.json changes.
+    """
     messages = load_json("msg.json", {})
-    text = messages.get(lang, {}).get(key, key)
-    return text.format(**kwargs)
+    if _message_index["source"] is not messages:
+        langs = {}
+        for lang_key, entries in messages.items():
+            table = {}
+            if isinstance(entries, dict):
+                for key, value in entries.items():
+                    if isinstance(value, dict):
+                        for sub_key, text in value.items():
+                            table.setdefault(sub_key, text)
+                for key, value in entries.items():
+                    if not isinstance(value, dict):
+                        table[key] = value
+            langs[lang_key] = table
+        _message_index["source"] = messages
+        _message_index["langs"] = langs
+    return _message_index["langs"].get(lang, {})
+class _FormatArgs(dict):
+    def __missing__(self, key):
+        # placeholders without a value are left as they are
+        return "{" + key + "}"
+def get_message(key, lang="fa", **kwargs):
+    text = _message_table(lang).get(key, key)
+    return text.format_map(_FormatArgs(kwargs))
 def get_command_pattern(key, section=None, lang="fa"):
     """
     Fetch a command regex pattern from cmd.json.
 
     Supports two calling styles:
     - New: get_command_pattern(key, section, lang)
-    - Legacy: get_command_pattern(key, lang) → section is None
+    - Legacy: get_command_pattern(key, lang) → searched in every section of lang
     """
     commands = load_json("cmd.json", {})
+    # Legacy calls pass the language where the section goes
+    if section is not None and section in commands and section not in commands.get(lang, {}):
+        section, lang = None, section
     # New style with explicit section
     if section is not None:
         return commands.get(lang, {}).get(section, {}).get(key, r"^(?!)$")
-    # Legacy style where only key and lang were provided
+    # Legacy style where only key and lang were provided: search every section
+    for value in commands.get(lang, {}).values():
+        if isinstance(value, dict) and key in value:
+            return value[key]
     return commands.get(lang, {}).get(key, r"^(?!)$")
 def get_persian_date():
     try:
@@ -91,11 +198,11 @@ def format_duration(seconds):
         return f"{seconds // 60} دقیقه"
     else:
         return f"{seconds // 3600} ساعت"
-def translate_text(text, dest="fa"):
+async def translate_text(text, dest="fa"):
     try:
-        translator = GoogleTranslator(source="auto", target=dest)
-        return translator.translate(text)
-    except:
+        return await get_translation_service().translate(text, dest)
+    except Exception as e:
+        logger.error(f"Error translating text: {e}")
         return get_message("error_occurred", lang="fa")
 async def send_message(event, text, parse_mode=None, buttons=None, **kwargs):
     """
@@ -122,20 +229,33 @@ async def is_command_message(message_text, lang, commands_data=None):
     if not message_text:
         return False
 
-    if commands_data is None:
-        commands_data = load_json("cmd.json", {})
-
-    import re
+    from router import get_command_router
 
-    all_commands = commands_data.get(lang, {})
+    return get_command_router(commands_data).is_command(message_text, lang)
+async def resolve_users(client, user_ids, chunk_size=200):
+    """
+    Fetch many users with one GetUsersRequest per chunk_size ids instead of
+    a get_entity call per id. Returns {user_id: User}; ids unknown to the
+    session are left out.
+    """
+    from telethon.tl.functions.users import GetUsersRequest
+    from telethon.tl.types import User
 
-    # بررسی همه sections های command
-    for section_name, section_commands in all_commands.items():
-        if isinstance(section_commands, dict):
-            for command_key, pattern in section_commands.items():
-                if pattern and re.match(pattern, message_text.strip(), re.IGNORECASE):
-                    return True
-    return False
+    inputs = {}
+    for user_id in dict.fromkeys(user_ids):
+        try:
+            # served from the session's entity cache, no request
+            inputs[user_id] = await client.get_input_entity(user_id)
+        except (ValueError, TypeError):
+            continue
+    users = {}
+    ids = list(inputs)
+    for start in range(0, len(ids), chunk_size):
+        chunk = [inputs[user_id] for user_id in ids[start:start + chunk_size]]
+        for user in await client(GetUsersRequest(chunk)):
+            if isinstance(user, User):
+                users[user.id] = user
+    return users
 async def upload_to_backup_channel(client, channel_id, file_path, caption=None):
     """
     آپلود فایل به کانال پشتیبان و برگرداندن ID فایل
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script for the profile clock (fonts, per-minute cache, shared ticker)
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+import clock
+from clock import FONTS, ClockTicker, apply_font, clock_text
+from modules.profile import ProfileScheduler
+from settings_store import apply_default_settings
+
+
+class FakeStore:
+    def __init__(self, **settings):
+        self.settings = apply_default_settings({"clock_timezone": "UTC", **settings})
+
+    def subscribe(self, callback):
+        pass
+
+
+class FakeClient:
+    def __init__(self):
+        self.requests = []
+
+    async def __call__(self, request):
+        self.requests.append(request)
+
+
+def test_fonts():
+    assert all(len(digits) == 10 for digits in FONTS.values())
+    assert apply_font("12:30", 1) == "12:30"
+    assert apply_font("12:30", 9) == "۱۲:۳۰"
+    assert apply_font("12:30", 5) == "①②:③⓪"
+    # unknown fonts leave the text alone
+    assert apply_font("12:30", 99) == "12:30"
+    at = datetime(2024, 1, 1, 9, 5)
+    assert [clock_text("UTC", font, at) for font in (1, 4)] == ["09:05", "０９:０５"]
+    print("✅ digits are drawn through the font tables")
+
+
+def test_minute_cache():
+    first = clock_text("Asia/Tehran", 2)
+    assert ("Asia/Tehran", 2) in clock._rendered
+    assert ("Asia/Tehran", 1) in clock._rendered
+    # a second session of the same timezone reuses the text
+    assert clock_text("Asia/Tehran", 2) is first
+    # a new minute drops the old texts
+    clock._minute -= 1
+    clock_text("UTC", 1)
+    assert ("Asia/Tehran", 2) not in clock._rendered
+    print("✅ clock texts are cached per minute")
+
+
+def test_ticker():
+    now = [119.0]
+    ticker = ClockTicker(interval=60, clock=lambda: now[0])
+    assert abs(ticker.seconds_to_next_tick() - 1.05) < 1e-9
+
+    calls = []
+    second = lambda: calls.append("b")
+    ticker._subscribers += [lambda: calls.append("a"), lambda: 1 / 0, second]
+    # a failing subscriber doesn't stop the rest
+    ticker.fire()
+    ticker.unsubscribe(second)
+    ticker.fire()
+    assert calls == ["a", "b", "a"]
+
+    async def run():
+        ticker = ClockTicker(interval=0.1)
+        ticked = asyncio.Event()
+        ticker.subscribe(ticked.set)
+        await asyncio.wait_for(ticked.wait(), 1)
+        await ticker.close()
+        assert ticker._task is None
+
+    asyncio.run(run())
+    print("✅ one ticker wakes every subscriber")
+
+
+def test_scheduler_clock():
+    async def run():
+        at = datetime(2024, 1, 1, 12, 30)
+        client = FakeClient()
+        store = FakeStore(clock_enabled=True, clock_location="both", clock_bio_text="time:", clock_fonts=[9])
+        scheduler = ProfileScheduler(client, store, owner_id=1, ticker=ClockTicker())
+        assert scheduler.active()
+        await scheduler.tick(at)
+        request = client.requests[0]
+        assert request.last_name == "۱۲:۳۰"
+        assert request.about == "time: ۱۲:۳۰"
+
+        # minute boundaries wake the scheduler only while something is on
+        scheduler.start()
+        assert scheduler._on_minute in scheduler.ticker._subscribers
+        await asyncio.sleep(0)
+        scheduler._wake.clear()
+        store.settings["clock_enabled"] = False
+        scheduler._on_minute()
+        assert not scheduler._wake.is_set()
+        await scheduler.close()
+        assert scheduler.ticker._subscribers == []
+        await scheduler.ticker.close()
+
+    asyncio.run(run())
+    print("✅ the profile scheduler renders the clock")
+
+
+if __name__ == "__main__":
+    test_fonts()
+    test_minute_cache()
+    test_ticker()
+    test_scheduler_clock()
+    print("🎉 All clock tests passed!")
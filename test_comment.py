@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Test script for the first-comment racer
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from metrics import Metrics
+from modules.comment import DiscussionIndex, FirstCommenter
+from rpc import HIGH, RpcScheduler, no_retry, rpc_priority, rpc_retry
+from telethon.errors import FloodWaitError
+from settings_store import apply_default_settings
+from telethon.tl.types import (
+    Channel,
+    ChatPhotoEmpty,
+    Message,
+    MessageFwdHeader,
+    PeerChannel,
+    UpdateNewChannelMessage,
+)
+
+CHANNEL = 10
+GROUP = 20
+POSTED = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeStore:
+    def __init__(self, **settings):
+        self.settings = apply_default_settings(settings)
+        self.listeners = []
+
+    def get(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def set(self, key, value):
+        self.settings[key] = value
+        for callback in self.listeners:
+            callback({key})
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+
+def channel(channel_id, broadcast=True, has_link=True, left=False):
+    return Channel(
+        id=channel_id,
+        title=f"chat {channel_id}",
+        photo=ChatPhotoEmpty(),
+        date=None,
+        access_hash=channel_id * 100,
+        broadcast=broadcast,
+        megagroup=not broadcast,
+        has_link=has_link,
+        left=left,
+    )
+
+
+class FakeClient:
+    def __init__(self, dialogs=()):
+        self.dialogs = dialogs
+        self.requests = []
+        self.lanes = []
+        self.retries = []
+        self.flood = False
+        self._event_builders = [("dispatcher", None)]
+
+    async def _parse_message_text(self, text, parse_mode):
+        return text.replace("<b>", "").replace("</b>", ""), ["bold"] if "<b>" in text else []
+
+    async def iter_dialogs(self):
+        for entity in self.dialogs:
+            yield SimpleNamespace(entity=entity)
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        self.lanes.append(rpc_priority.get())
+        self.retries.append(rpc_retry.get())
+        if self.flood:
+            raise FloodWaitError(request=request, capture=30)
+        if type(request).__name__ == "GetFullChannelRequest":
+            channel_id = request.channel.channel_id
+            group = channel(GROUP, broadcast=False) if channel_id == CHANNEL else channel(channel_id + 1, broadcast=False, left=True)
+            return SimpleNamespace(full_chat=SimpleNamespace(linked_chat_id=group.id), chats=[group])
+
+    def add_event_handler(self, callback, event=None):
+        self._event_builders.append((event, callback))
+
+    def remove_event_handler(self, callback, event=None):
+        self._event_builders = [item for item in self._event_builders if item[1] != callback]
+
+
+def post(peer_id, from_channel=CHANNEL, forwarded=True, message_id=5):
+    return UpdateNewChannelMessage(
+        message=Message(
+            id=message_id,
+            peer_id=PeerChannel(peer_id),
+            date=POSTED,
+            message="new post",
+            from_id=PeerChannel(from_channel),
+            fwd_from=MessageFwdHeader(date=POSTED, channel_post=1) if forwarded else None,
+        ),
+        pts=1,
+        pts_count=1,
+    )
+
+
+def test_discussion_index():
+    async def run():
+        dialogs = [channel(CHANNEL), channel(30), channel(40, has_link=False), channel(50, broadcast=False)]
+        client = FakeClient(dialogs)
+        store = FakeStore()
+        index = DiscussionIndex(client, store)
+        assert not index.indexed
+        await index.rebuild()
+        # only linked broadcast channels are asked; groups we left are skipped
+        assert [request.channel.channel_id for request in client.requests] == [CHANNEL, 30]
+        assert store.get("comment_links") == {GROUP: [CHANNEL, GROUP * 100]}
+        # a later start reads the index without requests
+        loaded = DiscussionIndex(FakeClient(), store).load()
+        assert loaded.indexed
+        channel_id, peer = loaded.get(GROUP)
+        assert channel_id == CHANNEL and peer.channel_id == GROUP and peer.access_hash == GROUP * 100
+
+    asyncio.run(run())
+    print("✅ discussion groups are indexed once")
+
+
+def test_first_comment():
+    async def run():
+        client = FakeClient()
+        store = FakeStore(first_comment_enabled=True, comment_links={GROUP: [CHANNEL, 7]})
+        metrics = Metrics("alice")
+        commenter = FirstCommenter(client, store, DiscussionIndex(client, store).load(), metrics)
+        await commenter.prepare("<b>first!</b>")
+        commenter.install()
+        # the racer runs before the dispatcher
+        assert client._event_builders[0][1] == commenter.on_update
+
+        await commenter.on_update(post(GROUP))
+        # ignored: other chats, messages that aren't the channel's copy
+        await commenter.on_update(post(99))
+        await commenter.on_update(post(GROUP, forwarded=False))
+        await commenter.on_update(post(GROUP, from_channel=11))
+        store.settings["first_comment_enabled"] = False
+        await commenter.on_update(post(GROUP, message_id=6))
+
+        assert len(client.requests) == 1
+        request = client.requests[0]
+        assert request.peer.channel_id == GROUP and request.peer.access_hash == 7
+        assert request.reply_to.reply_to_msg_id == 5
+        assert request.message == "first!" and request.entities == ["bold"]
+        assert client.lanes == [HIGH]
+        # never retried: a late comment is useless
+        assert client.retries == [False]
+        assert metrics.histogram("first_comment_seconds", channel=str(CHANNEL)).count == 1
+        assert metrics.histogram("first_comment_send_seconds", channel=str(CHANNEL)).count == 1
+
+        # a flood wait fails the comment at once
+        store.settings["first_comment_enabled"] = True
+        client.flood = True
+        await commenter.on_update(post(GROUP, message_id=7))
+        assert len(client.requests) == 2
+        assert metrics.histogram("first_comment_seconds", channel=str(CHANNEL)).count == 1
+
+        # a new text is prepared for the next post
+        store.set("first_comment_text", "me first")
+        await commenter._prepare_task
+        assert commenter._message == "me first"
+
+        await commenter.close()
+        assert client._event_builders == [("dispatcher", None)]
+
+    asyncio.run(run())
+    print("✅ posts of indexed channels get the prepared comment")
+
+
+def test_no_retry_fails_fast():
+    async def run():
+        scheduler = RpcScheduler()
+        calls = []
+
+        async def call(sender, request, ordered=False, flood_sleep_threshold=None):
+            calls.append(request)
+            raise FloodWaitError(request=request, capture=30)
+
+        client = FakeClient()
+        commenter = FirstCommenter(client, FakeStore(), DiscussionIndex(client, FakeStore()))
+        await commenter.prepare("first")
+        request = commenter.request(PeerChannel(GROUP), 5)
+        for _ in range(2):
+            try:
+                with no_retry():
+                    await asyncio.wait_for(scheduler.call(call, None, request), 1)
+            except FloodWaitError as e:
+                assert e.seconds == 30
+        # the flood wait blocked the bucket, so the second try never reached Telegram
+        assert len(calls) == 1
+
+    asyncio.run(run())
+    print("✅ comments fail fast on flood waits")
+
+
+if __name__ == "__main__":
+    test_discussion_index()
+    test_first_comment()
+    test_no_retry_fails_fast()
+    print("🎉 All first comment tests passed!")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Test script for the per-session database layer
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+
+async def _run_session_databases():
+    import ormax_models
+    from database import close_databases, get_session_db, open_session_db
+
+    first = await open_session_db("first", "selfbot_first.db")
+    second = await open_session_db("second", "selfbot_second.db")
+    try:
+        # one connection per session, reused on every call
+        assert await open_session_db("first") is first
+        assert get_session_db("second") is second
+        assert first.models.Settings is not second.models.Settings
+
+        assert await ormax_models.update_settings_fields({"lang": "en"}, database=first)
+        assert (await ormax_models.load_settings(first))["lang"] == "en"
+        assert (await ormax_models.load_settings(second))["lang"] == "fa"
+
+        row = await first.fetch_one("PRAGMA journal_mode")
+        assert list(row.values())[0] == "wal"
+    finally:
+        await close_databases()
+    assert get_session_db("first") is None
+    assert os.path.exists("selfbot_first.db") and os.path.exists("selfbot_second.db")
+
+
+def test_session_databases():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            asyncio.run(_run_session_databases())
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    test_session_databases()
+    print("Database tests passed!")
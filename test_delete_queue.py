@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test script for the persistent delayed-deletion queue
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from delete_queue import DeletionQueue
+from metrics import Metrics
+from scheduler import TimerWheel
+
+
+class FakeClient:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_messages(self, chat, ids, revoke=True):
+        self.deleted.append((chat, list(ids)))
+
+
+async def _run_queue():
+    from database import SessionDatabase
+
+    database = await SessionDatabase("test", "selfbot_test.db").connect()
+    try:
+        now = [1000.0]
+        client = FakeClient()
+        metrics = Metrics("alice")
+        queue = DeletionQueue(client, database, clock=lambda: now[0], metrics=metrics)
+
+        # a burst of welcomes in two chats
+        for message_id in range(1, 151):
+            await queue.schedule(-100, [message_id], delay=30)
+        await queue.schedule(-200, [7, 8], delay=30)
+        await queue.schedule(-200, [9], delay=60)
+        assert len(queue) == 153
+
+        # nothing is due yet
+        assert await queue.flush() == 0
+        assert client.deleted == []
+
+        now[0] += 30
+        assert await queue.flush() == 152
+        # one request per chat, split at 100 ids
+        assert sorted((chat, len(ids)) for chat, ids in client.deleted) == [(-200, 2), (-100, 50), (-100, 100)]
+        assert metrics.counter("queued_deletion_requests") == 3
+
+        # cancelled messages are kept
+        await queue.schedule(-200, [10], delay=30)
+        await queue.cancel(-200, [10])
+        assert queue.next_due() == 1060
+
+        # a restart resumes what is still queued
+        resumed = await DeletionQueue(client, database, clock=lambda: now[0]).load()
+        assert len(resumed) == 1
+        client.deleted.clear()
+        now[0] += 30
+        assert await resumed.flush() == 1
+        assert client.deleted == [(-200, [9])]
+        assert len(await DeletionQueue(client, database).load()) == 0
+    finally:
+        await database.close()
+
+
+def test_deletion_queue():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            asyncio.run(_run_queue())
+        finally:
+            os.chdir(cwd)
+    print("✅ queued deletions are batched per chat and survive restarts")
+
+
+async def _run_task():
+    from database import SessionDatabase
+
+    database = await SessionDatabase("test", "selfbot_test.db").connect()
+    client = FakeClient()
+    wheel = TimerWheel(resolution=0.05)
+    wheel.start()
+    queue = DeletionQueue(client, database, wheel=wheel, tick=0.1)
+    try:
+        await queue.schedule(-100, [1, 2], delay=0.1)
+        # an earlier message moves the timer forward
+        await queue.schedule(-100, [3], delay=0)
+        for _ in range(300):
+            if sum(len(ids) for _, ids in client.deleted) == 3:
+                break
+            await asyncio.sleep(0.01)
+        # nothing is left armed once the queue is empty
+        assert not queue and queue._timer is None
+    finally:
+        await queue.close()
+        await wheel.close()
+        await database.close()
+    return client.deleted
+
+
+def test_deletion_task():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            deleted = asyncio.run(_run_task())
+            assert sorted(message_id for _, ids in deleted for message_id in ids) == [1, 2, 3]
+        finally:
+            os.chdir(cwd)
+    print("✅ the wheel timer deletes messages when due")
+
+
+if __name__ == "__main__":
+    test_deletion_queue()
+    test_deletion_task()
+    print("🎉 All deletion queue tests passed!")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Test script for the single NewMessage dispatcher
+"""
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from cache import DisplayNameCache
+from dispatcher import get_dispatcher, install_dispatcher
+from metrics import Metrics
+from router import CommandRouter
+from telethon.tl.types import User
+
+CMD_JSON = os.path.join(os.path.dirname(__file__), 'main', 'modules', 'cmd.json')
+OWNER = 42
+
+
+class FakeClient:
+    def __init__(self, metrics=None):
+        self.handlers = []
+        if metrics is not None:
+            self._metrics = metrics
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append((event, callback))
+
+
+def message(text, out=False, sender_id=OWNER, is_private=True):
+    return SimpleNamespace(raw_text=text, out=out, sender_id=sender_id, is_private=is_private, pattern_match=None)
+
+
+def make_dispatcher(settings=None, metrics=None):
+    with open(CMD_JSON, encoding="utf-8") as f:
+        router = CommandRouter(json.load(f))
+    client = FakeClient(metrics)
+    dispatcher = install_dispatcher(client, OWNER, settings or {"lang": "en"}, router=router)
+    return client, dispatcher
+
+
+def test_single_handler():
+    client, dispatcher = make_dispatcher()
+    assert get_dispatcher(client) is dispatcher
+    assert install_dispatcher(client, OWNER, {}) is dispatcher
+    assert len(client.handlers) == 1
+    print("✅ one handler per client")
+
+
+def test_command_routing():
+    async def run():
+        client, dispatcher = make_dispatcher()
+        calls = []
+
+        @dispatcher.command("name_toggle")
+        async def toggle(event):
+            calls.append(("toggle", event.pattern_match.group(1)))
+
+        @dispatcher.command("delete_messages")
+        async def delete(event):
+            calls.append(("delete", event.pattern_match.group(1)))
+
+        @dispatcher.hook()
+        async def hook(event):
+            calls.append(("hook", event.raw_text))
+
+        await dispatcher.dispatch(message("/name on"))
+        await dispatcher.dispatch(message("/delete 30", out=True, sender_id=None))
+        # commands from other people are plain messages
+        await dispatcher.dispatch(message("/name off", sender_id=7))
+        # commands without a handler go nowhere
+        await dispatcher.dispatch(message("/tagall"))
+        await dispatcher.dispatch(message("hello"))
+        return calls
+
+    assert asyncio.run(run()) == [
+        ("toggle", "on"),
+        ("delete", "30"),
+        ("hook", "/name off"),
+        ("hook", "hello"),
+    ]
+    print("✅ commands are routed by key, the rest goes to hooks")
+
+
+def test_hook_prefilters():
+    async def run():
+        settings = {"lang": "en", "antispam_enabled": False}
+        client, dispatcher = make_dispatcher(settings)
+        calls = []
+
+        @dispatcher.hook(outgoing=False, private=True, feature="antispam_enabled")
+        async def spam(event):
+            calls.append(("spam", event.raw_text))
+
+        @dispatcher.hook(incoming=False)
+        async def owner_only(event):
+            calls.append(("owner", event.raw_text))
+
+        await dispatcher.dispatch(message("a", sender_id=7))
+        settings["antispam_enabled"] = True
+        await dispatcher.dispatch(message("b", sender_id=7))
+        await dispatcher.dispatch(message("c", sender_id=7, is_private=False))
+        await dispatcher.dispatch(message("d"))
+        return calls
+
+    assert asyncio.run(run()) == [("spam", "b"), ("owner", "d")]
+    print("✅ hooks are filtered by direction, chat type and feature flag")
+
+
+def test_errors_and_metrics():
+    async def run():
+        metrics = Metrics("alice")
+        client, dispatcher = make_dispatcher(metrics=metrics)
+        calls = []
+
+        @dispatcher.hook()
+        async def broken(event):
+            raise RuntimeError("boom")
+
+        @dispatcher.hook()
+        async def working(event):
+            calls.append(event.raw_text)
+
+        await dispatcher.dispatch(message("hi", sender_id=7))
+        return calls, metrics
+
+    calls, metrics = asyncio.run(run())
+    # a failing hook doesn't stop the next one
+    assert calls == ["hi"]
+    assert metrics.counter("handler_errors", handler="broken") == 1
+    assert metrics.counter("handler_calls", handler="working") == 1
+    print("✅ handler errors are contained and measured")
+
+
+def test_lang_follows_settings():
+    async def run():
+        settings = {"lang": "en"}
+        client, dispatcher = make_dispatcher(settings)
+        calls = []
+
+        @dispatcher.command("name_toggle")
+        async def toggle(event):
+            calls.append(event.pattern_match.group(1))
+
+        await dispatcher.dispatch(message("/name on"))
+        settings["lang"] = "fa"
+        await dispatcher.dispatch(message("/اسم روشن"))
+        return calls
+
+    assert asyncio.run(run()) == ["on", "روشن"]
+    print("✅ commands follow the session language")
+
+
+def test_other_people_skip_the_router():
+    class CountingRouter(CommandRouter):
+        calls = 0
+
+        def match(self, message_text, lang="fa"):
+            CountingRouter.calls += 1
+            return super().match(message_text, lang)
+
+    async def run():
+        with open(CMD_JSON, encoding="utf-8") as f:
+            router = CountingRouter(json.load(f))
+        dispatcher = install_dispatcher(FakeClient(), OWNER, {"lang": "en"}, router=router)
+        owner_calls = []
+
+        @dispatcher.hook(incoming=False)
+        async def owner_only(event):
+            owner_calls.append(event.raw_text)
+
+        for _ in range(100):
+            await dispatcher.dispatch(message("/name on", sender_id=7))
+        await dispatcher.dispatch(message("/name on"))
+        return owner_calls
+
+    assert asyncio.run(run()) == []
+    assert CountingRouter.calls == 1
+    print("✅ other people's messages never reach the router")
+
+
+def test_display_name_cache():
+    sender = User(id=7, first_name="Ali", last_name="Rezaei")
+    names = DisplayNameCache()
+    event = SimpleNamespace(sender_id=7, sender=sender)
+    assert names.get(event) == "Ali Rezaei"
+    # later messages of the sender without the entity still get the name
+    assert names.get(SimpleNamespace(sender_id=7, sender=None)) == "Ali Rezaei"
+    # unknown senders fall back to their id, never to a fetch
+    assert names.get(SimpleNamespace(sender_id=8, sender=None)) == "8"
+    assert names.get(SimpleNamespace(sender_id=None, sender=None)) == "Unknown"
+    names.forget(7)
+    assert names.get(SimpleNamespace(sender_id=7, sender=None)) == "7"
+    print("✅ sender names come from memory")
+
+
+if __name__ == "__main__":
+    test_single_handler()
+    test_command_routing()
+    test_hook_prefilters()
+    test_errors_and_metrics()
+    test_lang_follows_settings()
+    test_other_people_skip_the_router()
+    test_display_name_cache()
+    print("🎉 All dispatcher tests passed!")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Test script for tag_all and welcomes: participant cache, mention chunks,
+join batching and the send queue
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from modules.group import MAX_MESSAGE_LENGTH, ParticipantCache, SendQueue, WelcomeBatcher, build_mention_chunks, build_welcome_messages
+from rpc import BACKGROUND, rpc_priority
+
+
+def user(user_id, first_name="User", bot=False, deleted=False, is_self=False):
+    return SimpleNamespace(
+        id=user_id, first_name=f"{first_name}{user_id}", last_name=None, bot=bot, deleted=deleted, is_self=is_self
+    )
+
+
+class FakeClient:
+    def __init__(self, users):
+        self.users = users
+        self.downloads = 0
+        self.sent = []
+        self.lanes = set()
+
+    async def iter_participants(self, chat_id):
+        self.downloads += 1
+        for item in self.users:
+            await asyncio.sleep(0)
+            yield item
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.lanes.add(rpc_priority.get())
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(id=len(self.sent))
+
+
+def action(chat_id, joined=(), left=()):
+    async def get_users():
+        return list(joined)
+
+    return SimpleNamespace(
+        chat_id=chat_id,
+        user_joined=bool(joined),
+        user_added=False,
+        user_left=bool(left),
+        user_kicked=False,
+        user_ids=list(left),
+        get_users=get_users,
+    )
+
+
+def test_build_mention_chunks():
+    members = {i: f"<User {i}>" for i in range(1, 121)}
+    chunks = build_mention_chunks(members, "👥 <b>Tag all:</b>\n", per_message=50)
+    assert len(chunks) == 3
+    assert chunks[0].startswith("👥 <b>Tag all:</b>\n")
+    assert chunks[0].count("tg://user?id=") == 50
+    assert chunks[2].count("tg://user?id=") == 20
+    assert "&lt;User 1&gt;" in chunks[0]
+    # the length limit splits too
+    chunks = build_mention_chunks(members, per_message=100, max_length=500)
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert sum(chunk.count("tg://user?id=") for chunk in chunks) == 120
+    assert build_mention_chunks({}, "header") == []
+    print("✅ mentions are chunked by count and length")
+
+
+def test_participant_cache():
+    async def run():
+        users = [user(1), user(2), user(3, bot=True), user(4, deleted=True), user(5, is_self=True)]
+        client = FakeClient(users)
+        cache = ParticipantCache(client)
+        first, second = await asyncio.gather(cache.get(-100), cache.get(-100))
+        assert first is second
+        assert set(first) == {1, 2}
+        assert client.downloads == 1
+
+        await cache.on_action(action(-100, joined=[user(6)]))
+        await cache.on_action(action(-100, left=[1]))
+        # chats that were never downloaded are not tracked
+        await cache.on_action(action(-200, joined=[user(7)]))
+        members = await cache.get(-100)
+        assert set(members) == {2, 6}
+        assert client.downloads == 1
+
+        cache.invalidate(-100)
+        await cache.get(-100)
+        assert client.downloads == 2
+
+    asyncio.run(run())
+    print("✅ participant lists are cached and kept current")
+
+
+def test_participant_cache_ttl():
+    async def run():
+        now = [0.0]
+        client = FakeClient([user(1)])
+        cache = ParticipantCache(client, ttl=60, clock=lambda: now[0])
+        await cache.get(-100)
+        now[0] = 30
+        await cache.get(-100)
+        assert client.downloads == 1
+        now[0] = 100
+        await cache.get(-100)
+        assert client.downloads == 2
+
+    asyncio.run(run())
+    print("✅ participant lists expire")
+
+
+def test_send_queue():
+    async def run():
+        client = FakeClient([])
+        queue = SendQueue(client, interval=0.01)
+        sent_ids = []
+
+        async def on_sent(message):
+            sent_ids.append(message.id)
+
+        first = queue.put(-100, ["a", "b"], on_sent=on_sent)
+        second = queue.put(-200, ["c"])
+        assert await first == 2
+        assert await second == 1
+        await queue.close()
+        return client, sent_ids
+
+    client, sent_ids = asyncio.run(run())
+    assert client.sent == [(-100, "a"), (-100, "b"), (-200, "c")]
+    assert sent_ids == [1, 2]
+    assert client.lanes == {BACKGROUND}
+    print("✅ queued messages are sent in order")
+
+
+def test_build_welcome_messages():
+    members = {i: f"User{i}" for i in range(1, 121)}
+    messages = build_welcome_messages("Hello {name}, welcome!", dict(list(members.items())[:2]))
+    assert messages == [
+        'Hello <a href="tg://user?id=1">User1</a> <a href="tg://user?id=2">User2</a>, welcome!'
+    ]
+    # without {name} the mentions come first
+    assert build_welcome_messages("Welcome!", {1: "A"}) == ['<a href="tg://user?id=1">A</a> Welcome!']
+    # a raid is capped; the rest are counted
+    messages = build_welcome_messages("Hi {name}", members, per_message=50, max_messages=2)
+    assert len(messages) == 2
+    assert messages[1].endswith(" +20")
+    assert all(message.count("tg://user?id=") == 50 for message in messages)
+
+    # every {name} gets the mentions; the rendered messages stay under the limit
+    long_names = {i: "&" * 64 for i in range(1, 121)}
+    for text in ("Hi {name} and {name}!", "x" * 3000 + " {name}", "{name}" * 3):
+        messages = build_welcome_messages(text, long_names, max_messages=3)
+        assert len(messages) == 3 and " +" in messages[-1]
+        assert all(len(message) <= MAX_MESSAGE_LENGTH for message in messages), text
+    messages = build_welcome_messages("Hi {name} and {name}!", {1: "A"})
+    assert messages == ['Hi <a href="tg://user?id=1">A</a> and <a href="tg://user?id=1">A</a>!']
+    # a text too long to hold a mention is sent before them
+    text = "y" * 4000 + " {name}"
+    messages = build_welcome_messages(text, members, max_messages=3)
+    assert messages[0] == "y" * 4000
+    assert len(messages) == 3 and messages[2].endswith(" +20")
+    assert all(len(message) <= MAX_MESSAGE_LENGTH for message in messages)
+    print("✅ welcomes mention newcomers within the limits")
+
+
+def test_welcome_batcher():
+    async def run():
+        now = [0.0]
+        batches = []
+
+        async def on_batch(chat_id, members):
+            batches.append((chat_id, sorted(members)))
+
+        welcomes = WelcomeBatcher(on_batch, window=0.02, raid_window=0.2, raid_size=3, clock=lambda: now[0])
+        welcomes.add(-100, [user(1)])
+        welcomes.add(-100, [user(2), user(3, bot=True)])
+        welcomes.add(-200, [user(4)])
+        await asyncio.sleep(0.05)
+        assert sorted(batches) == [(-200, [4]), (-100, [1, 2])]
+
+        # a big batch makes the chat collect joins for the raid window
+        batches.clear()
+        welcomes.add(-100, [user(i) for i in range(10, 13)])
+        await asyncio.sleep(0.05)
+        assert welcomes._delay(-100) == 0.2
+        welcomes.add(-100, [user(20)])
+        await asyncio.sleep(0.05)
+        welcomes.add(-100, [user(21)])
+        assert len(batches) == 1
+        await welcomes.flush(-100)
+        assert batches[-1] == (-100, [20, 21])
+        # the raid is over once the window has passed
+        now[0] += 1
+        assert welcomes._delay(-100) == 0.02
+        await welcomes.close()
+
+    asyncio.run(run())
+    print("✅ joins are welcomed in batches")
+
+
+if __name__ == "__main__":
+    test_build_mention_chunks()
+    test_participant_cache()
+    test_participant_cache_ttl()
+    test_send_queue()
+    test_build_welcome_messages()
+    test_welcome_batcher()
+    print("🎉 All group tests passed!")
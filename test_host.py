@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Test script for session discovery and sharding of the multi-account host
+"""
+import json
+import os
+import sys
+import tempfile
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from host import discover_sessions, shard_sessions
+
+
+def test_discover_and_shard_sessions():
+    with tempfile.TemporaryDirectory() as users_dir:
+        for user_id in ("101", "102", "103", "104"):
+            os.makedirs(os.path.join(users_dir, user_id))
+            with open(os.path.join(users_dir, user_id, "credentials.json"), "w") as f:
+                json.dump({"session_name": f"selfbot_{user_id}"}, f)
+        # a directory without credentials is not a session
+        os.makedirs(os.path.join(users_dir, "empty"))
+
+        sessions = discover_sessions(users_dir)
+        assert [os.path.basename(path) for path in sessions] == ["101", "102", "103", "104"]
+        assert shard_sessions(sessions, 1, 0) == sessions
+
+        shards = [shard_sessions(sessions, 3, index) for index in range(3)]
+        assert sorted(path for shard in shards for path in shard) == sessions
+        # adding a user keeps the others on their shard
+        assert shard_sessions(sessions[:2], 3, 0) == [p for p in shards[0] if p in sessions[:2]]
+
+    assert discover_sessions("/nonexistent/users") == []
+
+
+if __name__ == "__main__":
+    test_discover_and_shard_sessions()
+    print("Host tests passed!")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Test script for lazy imports and the import timing report
+"""
+import os
+import sys
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+import lazy
+
+
+def test_lazy_import_loads_on_first_use():
+    sys.modules.pop("colorsys", None)
+    hls_to_rgb = lazy.lazy_import("colorsys", "hls_to_rgb")
+    assert not hls_to_rgb.loaded
+    assert "colorsys" not in sys.modules
+
+    assert hls_to_rgb(0, 0, 0) == (0, 0, 0)
+    assert hls_to_rgb.loaded
+    assert "colorsys" in sys.modules
+
+
+def test_import_timing_report():
+    sys.modules.pop("wave", None)
+    lazy.start_import_timing()
+    try:
+        import wave  # noqa: F401
+    finally:
+        lazy.stop_import_timing()
+    assert "wave" in lazy.IMPORT_TIMES
+    assert "wave" in lazy.import_report()
+    assert lazy.is_available("json")
+    assert not lazy.is_available("no_such_module_here")
+
+
+if __name__ == "__main__":
+    test_lazy_import_loads_on_first_use()
+    test_import_timing_report()
+    print("Lazy import tests passed!")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test script for the bulk message deletion engine
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from telethon.tl.types import ChatAdminRights, messages
+
+from modules.manage import can_delete_others, purge_messages
+from rpc import BACKGROUND, rpc_priority
+
+
+class FakeClient:
+    def __init__(self, message_ids, delay=0.0):
+        self.message_ids = message_ids
+        self.delay = delay
+        self.history_calls = []
+        self.batches = []
+        self.lanes = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def iter_messages(self, chat, limit=None, max_id=0, from_user=None, wait_time=None):
+        self.history_calls.append((chat, limit, max_id, from_user))
+        ids = [i for i in self.message_ids if not max_id or i < max_id][:limit]
+        for message_id in ids:
+            yield SimpleNamespace(id=message_id)
+
+    async def delete_messages(self, chat, message_ids, revoke=True):
+        self.lanes.add(rpc_priority.get())
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        self.batches.append(list(message_ids))
+        return [messages.AffectedMessages(pts=0, pts_count=len(message_ids))]
+
+
+def test_batches():
+    client = FakeClient(list(range(1050, 0, -1)), delay=0.01)
+    deleted = asyncio.run(purge_messages(client, 7, 1000, max_id=1050, concurrency=3))
+    assert deleted == 1000
+    # 10 requests for 1000 messages, never more than 3 at once
+    assert len(client.batches) == 10
+    assert all(len(batch) == 100 for batch in client.batches)
+    assert client.max_in_flight <= 3
+    assert 1050 not in {i for batch in client.batches for i in batch}
+    assert client.lanes == {BACKGROUND}
+    print("✅ messages are deleted in 100-id batches")
+
+
+def test_short_history():
+    client = FakeClient(list(range(30, 0, -1)))
+    deleted = asyncio.run(purge_messages(client, 7, 500, from_user="me"))
+    assert deleted == 30
+    assert client.batches == [list(range(30, 0, -1))]
+    assert client.history_calls[0][3] == "me"
+    print("✅ short history is one request")
+
+
+def test_progress_throttled():
+    reports = []
+
+    async def on_progress(deleted):
+        reports.append(deleted)
+
+    client = FakeClient(list(range(2000, 0, -1)), delay=0.02)
+    deleted = asyncio.run(
+        purge_messages(client, 7, 2000, concurrency=1, on_progress=on_progress,
+                       progress_interval=0.01, max_progress_edits=2)
+    )
+    assert deleted == 2000
+    assert len(reports) == 2
+    assert reports == sorted(reports)
+    print("✅ progress edits are throttled")
+
+
+def test_failure_stops_pipeline():
+    class FailingClient(FakeClient):
+        async def delete_messages(self, chat, message_ids, revoke=True):
+            raise RuntimeError("forbidden")
+
+    client = FailingClient(list(range(500, 0, -1)))
+    try:
+        asyncio.run(purge_messages(client, 7, 500))
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("error was swallowed")
+    print("✅ a failed request stops the pipeline")
+
+
+def test_can_delete_others():
+    async def check(is_private, chat):
+        async def get_chat():
+            return chat
+        return await can_delete_others(SimpleNamespace(is_private=is_private, get_chat=get_chat))
+
+    assert asyncio.run(check(True, None))
+    assert asyncio.run(check(False, SimpleNamespace(creator=True)))
+    assert asyncio.run(check(False, SimpleNamespace(creator=False, admin_rights=ChatAdminRights(delete_messages=True))))
+    assert not asyncio.run(check(False, SimpleNamespace(creator=False, admin_rights=None)))
+    print("✅ delete rights are checked")
+
+
+if __name__ == "__main__":
+    test_batches()
+    test_short_history()
+    test_progress_throttled()
+    test_failure_stops_pipeline()
+    test_can_delete_others()
+    print("🎉 All deletion tests passed!")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test script for the metrics layer
+"""
+import asyncio
+import os
+import sys
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from metrics import LoopLagMonitor, Metrics, MetricsServer, get_metrics, instrument_client, render_registries
+
+
+class FakeRequest:
+    pass
+
+
+class FakeClient:
+    def __init__(self):
+        self.handlers = []
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append((event, callback))
+
+    def remove_event_handler(self, callback, event=None):
+        before = len(self.handlers)
+        self.handlers = [(e, cb) for e, cb in self.handlers if cb is not callback]
+        return before - len(self.handlers)
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        if isinstance(request, str):
+            raise ValueError(request)
+        return "ok"
+
+
+def test_render():
+    metrics = Metrics("alice")
+    metrics.inc("handler_calls", handler="greet")
+    metrics.observe("handler_seconds", 0.003, handler="greet")
+    with metrics.timer("startup_phase_seconds", phase="login"):
+        pass
+    text = metrics.render()
+    assert 'selfbot_handler_calls_total{session="alice",handler="greet"} 1' in text
+    assert 'selfbot_handler_seconds_bucket{session="alice",handler="greet",le="0.005"} 1' in text
+    assert 'selfbot_handler_seconds_bucket{session="alice",handler="greet",le="0.001"} 0' in text
+    assert 'selfbot_handler_seconds_count{session="alice",handler="greet"} 1' in text
+    assert "# TYPE selfbot_startup_phase_seconds histogram" in text
+
+
+def test_render_registries():
+    alice, bob = Metrics("alice"), Metrics("bob")
+    for metrics in (alice, bob):
+        metrics.inc("handler_calls", handler="greet")
+        metrics.observe("handler_seconds", 0.003, handler="greet")
+    text = render_registries([alice, bob])
+    # one TYPE line per family, followed by the samples of every session
+    assert text.count("# TYPE selfbot_handler_calls_total counter") == 1
+    assert text.count("# TYPE selfbot_handler_seconds histogram") == 1
+    lines = text.splitlines()
+    calls = lines.index("# TYPE selfbot_handler_calls_total counter")
+    assert lines[calls + 1:calls + 3] == [
+        'selfbot_handler_calls_total{session="alice",handler="greet"} 1',
+        'selfbot_handler_calls_total{session="bob",handler="greet"} 1',
+    ]
+
+
+async def _run_instrumented_client():
+    metrics = Metrics("bob")
+    client = instrument_client(FakeClient(), metrics)
+
+    async def greet(event):
+        if event == "boom":
+            raise RuntimeError(event)
+
+    client.add_event_handler(greet)
+    _, wrapper = client.handlers[0]
+    await wrapper("hi")
+    try:
+        await wrapper("boom")
+    except RuntimeError:
+        pass
+    assert metrics.counter("handler_calls", handler="greet") == 2
+    assert metrics.counter("handler_errors", handler="greet") == 1
+    assert client.remove_event_handler(greet) == 1
+
+    assert await client._call(None, FakeRequest()) == "ok"
+    try:
+        await client._call(None, "bad")
+    except ValueError:
+        pass
+    assert metrics.counter("rpc_calls", request="FakeRequest") == 1
+    assert metrics.counter("rpc_errors", request="str", error="ValueError") == 1
+    assert metrics.histogram("rpc_seconds", request="FakeRequest").count == 1
+
+
+def test_instrument_client():
+    asyncio.run(_run_instrumented_client())
+
+
+async def _run_lag_and_server():
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.05)
+    await monitor.close()
+    assert get_metrics().histogram("event_loop_lag_seconds").count >= 2
+
+    server = await MetricsServer(port=0).start()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        await writer.drain()
+        response = (await reader.read()).decode()
+        writer.close()
+    finally:
+        await server.close()
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert 'selfbot_event_loop_lag_seconds_count{session="_process"}' in response
+
+
+def test_loop_lag_and_endpoint():
+    asyncio.run(_run_lag_and_server())
+
+
+if __name__ == "__main__":
+    test_render()
+    test_render_registries()
+    test_instrument_client()
+    test_loop_lag_and_endpoint()
+    print("Metrics tests passed!")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Test script for the plugin registry
+"""
+import asyncio
+import importlib.machinery
+import os
+import sys
+import types
+from types import SimpleNamespace
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from dispatcher import install_dispatcher
+from plugins import PLUGINS, Plugin, PluginRegistry, command_keys
+from router import CommandRouter
+
+COMMANDS = {
+    "en": {
+        "profile": {"check": "^[/!]check$", "name_toggle": "^[/!]name\\s+(on|off)$", "tag_all": "^[/!]tagall$"},
+        "vars": {"set_rank": "^[/!]setrank\\s+(.+)$"},
+    }
+}
+
+
+class FakeClient:
+    def __init__(self):
+        self.handlers = []
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append((event, callback))
+
+    async def dispatch(self, event):
+        for _, callback in self.handlers:
+            await callback(event)
+
+
+def fake_module(name, log):
+    """A plugin module whose registrar adds a command and a hook and records calls"""
+    module = types.ModuleType(name)
+    module.__spec__ = importlib.machinery.ModuleSpec(name, None)
+
+    class Service:
+        closed = False
+
+        async def close(self):
+            Service.closed = True
+
+    async def register(client, session_name, owner_id):
+        log.append(("register", name))
+        dispatcher = client._dispatcher
+
+        @dispatcher.command(COMMAND_OF.get(name, name))
+        async def command(event):
+            log.append(("command", name, event.raw_text))
+
+        @dispatcher.hook(incoming=False)
+        async def hook(event):
+            log.append(("hook", name, event.raw_text))
+
+        return Service()
+
+    module.register = register
+    sys.modules[name] = module
+    return module
+
+
+# the command each fake plugin handles
+COMMAND_OF = {"fake_group": "tag_all", "fake_profile": "name_toggle", "fake_spam": "check"}
+
+
+def message(text, out=True, sender_id=1):
+    return SimpleNamespace(raw_text=text, out=out, sender_id=sender_id, is_private=True)
+
+
+def make_registry(log, plugins):
+    for plugin in plugins:
+        if plugin.module.startswith("fake_"):
+            fake_module(plugin.module, log)
+    client = FakeClient()
+    dispatcher = install_dispatcher(client, 1, {"lang": "en"}, router=CommandRouter(COMMANDS))
+    registry = dispatcher.registry = PluginRegistry(client, "test", owner_id=1, plugins=plugins, commands=COMMANDS)
+    return client, registry
+
+
+def test_command_keys():
+    plugins = [
+        Plugin("group", "fake_group", "register", commands=("tag_all",)),
+        Plugin("profile", "fake_profile", "register", section="profile"),
+    ]
+    keys = command_keys(plugins, COMMANDS["en"])
+    assert keys == {"group": ["tag_all"], "profile": ["check", "name_toggle"]}
+    # the real table hands every command to one plugin at most
+    keys = command_keys(PLUGINS, COMMANDS["en"])
+    assert "tag_all" in keys["group"] and "tag_all" not in keys["profile"]
+    print("✅ commands are split between plugins")
+
+
+def test_lazy_load():
+    async def run():
+        log = []
+        plugins = [
+            Plugin("group", "fake_group", "register", commands=("tag_all",)),
+            Plugin("profile", "fake_profile", "register", section="profile"),
+            Plugin("missing", "absent_plugin_module", "register", commands=("check",)),
+        ]
+        client, registry = make_registry(log, plugins)
+        await registry.start({})
+        assert "missing" not in registry.plugins
+        assert log == []
+
+        # plain text loads nothing
+        await client.dispatch(message("hello"))
+        assert log == []
+        # first matching command loads the plugin, whose handler runs the same message
+        await client.dispatch(message("/tagall"))
+        assert log == [("register", "fake_group"), ("command", "fake_group", "/tagall")]
+        await client.dispatch(message("/tagall"))
+        assert log.count(("register", "fake_group")) == 1
+        # other people's messages load nothing
+        await client.dispatch(message("/name on", out=False, sender_id=5))
+        assert "profile" not in registry.loaded
+        await client.dispatch(message("/name on"))
+        assert "profile" in registry.loaded
+
+        await registry.close()
+        assert registry.loaded["group"].closed
+
+    asyncio.run(run())
+    print("✅ plugins load on their first command")
+
+
+def test_eager_and_matches():
+    async def run():
+        log = []
+        plugins = [
+            Plugin("always", "fake_always", "register"),
+            Plugin("spam", "fake_spam", "register", commands=("check",), eager=lambda s: s.get("antispam_enabled")),
+            Plugin("vars", "fake_vars", "register", section="vars", matches=lambda text: "TIME" in text),
+        ]
+        client, registry = make_registry(log, plugins)
+        await registry.start({"antispam_enabled": True})
+        assert set(registry.loaded) == {"always", "spam"}
+        await client.dispatch(message("it is TIME"))
+        assert "vars" in registry.loaded
+        # the plugin loaded by the text sees it through its hook
+        assert ("hook", "fake_vars", "it is TIME") in log
+        # nothing left to match against
+        assert registry._matchers == []
+
+    asyncio.run(run())
+    print("✅ eager plugins load at startup, predicates trigger loads")
+
+
+def test_load_in_flight_and_retry():
+    async def run():
+        log = []
+        plugins = [Plugin("vars", "fake_slow_vars", "register", section="vars", matches=lambda text: "TIME" in text)]
+        client, registry = make_registry(log, plugins)
+        module = sys.modules["fake_slow_vars"]
+        register = module.register
+        release = asyncio.Event()
+        attempts = []
+
+        async def slow_register(client, session_name, owner_id):
+            attempts.append(session_name)
+            if len(attempts) == 1:
+                raise RuntimeError("broken")
+            await release.wait()
+            return await register(client, session_name, owner_id)
+
+        module.register = slow_register
+        # a failed load isn't remembered and keeps its matcher
+        await client.dispatch(message("it is TIME"))
+        assert "vars" not in registry.loaded and registry._matchers
+
+        # a message arriving during the load waits for it instead of being dropped
+        first = asyncio.create_task(client.dispatch(message("TIME one")))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(client.dispatch(message("TIME two")))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, second)
+        assert len(attempts) == 2
+        assert ("hook", "fake_slow_vars", "TIME one") in log and ("hook", "fake_slow_vars", "TIME two") in log
+        assert registry._matchers == []
+
+    asyncio.run(run())
+    print("✅ failed loads are retried, concurrent ones are awaited")
+
+
+if __name__ == "__main__":
+    test_command_keys()
+    test_lazy_load()
+    test_eager_and_matches()
+    test_load_in_flight_and_retry()
+    print("🎉 All plugin tests passed!")
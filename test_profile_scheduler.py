@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test script for the batched profile scheduler
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime
+from types import SimpleNamespace
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from modules.profile import OwnedChatIndex, ProfileScheduler
+from telethon.tl.types import Channel, Chat, PeerChannel, UpdateChannel, User
+from telethon.utils import get_peer_id
+from settings_store import apply_default_settings
+
+
+class FakeStore:
+    def __init__(self):
+        self.settings = apply_default_settings({"clock_timezone": "UTC"})
+        self.listeners = []
+
+    def get(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def set(self, key, value):
+        self.settings[key] = value
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def mark_dirty(self, *keys):
+        for callback in self.listeners:
+            callback(set(keys))
+
+
+class FakeClient:
+    def __init__(self, dialogs=(), entities=None):
+        self.requests = []
+        self.dialogs = list(dialogs)
+        self.entities = entities or {}
+        self.scans = 0
+
+    async def __call__(self, request):
+        self.requests.append(request)
+
+    async def iter_dialogs(self):
+        self.scans += 1
+        for entity in self.dialogs:
+            yield SimpleNamespace(entity=entity)
+
+    async def get_entity(self, peer):
+        return self.entities[peer.channel_id]
+
+
+def _channel(channel_id, creator, left=False):
+    return Channel(id=channel_id, title="old", photo=None, date=None, creator=creator, left=left, access_hash=7)
+
+
+async def _run_scheduler():
+    now = [1000.0]
+    client = FakeClient()
+    store = FakeStore()
+    scheduler = ProfileScheduler(client, store, owner_id=1, clock=lambda: now[0])
+    at = datetime(2024, 1, 1, 12, 30)
+
+    # nothing enabled: no requests at all
+    await scheduler.tick(at)
+    assert client.requests == []
+    assert not scheduler.active()
+
+    profile = store.settings["profile_settings"]
+    profile.update(name_enabled=True, names=["Ali time"], bio_enabled=True, bios=["hi"])
+    store.mark_dirty("profile_settings")
+    assert scheduler._wake.is_set()
+
+    # name and bio go out in one request
+    await scheduler.tick(at)
+    assert len(client.requests) == 1
+    request = client.requests[0]
+    assert type(request).__name__ == "UpdateProfileRequest"
+    assert request.last_name == "Ali 12:30" and request.about == "hi"
+
+    # unchanged text is not sent again
+    await scheduler.tick(at)
+    assert len(client.requests) == 1
+
+    # only the changed field is sent
+    await scheduler.tick(datetime(2024, 1, 1, 12, 31))
+    assert len(client.requests) == 2
+    assert client.requests[1].last_name == "Ali 12:31" and client.requests[1].about is None
+
+    # online is pinged once per interval, offline is sent once
+    profile["online_enabled"] = True
+    await scheduler.tick(datetime(2024, 1, 1, 12, 31))
+    await scheduler.tick(datetime(2024, 1, 1, 12, 31))
+    statuses = [r for r in client.requests if type(r).__name__ == "UpdateStatusRequest"]
+    assert [r.offline for r in statuses] == [False]
+    now[0] += ProfileScheduler.ONLINE_PING_INTERVAL
+    profile["online_enabled"] = False
+    await scheduler.tick(datetime(2024, 1, 1, 12, 31))
+    await scheduler.tick(datetime(2024, 1, 1, 12, 31))
+    statuses = [r for r in client.requests if type(r).__name__ == "UpdateStatusRequest"]
+    assert [r.offline for r in statuses] == [False, True]
+
+    # every minute boundary wakes an active scheduler
+    scheduler._wake.clear()
+    profile["name_enabled"] = True
+    scheduler._on_minute()
+    assert scheduler._wake.is_set()
+
+
+def test_profile_scheduler():
+    asyncio.run(_run_scheduler())
+
+
+async def _run_owned_chat_index():
+    from database import SessionDatabase
+
+    database = await SessionDatabase("test", "selfbot_test.db").connect()
+    try:
+        owned_group = Chat(id=5, title="old", photo=None, participants_count=2, date=None, version=1, creator=True)
+        dialogs = [_channel(10, True), _channel(11, False), owned_group, User(id=3)]
+        client = FakeClient(dialogs)
+        store = FakeStore()
+        index = OwnedChatIndex(client, store, database)
+
+        await index.set_titles("Ali 12:30")
+        assert client.scans == 1
+        assert sorted(index.chats) == [5, 10]
+        kinds = sorted(type(r).__name__ for r in client.requests)
+        assert kinds == ["EditChatTitleRequest", "EditTitleRequest"]
+
+        # the same title is not sent again and dialogs are not scanned again
+        await index.set_titles("Ali 12:30")
+        assert len(client.requests) == 2
+
+        # a restarted session loads the index instead of scanning
+        restarted = OwnedChatIndex(client, store, database)
+        await restarted.ensure()
+        assert client.scans == 1 and sorted(restarted.chats) == [5, 10]
+
+        # ownership changes arrive as updates
+        # an indexed channel is looked up; one we don't own costs no request
+        client.entities = {10: _channel(10, True, left=True)}
+        await restarted.on_update(UpdateChannel(channel_id=10))
+        await restarted.on_update(UpdateChannel(channel_id=13))
+        # an owned channel sent along with the update is indexed as it is
+        created = UpdateChannel(channel_id=12)
+        created._entities = {get_peer_id(PeerChannel(12)): _channel(12, True)}
+        await restarted.on_update(created)
+        other = UpdateChannel(channel_id=14)
+        other._entities = {get_peer_id(PeerChannel(14)): _channel(14, False)}
+        await restarted.on_update(other)
+        assert sorted(restarted.chats) == [5, 12]
+        rows = await OwnedChatIndex(client, store, database).ensure()
+        assert sorted(rows) == [5, 12]
+    finally:
+        await database.close()
+
+
+def test_owned_chat_index():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            asyncio.run(_run_owned_chat_index())
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    test_profile_scheduler()
+    test_owned_chat_index()
+    print("Profile scheduler tests passed!")
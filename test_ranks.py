@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test script for ranks/warns storage and batched user lookups
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from telethon.tl.types import User
+
+
+async def _run_rank_cache():
+    from database import SessionDatabase
+    from modules.vars import RankWarnCache
+
+    database = await SessionDatabase("test", "selfbot_test.db").connect()
+    try:
+        records = RankWarnCache(database)
+        assert await records.get_rank(-100, 1) is None
+        await records.set_rank(-100, 1, "admin")
+        await records.set_rank(-100, 1, "owner")
+        await records.set_rank(-100, 2, "member")
+        await records.set_rank(-200, 1, "guest")
+        assert await records.get_rank(-100, 1) == "owner"
+        assert await records.list_ranks(-100) == [(1, "owner"), (2, "member")]
+
+        assert await records.add_warn(-100, 1) == 1
+        assert await records.add_warn(-100, 1, 2) == 3
+        await records.reset_warns(-100, 1)
+        assert await records.get_warns(-100, 1) == 0
+
+        # a fresh cache reads what was written
+        fresh = RankWarnCache(database)
+        assert await fresh.get_rank(-200, 1) == "guest"
+        assert await fresh.get_warns(-100, 2) == 0
+    finally:
+        await database.close()
+
+
+def test_rank_warn_cache():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            asyncio.run(_run_rank_cache())
+        finally:
+            os.chdir(cwd)
+
+
+class FakeClient:
+    def __init__(self, known):
+        self.known = known
+        self.requests = []
+
+    async def get_input_entity(self, user_id):
+        if user_id not in self.known:
+            raise ValueError(user_id)
+        return SimpleNamespace(user_id=user_id)
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        return [User(id=peer.user_id, username=f"u{peer.user_id}") for peer in request.id]
+
+
+def test_resolve_users_batches():
+    from utils import resolve_users
+
+    client = FakeClient(known=set(range(1, 451)))
+    users = asyncio.run(resolve_users(client, list(range(1, 452)) + [1]))
+    # 450 known users in chunks of 200, the unknown one is skipped
+    assert len(client.requests) == 3
+    assert len(users) == 450 and users[7].username == "u7"
+
+
+if __name__ == "__main__":
+    test_rank_warn_cache()
+    test_resolve_users_batches()
+    print("Rank tests passed!")
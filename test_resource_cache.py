@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for the cached JSON resource loader
+"""
+import json
+import os
+import sys
+import tempfile
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from utils import JsonResourceCache, _message_table, get_message
+
+
+def test_resource_cache_reloads_on_mtime_change():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'msg.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"fa": {"hello": "سلام"}}, f)
+
+        cache = JsonResourceCache(check_interval=0)
+        first = cache.get(path)
+        assert first["fa"]["hello"] == "سلام"
+        # unchanged file is served from memory
+        assert cache.get(path) is first
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"fa": {"hello": "درود"}}, f)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        second = cache.get(path)
+        assert second is not first
+        assert second["fa"]["hello"] == "درود"
+
+
+def test_resource_cache_keeps_last_good_copy():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cmd.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"en": {}}, f)
+
+        cache = JsonResourceCache(check_interval=0)
+        good = cache.get(path)
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"en": ')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        assert cache.get(path) is good
+        assert cache.get(os.path.join(tmp, 'missing.json')) is None
+
+
+def test_get_message_reads_sections():
+    # keys inside msg.json's sections are found like top-level ones
+    assert get_message("spam_released", "en") == "✅ You are unmuted!"
+    # placeholders without a value stay as they are instead of raising
+    assert "{count}" in get_message("spam_warning", "en", time=10)
+    assert get_message("no_such_message", "en") == "no_such_message"
+    # the flattened table is built once per loaded copy of msg.json
+    assert _message_table("en") is _message_table("en")
+
+
+if __name__ == "__main__":
+    test_resource_cache_reloads_on_mtime_change()
+    test_resource_cache_keeps_last_good_copy()
+    test_get_message_reads_sections()
+    print("Resource cache tests passed!")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script for the command router
+"""
+import json
+import os
+import sys
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from router import CommandRouter
+
+CMD_JSON = os.path.join(os.path.dirname(__file__), 'main', 'modules', 'cmd.json')
+
+
+def load_commands():
+    with open(CMD_JSON, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_router_matches_commands():
+    router = CommandRouter(load_commands())
+
+    result = router.match("/اسم روشن", "fa")
+    assert result is not None
+    assert result.key == "name_toggle"
+    assert result.match.group(1) == "روشن"
+
+    result = router.match("!name new Ali", "en")
+    assert result.key == "add_name"
+    assert result.match.group(1) == "Ali"
+
+    result = router.match("  /DELETE 25 ", "en")
+    assert result.key == "delete_messages"
+    assert result.match.group(1) == "25"
+
+    assert router.match("/tagall", "en").key == "tag_all"
+    assert router.match("check", "en").key == "check"
+
+
+def test_router_rejects_plain_text():
+    router = CommandRouter(load_commands())
+    assert router.match("hello there", "fa") is None
+    assert router.match("/unknown command", "fa") is None
+    assert router.match("/tagall now", "en") is None
+    assert router.match("", "fa") is None
+
+
+def test_router_buckets_only_terminated_words():
+    commands = {"en": {"s": {
+        "tag_all": "^[/!]tag\\s*all$",
+        "name_toggle": "^[/!]name\\s+(on|off)$",
+        "stats": "^[/!]stats$",
+    }}}
+    router = CommandRouter(commands)
+    # \s* may match nothing, so "tag" isn't a word of its own there
+    assert router.match("/tagall", "en").key == "tag_all"
+    assert router.match("/tag all", "en").key == "tag_all"
+    assert router.match("/name on", "en").key == "name_toggle"
+    assert router.match("/stats", "en").key == "stats"
+
+
+def test_router_agrees_with_linear_scan():
+    import re
+
+    commands = load_commands()
+    router = CommandRouter(commands)
+    samples = [
+        "/اسم ها", "/اسم جدید سلام", "/حذف اسم سلام", "/پاکسازی اسم ها",
+        "/names", "/name on", "/delete name x", "/delete profile 3",
+        "/my id", "/stats", "/lang en", "/welcome off", "/setwelcome hi",
+        "/backup user", "!panel", "random text", "/delete", "check it",
+    ]
+    for lang in ("fa", "en"):
+        for text in samples:
+            expected = None
+            for section in commands[lang].values():
+                for key, pattern in section.items():
+                    if re.match(pattern, text.strip(), re.IGNORECASE):
+                        expected = key
+                        break
+                if expected:
+                    break
+            result = router.match(text, lang)
+            assert (result.key if result else None) == expected, (lang, text)
+
+
+if __name__ == "__main__":
+    test_router_matches_commands()
+    test_router_rejects_plain_text()
+    test_router_buckets_only_terminated_words()
+    test_router_agrees_with_linear_scan()
+    print("Router tests passed!")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Test script for the RPC scheduler
+"""
+import asyncio
+import os
+import sys
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.channels import GetParticipantsRequest
+from telethon.tl.functions.messages import SendMessageRequest
+from telethon.tl.functions.updates import GetStateRequest
+from telethon.tl.types import ChannelParticipantsRecent, InputChannel, InputPeerChannel, InputPeerUser
+
+from metrics import Metrics
+from rpc import BACKGROUND, HIGH, RpcScheduler, TokenBucket, install_rpc_scheduler, priority, rpc_priority
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeClient:
+    def __init__(self, floods=0):
+        self.handlers = []
+        self.calls = []
+        self.floods = floods
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append((event, callback))
+
+    def remove_event_handler(self, callback, event=None):
+        self.handlers = [(e, cb) for e, cb in self.handlers if cb is not callback]
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        self.calls.append((request, flood_sleep_threshold, rpc_priority.get()))
+        if self.floods:
+            self.floods -= 1
+            error = FloodWaitError(request=None, capture=0)
+            error.seconds = 0
+            raise error
+        return "ok"
+
+
+def send(peer):
+    return SendMessageRequest(peer=peer, message="hi")
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=2, clock=clock)
+    assert bucket.delay() == 0
+    bucket.take()
+    bucket.take()
+    assert bucket.delay() == 0.5
+    clock.now = 0.5
+    assert bucket.delay() == 0
+    bucket.block(10)
+    assert bucket.delay() == 10
+    print("✅ token bucket")
+
+
+def test_buckets_for():
+    scheduler = RpcScheduler()
+    kind, buckets = scheduler.buckets_for(send(InputPeerChannel(5, 1)))
+    assert kind == "SendMessageRequest"
+    assert len(buckets) == 2
+    # same chat shares the chat bucket, another chat doesn't
+    assert scheduler.buckets_for(send(InputPeerChannel(5, 1)))[1][1] is buckets[1]
+    assert scheduler.buckets_for(send(InputPeerUser(7, 1)))[1][1] is not buckets[1]
+    kind, buckets = scheduler.buckets_for([send(InputPeerUser(7, 1))])
+    assert kind == "batch" and len(buckets) == 1
+    # types without limits of their own get separate default-sized buckets,
+    # so a flood wait on one doesn't block the others
+    state = scheduler.buckets_for(GetStateRequest())[1][0]
+    participants = scheduler.buckets_for(GetParticipantsRequest(InputChannel(5, 1), ChannelParticipantsRecent(), 0, 200, 0))[1][0]
+    assert state is not participants
+    assert (participants.rate, participants.burst) == scheduler.limits["default"]
+    participants.block(30)
+    assert state.delay() == 0
+    print("✅ per-type and per-chat buckets")
+
+
+def test_chat_budget_paces_requests():
+    async def run():
+        scheduler = RpcScheduler(chat_limit=(20.0, 1))
+        client = FakeClient()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(3):
+            await scheduler.call(client._call, None, send(InputPeerUser(7, 1)))
+        return loop.time() - start, client.calls
+
+    elapsed, calls = asyncio.run(run())
+    assert len(calls) == 3
+    # burst of 1, then 20 per second
+    assert elapsed >= 0.09
+    # Telethon never sleeps on flood waits itself
+    assert all(threshold == 0 for _, threshold, _ in calls)
+    print("✅ chat budget paces requests")
+
+
+def test_priority_lanes():
+    async def run():
+        scheduler = RpcScheduler(limits={"SendMessageRequest": (20.0, 1)}, chat_limit=(100.0, 100))
+        client = FakeClient()
+        order = []
+
+        async def request(name, level):
+            with priority(level):
+                await scheduler.call(client._call, None, send(InputPeerUser(7, 1)))
+            order.append(name)
+
+        # uses up the single token so the next two have to wait
+        await request("first", HIGH)
+        background = asyncio.create_task(request("background", BACKGROUND))
+        await asyncio.sleep(0)
+        await request("owner", HIGH)
+        await background
+        return order
+
+    assert asyncio.run(run()) == ["first", "owner", "background"]
+    print("✅ owner requests go ahead of background ones")
+
+
+def test_lanes_are_per_bucket():
+    async def run():
+        scheduler = RpcScheduler()
+        client = FakeClient()
+        order = []
+
+        async def request(name, level, req):
+            with priority(level):
+                await scheduler.call(client._call, None, req)
+            order.append(name)
+
+        # an owner message sitting out a flood wait on SendMessageRequest
+        scheduler._bucket("SendMessageRequest").block(0.3)
+        owner = asyncio.create_task(request("owner", HIGH, send(InputPeerUser(7, 1))))
+        await asyncio.sleep(0)
+        # doesn't hold up requests of other types
+        await asyncio.wait_for(request("background", BACKGROUND, GetStateRequest()), 0.2)
+        await owner
+        return order
+
+    assert asyncio.run(run()) == ["background", "owner"]
+    print("✅ lanes only order requests sharing a bucket")
+
+
+def test_flood_wait_retry():
+    async def run():
+        metrics = Metrics("alice")
+        scheduler = RpcScheduler(metrics=metrics)
+        client = FakeClient(floods=2)
+        result = await scheduler.call(client._call, None, send(InputPeerUser(7, 1)))
+        return result, client.calls, metrics
+
+    result, calls, metrics = asyncio.run(run())
+    assert result == "ok"
+    assert len(calls) == 3
+    assert metrics.counter("rpc_flood_waits", request="SendMessageRequest") == 2
+    assert metrics.histogram("rpc_wait_seconds", request="SendMessageRequest", lane="normal").count == 3
+    print("✅ flood waits are slept through and retried")
+
+
+def test_install():
+    async def run():
+        client = FakeClient()
+        scheduler = install_rpc_scheduler(client, owner_id=42, metrics=Metrics("alice"))
+        assert install_rpc_scheduler(client) is scheduler
+
+        seen = []
+
+        async def handler(event):
+            seen.append(rpc_priority.get())
+            await client._call(None, send(InputPeerUser(7, 1)))
+
+        client.add_event_handler(handler)
+        wrapper = client.handlers[0][1]
+        await wrapper(type("Event", (), {"out": False, "sender_id": 42})())
+        await wrapper(type("Event", (), {"out": False, "sender_id": 5})())
+        client.remove_event_handler(handler)
+        return seen, client
+
+    seen, client = asyncio.run(run())
+    assert seen == [HIGH, 1]
+    assert [level for _, _, level in client.calls] == [HIGH, 1]
+    assert client.handlers == []
+    print("✅ owner handlers run in the high lane")
+
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_buckets_for()
+    test_chat_budget_paces_requests()
+    test_priority_lanes()
+    test_lanes_are_per_bucket()
+    test_flood_wait_retry()
+    test_install()
+    print("🎉 All RPC scheduler tests passed!")
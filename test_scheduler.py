@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test script for the host scheduler (SQLite job store, timer wheel)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+import scheduler as scheduler_module
+from pytz import utc
+from scheduler import HostScheduler, TimerWheel
+
+
+def test_timer_wheel():
+    async def run():
+        wheel = TimerWheel(resolution=1.0, slots=4)
+        fired = []
+
+        async def later(name):
+            fired.append(name)
+
+        wheel.call_later(1, fired.append, "a")
+        wheel.call_later(2.5, later, "b")
+        # longer than a turn of the wheel
+        wheel.call_later(9, fired.append, "c")
+        cancelled = wheel.call_later(2, fired.append, "x")
+        cancelled.cancel()
+        for _ in range(3):
+            wheel.advance()
+        await asyncio.sleep(0)
+        assert fired == ["a", "b"]
+        for _ in range(5):
+            wheel.advance()
+        assert fired == ["a", "b"]
+        wheel.advance()
+        assert fired == ["a", "b", "c"]
+        assert len(wheel) == 0
+        await wheel.close()
+
+    asyncio.run(run())
+    print("✅ timer wheel fires, wraps and cancels timers")
+
+
+def test_timer_wheel_task():
+    async def run():
+        wheel = TimerWheel(resolution=0.02)
+        done = asyncio.Event()
+        wheel.call_later(0.05, done.set)
+        wheel.start()
+        await asyncio.wait_for(done.wait(), 1)
+        await wheel.close()
+
+    asyncio.run(run())
+    print("✅ timer wheel runs on its own task")
+
+
+def test_jobs_survive_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scheduler.db")
+        later = datetime.now(utc) + timedelta(hours=1)
+
+        async def first_run():
+            scheduler = HostScheduler(path, jitter=5).start()
+            scheduler.add_session_job("alice", "cleanup", "interval", minutes=30)
+            scheduler.add_session_job("alice", "delete", "date", args=(10, 20), job_id="alice:delete:20", run_date=later)
+            scheduler.add_session_job("bob", "cleanup", "interval", jitter=0, minutes=30)
+            # the same id replaces the job
+            scheduler.add_session_job("bob", "cleanup", "interval", jitter=0, minutes=45)
+            await scheduler.close()
+
+        async def second_run():
+            scheduler = HostScheduler(path).start()
+            jobs = {job.id: job for job in scheduler.get_jobs()}
+            alice = {job.id for job in scheduler.get_jobs("alice")}
+            await scheduler.close()
+            return jobs, alice
+
+        asyncio.run(first_run())
+        jobs, alice = asyncio.run(second_run())
+        assert set(jobs) == {"alice:cleanup", "alice:delete:20", "bob:cleanup"}
+        assert alice == {"alice:cleanup", "alice:delete:20"}
+        assert jobs["alice:cleanup"].trigger.jitter == 5
+        assert jobs["bob:cleanup"].trigger.interval == timedelta(minutes=45)
+        assert jobs["alice:delete:20"].args == ("alice", "delete", 10, 20)
+        assert jobs["alice:delete:20"].next_run_time == later
+    print("✅ stored jobs are resumed after a restart")
+
+
+def test_session_jobs_run_after_resume():
+    async def run():
+        scheduler = scheduler_module._scheduler = HostScheduler()
+        calls = []
+
+        async def delete(chat_id, message_id):
+            calls.append((chat_id, message_id))
+
+        scheduler.handle("alice", "delete", delete)
+        scheduler.add_session_job("alice", "delete", "date", args=(1, 2), run_date=datetime.now(utc))
+        # paused until the sessions are up
+        await asyncio.sleep(0.05)
+        assert calls == []
+        scheduler.resume()
+        for _ in range(50):
+            if calls:
+                break
+            await asyncio.sleep(0.01)
+        scheduler.forget("alice")
+        assert scheduler.handler("alice", "delete") is None
+        await scheduler_module.close_scheduler()
+        return calls
+
+    assert asyncio.run(run()) == [(1, 2)]
+    print("✅ session jobs reach the session's handler")
+
+
+def test_store_per_process():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler = scheduler_module.get_scheduler(directory=tmp)
+            path = scheduler.path
+            await scheduler_module.close_scheduler()
+            sharded = scheduler_module.get_scheduler(shard=2)
+            await scheduler_module.close_scheduler()
+            return tmp, path, sharded.path
+
+    tmp, path, sharded = asyncio.run(run())
+    # a Self.py process keeps its jobs in its session directory
+    assert os.path.dirname(path) == tmp
+    assert sharded.endswith("_2.db") and os.path.dirname(sharded) != tmp
+    print("✅ every process gets its own job store")
+
+
+if __name__ == "__main__":
+    test_timer_wheel()
+    test_timer_wheel_task()
+    test_jobs_survive_restart()
+    test_session_jobs_run_after_resume()
+    test_store_per_process()
+    print("🎉 All scheduler tests passed!")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test script for the write-behind settings store
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+
+async def _run_settings_store():
+    import ormax_models
+    from database import SessionDatabase
+    from settings_store import SettingsStore
+
+    database = await SessionDatabase("test", "selfbot_test.db").connect()
+    try:
+        store = SettingsStore("test", flush_delay=0.05, database=database)
+        settings = await store.load()
+        assert settings["lang"] == "fa"
+        assert settings["profile_settings"]["names"] == []
+
+        # a burst of changes becomes one write of the changed columns
+        store.set("welcome_text", "hi")
+        store.set("welcome_text", "hello")
+        settings["clock_fonts"] = [2, 3]
+        store.update()
+        assert store._dirty == {"welcome_text", "clock_fonts"}
+        await asyncio.sleep(0.2)
+        assert not store._dirty
+
+        reloaded = await ormax_models.load_settings(database)
+        assert reloaded["welcome_text"] == "hello"
+        assert reloaded["clock_fonts"] == [2, 3]
+        assert reloaded["lang"] == "fa"
+
+        # keys without a column are stored in chat_settings rows
+        settings["profile_settings"]["names"].append("Ali")
+        store.mark_dirty("profile_settings")
+        store.set_chat("reaction_enabled", -1001234567890, True)
+        store.set_chat("reaction_enabled", 42, True)
+        await store.flush()
+        assert await ormax_models.get_chat_setting("reaction_enabled", -1001234567890, database=database) is True
+        assert await ormax_models.get_chat_setting("reaction_enabled", 7, database=database) is None
+
+        settings["reaction_enabled"].pop(42)
+        store.mark_dirty("reaction_enabled")
+
+        # pending changes are written on close
+        store.set("lang", "en")
+        await store.close()
+        reloaded = await ormax_models.load_settings(database)
+        assert reloaded["lang"] == "en"
+
+        fresh = SettingsStore("test", database=database)
+        settings = await fresh.load()
+        assert settings["profile_settings"]["names"] == ["Ali"]
+        assert settings["reaction_enabled"] == {-1001234567890: True}
+        assert fresh.get_chat("reaction_enabled", -1001234567890) is True
+    finally:
+        await database.close()
+
+
+def test_settings_store():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            asyncio.run(_run_settings_store())
+        finally:
+            os.chdir(cwd)
+
+
+async def _run_get_settings_store():
+    import database as database_module
+    from settings_store import close_settings_stores, get_settings_store
+
+    default_db_path = database_module.default_db_path
+    database_module.default_db_path = lambda session_name: os.path.abspath(f"selfbot_{session_name}.db")
+    try:
+        store = await get_settings_store("fresh")
+        # bound to the session's own database, opened on demand
+        assert store.database is database_module.get_session_db("fresh")
+        assert store.database.path == os.path.abspath("selfbot_fresh.db")
+        assert await get_settings_store("fresh") is store
+    finally:
+        database_module.default_db_path = default_db_path
+        await close_settings_stores()
+        await database_module.close_databases()
+
+
+def test_get_settings_store_opens_session_db():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            asyncio.run(_run_get_settings_store())
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    test_settings_store()
+    test_get_settings_store_opens_session_db()
+    print("Settings store tests passed!")
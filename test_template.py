@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test script for the compiled message template engine
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from template import HEARTS, compile_template, current_time, render_template
+
+
+def test_compile_template():
+    assert compile_template("hello world") is None
+    assert compile_template("") is None
+
+    template = compile_template("STRDAY and DAY, ID: ID")
+    assert template.names == {"STRDAY", "DAY", "ID"}
+    # tokens are only matched on letter boundaries
+    assert compile_template("TODAY is an IDEA") is None
+    assert compile_template("RANDNUM1-10").parts == [("RANDNUM", (1, 10))]
+    # compiled once per text
+    assert compile_template("TIME now") is compile_template("TIME now")
+
+
+async def _render():
+    calls = []
+
+    async def get_sender():
+        calls.append(1)
+        return SimpleNamespace(id=42, username=None, first_name="Ali")
+
+    async def rank():
+        return "admin"
+
+    # no sender fetch when no sender variable is present
+    text = await render_template(compile_template("YEAR-MONTH"), timezone="UTC", get_sender=get_sender)
+    now = current_time("UTC")
+    assert text == f"{now.year}-{now.month:02d}"
+    assert calls == []
+
+    text = await render_template(
+        compile_template("NAME (ID, USERNAME) is RANK with WARNS"),
+        timezone="UTC",
+        get_sender=get_sender,
+        resolvers={"RANK": rank},
+    )
+    assert text == "Ali (42, None) is admin with WARNS"
+    assert calls == [1]
+
+    text = await render_template(compile_template("HEART RANDNUM5-5"), timezone="UTC")
+    heart, number = text.split(" ")
+    assert heart in HEARTS and number == "5"
+
+
+def test_render_template():
+    asyncio.run(_render())
+
+
+if __name__ == "__main__":
+    test_compile_template()
+    test_render_template()
+    print("Template tests passed!")
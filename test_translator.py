@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test script for the translation service (offline, with the stub backend)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+# Add the main directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'main'))
+
+from translator import StubBackend, TranslationService
+
+
+class SlowBackend(StubBackend):
+    """Blocks like an HTTP call and records the thread it runs in"""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def translate(self, text, target):
+        self.threads.add(threading.get_ident())
+        threading.Event().wait(0.05)
+        return super().translate(text, target)
+
+
+class FailingBackend(StubBackend):
+    def translate(self, text, target):
+        raise RuntimeError("offline")
+
+
+def test_cache_and_coalescing():
+    async def run():
+        backend = StubBackend()
+        service = TranslationService(backend)
+        results = await asyncio.gather(*(service.translate("hello", "fa") for _ in range(5)))
+        again = await service.translate("hello", "fa")
+        other = await service.translate("hello", "en")
+        await service.close()
+        return backend, results, again, other
+
+    backend, results, again, other = asyncio.run(run())
+    assert results == ["[fa] hello"] * 5
+    assert again == "[fa] hello"
+    assert other == "[en] hello"
+    assert backend.calls == [("hello", "fa"), ("hello", "en")]
+    print("✅ identical requests share one call and are cached")
+
+
+def test_batching():
+    async def run():
+        backend = StubBackend()
+        service = TranslationService(backend)
+        results = await service.translate_many(["one", "two", "three"], "fa")
+        long_text = await service.translate("line 1\nline 2", "fa")
+        await service.close()
+        return backend, results, long_text
+
+    backend, results, long_text = asyncio.run(run())
+    assert results == ["[fa] one", "[fa] two", "[fa] three"]
+    assert long_text == "[fa] line 1\n[fa] line 2"
+    # one call for the three short texts, one for the multi-line text
+    assert backend.calls == [("one\ntwo\nthree", "fa"), ("line 1\nline 2", "fa")]
+    print("✅ short texts are batched into one call")
+
+
+def test_runs_off_the_loop():
+    async def run():
+        backend = SlowBackend()
+        service = TranslationService(backend)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await service.translate("hello", "fa")
+        task.cancel()
+        await service.close()
+        return backend, ticks
+
+    backend, ticks = asyncio.run(run())
+    assert threading.get_ident() not in backend.threads
+    # the loop kept running while the backend blocked
+    assert ticks >= 3
+    print("✅ backend calls don't block the loop")
+
+
+def test_errors_are_not_cached():
+    async def run():
+        service = TranslationService(FailingBackend())
+        try:
+            await service.translate("hello", "fa")
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("error was swallowed")
+        service.backend = StubBackend()
+        result = await service.translate("hello", "fa")
+        await service.close()
+        return result
+
+    assert asyncio.run(run()) == "[fa] hello"
+    print("✅ failed translations are retried")
+
+
+def test_disk_cache():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "translations.json")
+
+        async def run(backend):
+            service = TranslationService(backend, cache_path=path)
+            result = await service.translate("سلام", "en")
+            await service.close()
+            return result
+
+        first = StubBackend()
+        assert asyncio.run(run(first)) == "[en] سلام"
+        second = StubBackend()
+        assert asyncio.run(run(second)) == "[en] سلام"
+        assert len(first.calls) == 1
+        assert second.calls == []
+    print("✅ cache is saved and loaded")
+
+
+if __name__ == "__main__":
+    test_cache_and_coalescing()
+    test_batching()
+    test_runs_off_the_loop()
+    test_errors_are_not_cached()
+    test_disk_cache()
+    print("🎉 All translation tests passed!")